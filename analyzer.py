@@ -0,0 +1,174 @@
+'''
+Project Blackbox - Program Analyzer
+
+Inspects a program before it runs. Starting at address 0 it follows every path the program can take to build
+its control flow graph (CFG): each instruction continues to the next register, BRANCH (040) jumps, BRANCHNEG
+(041) and BRANCHZERO (042) do either, and HALT (043), invalid instructions and invalid addresses stop it.
+From the graph the analyzer finds:
+
+- Errors: invalid instructions and addresses that can be reached, paths that run past the last register without
+  halting, and programs that can never stop (no HALT or instruction that can fail can be reached from address 0).
+- Warnings: loops that can never be left once entered, words that are neither executed nor used as data, and
+  programs that write over their own instructions (the analysis can't be trusted for those, so their errors are
+  reported as warnings).
+- Which registers hold code, which hold data, and which data registers are never written (constants).
+
+optimize turns on the peephole stage of the block compiler (see block_compiler.py): constants are folded into
+the compiled blocks and a LOAD of the register that was just stored is skipped.
+
+Usage:
+
+analysis = analyze(sim.registers.words, len(sim.registers))
+if analysis.errors: ...
+optimize(sim, analysis)
+
+python -m simulator check program.txt
+python -m simulator run --check --optimize program.txt
+'''
+
+from simulator import MEMORY_SIZE, INSTRUCTION_NAMES, address_digits, format_word
+
+BRANCH_CODES = (40, 41, 42)
+ADDRESS_CODES = (10, 11, 20, 21, 30, 31, 32, 33, 40, 41, 42) #Instructions whose address must be a valid register
+WRITING_CODES = (10, 21) #READ and STORE write into the register of their address
+#Instructions that can stop the program: a READ can get an invalid word, arithmetic can overflow or divide by zero.
+STOPPING_CODES = (10, 30, 31, 32, 33, 43)
+
+'''Program Analysis Class'''
+class ProgramAnalysis:
+    '''Results of analyze.'''
+    def __init__(self):
+        self.successors = {} #Reachable address -> addresses that can be executed after it
+        self.blocks = [] #(first address, last address) of every basic block, in address order
+        self.code = set() #Addresses that can be executed
+        self.data = set() #Addresses used by the instructions that can be executed
+        self.written = set() #Addresses a reachable READ or STORE writes into
+        self.constants = set() #Data addresses that are never written
+        self.unused = [] #Addresses holding a word that is never executed nor used as data
+        self.endless_loops = [] #Addresses where the program enters a part of the code it can never leave
+        self.self_modifying = False #True if the program writes over its own instructions
+        self.errors = [] #Problems that stop the program, it shouldn't be run
+        self.warnings = [] #Problems that don't stop the program
+
+    def to_dict(self):
+        '''Returns the analysis as a dictionary that can be written as JSON.'''
+        return {
+            "errors": self.errors,
+            "warnings": self.warnings,
+            "blocks": self.blocks,
+            "code": sorted(self.code),
+            "data": sorted(self.data),
+            "constants": sorted(self.constants),
+            "unused": self.unused,
+            "endless_loops": self.endless_loops,
+            "self_modifying": self.self_modifying,
+        }
+
+def analyze(words, memory_size=MEMORY_SIZE):
+    '''Builds the control flow graph of the program in words (registers from address 0, the rest are empty).'''
+    analysis = ProgramAnalysis()
+    last_register = memory_size - 1
+    address_base = 10 ** address_digits(memory_size)
+    word_digits = address_digits(memory_size) + 3
+    problems = set() #(address, message) found while following the paths
+    stopping = set() #Reachable addresses where the program can stop
+
+    def word_at(addr):
+        return words[addr] if addr < len(words) else 0
+
+    #Follows every path from address 0.
+    pending = [0]
+    while pending:
+        addr = pending.pop()
+        if addr in analysis.successors:
+            continue
+        if addr > last_register or (addr == last_register and word_at(addr) == 0):
+            analysis.successors[addr] = ()
+            stopping.add(addr)
+            problems.add((min(addr, last_register), "The program can run past the last register without halting."))
+            continue
+        word = word_at(addr)
+        code, operand = abs(word) // address_base, abs(word) % address_base
+        if code not in INSTRUCTION_NAMES:
+            successors = ()
+            stopping.add(addr)
+            problems.add((addr, f"Instruction '{format_word(word, word_digits)}' is invalid."))
+        elif code in ADDRESS_CODES and operand > last_register:
+            successors = ()
+            stopping.add(addr)
+            problems.add((addr, f"{INSTRUCTION_NAMES[code]} uses address {operand}, the register address must be between 0 and {last_register}."))
+        else:
+            if code in STOPPING_CODES:
+                stopping.add(addr)
+            if code == 43:
+                successors = ()
+            elif code == 40:
+                successors = (operand,)
+            elif code in BRANCH_CODES:
+                successors = (addr + 1, operand)
+            else:
+                successors = (addr + 1,)
+            if code in ADDRESS_CODES and code not in BRANCH_CODES:
+                analysis.data.add(operand)
+                if code in WRITING_CODES:
+                    analysis.written.add(operand)
+        analysis.successors[addr] = successors
+        analysis.code.add(addr)
+        pending.extend(successors)
+    analysis.self_modifying = bool(analysis.written & analysis.code)
+    analysis.constants = analysis.data - analysis.written
+
+    #Basic blocks start at address 0, at branch targets and after branches.
+    leaders = {0}
+    for addr, successors in analysis.successors.items():
+        if len(successors) != 1 or successors[0] != addr + 1:
+            leaders.update(successors)
+    for start in sorted(leaders & analysis.code):
+        end = start
+        while analysis.successors.get(end) == (end + 1,) and end + 1 not in leaders:
+            end += 1
+        analysis.blocks.append((start, end))
+
+    #Addresses that can reach a stopping address, working backwards through the graph.
+    predecessors = {}
+    for addr, successors in analysis.successors.items():
+        for successor in successors:
+            predecessors.setdefault(successor, []).append(addr)
+    can_stop = set()
+    pending = list(stopping)
+    while pending:
+        addr = pending.pop()
+        if addr in can_stop:
+            continue
+        can_stop.add(addr)
+        pending.extend(predecessors.get(addr, ()))
+    if 0 not in can_stop:
+        problems.add((0, "The program can never halt, every path ends in a loop without a HALT."))
+    else: #Parts of the program that can't be left once they are entered, reported by the addresses they are entered from
+        trapped = analysis.code - can_stop
+        analysis.endless_loops = sorted(addr for addr in trapped if any(predecessor not in trapped for predecessor in predecessors.get(addr, ())))
+        for addr in analysis.endless_loops:
+            analysis.warnings.append(f"Warning(address {addr:03d}): Once the program gets here it loops forever without halting.")
+
+    #Words that are never executed nor used as data are probably a mistake.
+    used = words.used() if hasattr(words, "used") else [addr for addr, word in enumerate(words) if word != 0]
+    analysis.unused = [addr for addr in used if addr not in analysis.code and addr not in analysis.data]
+    for addr in analysis.unused:
+        analysis.warnings.append(f"Warning(address {addr:03d}): {format_word(word_at(addr), word_digits)} is never executed or used as data.")
+
+    if analysis.self_modifying: #The instructions may change before they run, so nothing is certain
+        for addr in sorted(analysis.written & analysis.code):
+            analysis.warnings.append(f"Warning(address {addr:03d}): The program writes over its own instruction here, the analysis may be incomplete.")
+        analysis.warnings += [f"Warning(address {addr:03d}): {message}" for addr, message in sorted(problems)]
+    else:
+        analysis.errors += [f"Error(address {addr:03d}): {message}" for addr, message in sorted(problems)]
+    return analysis
+
+def optimize(sim, analysis=None):
+    '''Turns on fast mode with the peephole stage, the analysis of the loaded program is made if it isn't given.'''
+    if analysis is None:
+        analysis = analyze(sim.registers.words, len(sim.registers))
+    sim.compile_blocks = True
+    #A program that writes over its instructions may write the registers the analysis found constant.
+    sim.constants = None if analysis.self_modifying else frozenset(analysis.constants)
+    return analysis
@@ -0,0 +1,92 @@
+'''
+Project Blackbox - Async Engine
+
+Runs a Simulator inside an asyncio event loop, so a single process can serve many programs at once without
+threads. The program is executed in slices of slice_size instructions (Simulator.execute with max_steps) and
+the engine yields to the event loop after every slice, so a long program never blocks the other sessions.
+
+READ (010) and WRITE (011) go through channels: READ takes the next word from the inputs queue and waits for
+one when it's empty, WRITE puts the integer word in the outputs queue. A session waiting for input is just a
+suspended coroutine, it doesn't hold a thread or run any code until a word arrives. When the program stops
+(halt, error or a limit), None is put in the outputs queue so readers know no more words will come. Putting
+None in the inputs queue stops a run waiting for input with the "input" halt reason, run can resume it later.
+
+The limits of the simulator (max_instructions, max_time, detect_loops) apply the same way as in a headless
+run, and the time spent waiting for input doesn't count towards max_time.
+
+Usage:
+
+engine = AsyncEngine(Simulator(max_instructions=1000000))
+engine.sim.load_source(program_text)
+task = asyncio.create_task(engine.run())
+await engine.inputs.put("+000005")
+word = await engine.outputs.get()
+result = await task
+'''
+
+import asyncio
+from simulator import Simulator, RunResult, STEP_LIMIT, INPUT_NEEDED
+
+DEFAULT_SLICE_SIZE = 1000 #Instructions executed between yields to the event loop
+
+'''Async Engine Class'''
+class AsyncEngine:
+    '''Executes a simulator from an asyncio event loop with queues for READ and WRITE.'''
+    def __init__(self, sim=None, slice_size=DEFAULT_SLICE_SIZE, output_size=0):
+        self.sim = sim if sim is not None else Simulator() #Simulator holding the program
+        self.slice_size = slice_size #Instructions executed before yielding to the event loop
+        self.inputs = asyncio.Queue() #Words used by READ, None stops a run waiting for input
+        #Words written by WRITE and None when the run stops. With an output_size the run waits for readers
+        #after a slice that filled the queue.
+        self.outputs = asyncio.Queue(output_size)
+        self.written = [] #Words written by the current slice, put in the outputs queue after it
+        self.running = False
+
+    def write_output(self, addr, word):
+        '''WRITE callback, the words are put in the outputs queue when the slice ends.'''
+        self.written.append(word)
+
+    async def flush(self):
+        '''Puts the words written by the slice in the outputs queue, waiting for room if it's full.'''
+        written = self.written
+        self.written = []
+        for word in written:
+            await self.outputs.put(word)
+        return written
+
+    async def run(self, max_steps=None):
+        '''Executes the program from the current address until it stops, yielding to the event loop between slices.
+        max_steps limits this call only, like Simulator.run. Returns a RunResult with every word written.'''
+        if self.running:
+            raise RuntimeError("The engine is already running.")
+        self.running = True
+        sim = self.sim
+        sim.read_input = None #Every READ asks execute for its word, which comes from the inputs queue
+        sim.write_output = self.write_output
+        steps = 0
+        outputs = []
+        try:
+            while True:
+                budget = self.slice_size if max_steps is None else min(self.slice_size, max_steps - steps)
+                execution = sim.execute(budget, copy_registers=False) #The registers are copied once, when the run stops
+                try:
+                    next(execution)
+                    while True: #The READ waits for a word without leaving the slice
+                        outputs += await self.flush() #Words written before a READ are delivered before waiting
+                        execution.send(await self.inputs.get())
+                except StopIteration as stop:
+                    result = stop.value
+                finally:
+                    execution.close()
+                steps += result.steps
+                outputs += await self.flush()
+                if result.halt_reason != STEP_LIMIT or (max_steps is not None and steps >= max_steps):
+                    break
+                await asyncio.sleep(0) #Lets the other sessions run
+        finally:
+            self.running = False
+            self.written = []
+        if result.halt_reason != STEP_LIMIT and result.halt_reason != INPUT_NEEDED:
+            await self.outputs.put(None)
+        return RunResult(result.halt_reason, steps, result.accumulator, list(sim.registers.words), result.cur_addr,
+                         result.error_message, outputs)
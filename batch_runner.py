@@ -0,0 +1,305 @@
+'''
+Project Blackbox - Batch Runner
+
+Runs BasicML program files from the command line without opening the GUI. Every file is loaded with the
+same validation and 4 to 6 digit conversion rules as the "Load Instructions" window, executed headless, and
+its result is printed as one JSON line per file.
+
+Usage:
+
+python -m simulator run program1.txt program2.txt ...
+python -m simulator run --jobs 8 --max-steps 100000 --max-time 2 --detect-loops --input +000005 submissions/*.txt
+python -m simulator run --memory-size 100000 generated.txt
+python -m simulator run --check --optimize program.txt
+python -m simulator run --fast-forward program.txt
+python -m simulator run --console --input +000005 program.txt
+python -m simulator run --cache ~/.cache/project-blackbox submissions/*.txt
+python -m simulator check program.txt
+python -m simulator convert program.txt program.bbx
+python -m simulator sweep program.txt input_sets.txt
+python -m simulator serve --port 8765 --jobs 8
+python -m simulator replay session.json
+
+Words given with --input are fed in order to the READ (010) instructions of every program. If a program
+reads more words than were given it stops with the "input" halt reason. The --max-steps, --max-time and
+--detect-loops options guarantee that every program stops, with the "instruction_limit", "time_limit" and
+"loop_detected" halt reasons respectively. --memory-size sets the number of registers, memories with more
+than 1000 registers use longer words (a 4 digit address for up to 10000 registers, and so on). --compile runs
+the programs in fast mode (see block_compiler.py), which gives the same results much faster for long programs.
+--fast-forward skips the iterations of counting and delay loops at once (see loop_accelerator.py), with the
+same results and instruction counts as running them step by step.
+--console adds the text the GUI console would show (see console_sink.py) to the result of each program.
+--check rejects programs the static analysis (see analyzer.py) finds errors in before running them, and
+--optimize runs them in fast mode with the peephole stage. The check command prints the analysis of each file.
+--cache stores the result of every run in a directory (see result_cache.py), a program run again with the same
+inputs and limits is answered from the directory without executing, and its result has "cached": true.
+
+Program images (.bbx, see program_image.py) are memory mapped and copied into the registers without parsing,
+which is much faster when the same programs are run many times. The convert command converts programs between
+the .txt and .bbx formats, the direction is chosen from the extension of the source file.
+
+The sweep command runs a single program once for every line of an input file, each line holding the READ words
+of one run separated by spaces or commas. The runs are executed together by the vector engine (vector_engine.py,
+requires NumPy) and a JSON line is printed per input line.
+
+The replay command runs recordings saved from the GUI (see run_recording.py) with their recorded inputs and
+checks that every program writes the same words and stops the same way, a JSON line is printed per recording.
+
+The serve command starts a local HTTP server that runs programs sent as JSON on a pool of worker processes
+(see execution_server.py).
+'''
+
+import argparse
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from simulator import Simulator, HALTED, MEMORY_SIZE, MAX_MEMORY_SIZE, address_digits
+from profiler import Profiler
+import program_image
+import analyzer
+from console_sink import ConsoleSink
+from result_cache import CachedRun, open_cache, run_key, DEFAULT_DISK_SIZE
+from run_recording import Recording, replay_recording
+
+LOAD_ERROR = "load_error" #Halt reason reported when a file can't be read or fails validation
+
+def load_file(sim, path):
+    '''Loads a .txt or .bbx program file into the simulator, returns (True, []) or (False, errors).'''
+    if path.endswith(program_image.IMAGE_EXTENSION):
+        return program_image.load_image(sim, path)
+    with open(path, "rb") as program_file: #The file is read line by line while the registers are filled
+        return sim.load_source(program_file)
+
+def run_file(path, limits=None, inputs=(), show_registers=False, profile=False, check=False, optimize=False, console=False,
+             cache=None, cache_size=DEFAULT_DISK_SIZE):
+    '''Loads and runs a single program file, returns its result as a dictionary.
+    The limits are passed to Simulator (max_instructions, max_time, detect_loops, memory_size, compile_blocks
+    and fast_forward_loops).
+    check rejects programs with analysis errors, optimize runs them in fast mode with the peephole stage.
+    console adds the console transcript of the run to the result.
+    cache is a directory of stored results (see result_cache.py) holding at most cache_size bytes, a run that was
+    stored before returns the stored result without executing. Profiled runs and console transcripts always execute.'''
+    sim = Simulator(**(limits or {}))
+    try:
+        success, errors = load_file(sim, path)
+    except OSError as error:
+        return {"file": path, "halt_reason": LOAD_ERROR, "error_message": str(error)}
+    if success and (check or optimize):
+        analysis = analyzer.analyze(sim.registers.words, len(sim.registers))
+        if check:
+            errors = analysis.errors
+            success = not errors
+        if success and optimize:
+            analyzer.optimize(sim, analysis)
+    if not success:
+        return {"file": path, "halt_reason": LOAD_ERROR, "error_message": "\n".join(errors), "errors": errors}
+    pending = iter(inputs)
+    sink = None
+    if console:
+        transcript = io.StringIO()
+        sink = ConsoleSink(tee=transcript, word_digits=sim.registers.word_digits)
+    results = open_cache(cache, cache_size) if cache is not None and not (profile or console) else None
+    writes = None
+    if results is not None:
+        key = run_key(sim, inputs)
+        entry = results.get(key)
+        if entry is not None: #Same program, inputs and limits as a stored run
+            result_dict = entry.result().to_dict()
+            if not show_registers:
+                del result_dict["registers"]
+            return {"file": path, **result_dict, "cached": True}
+        writes = [] #The addresses of the words are stored with the result
+
+    def read_input(addr):
+        word = next(pending, None)
+        if sink is not None and word is not None:
+            sink.input_entered(addr, word)
+        return word
+
+    def write_output(addr, word):
+        sim.outputs.append(word) #The words are still collected in the result
+        if writes is not None:
+            writes.append((addr, word))
+        if sink is not None:
+            sink.write_output(addr, word)
+    recording = console or writes is not None
+    profiler = Profiler() if profile else None
+    if profiler is not None:
+        result = profiler.run(sim, read_input=read_input, write_output=write_output if recording else None)
+    else:
+        result = sim.run(read_input=read_input, write_output=write_output if recording else None)
+    if results is not None:
+        results.put(key, CachedRun.from_result(result, writes, sim.last_addr))
+    result_dict = result.to_dict()
+    if console:
+        if result.halt_reason == HALTED:
+            sink.halted()
+        result_dict["console"] = transcript.getvalue()
+    if not show_registers: #The registers make every line very long, so they're only written when asked for
+        del result_dict["registers"]
+    if profiler is not None:
+        result_dict["profile"] = profiler.to_dict()
+    if results is not None:
+        result_dict["cached"] = False
+    return {"file": path, **result_dict}
+
+def run_files(paths, jobs=1, limits=None, inputs=(), show_registers=False, profile=False, check=False, optimize=False, console=False,
+              cache=None, cache_size=DEFAULT_DISK_SIZE):
+    '''Runs every program file and yields the results in the same order as the paths.'''
+    if jobs <= 1 or len(paths) <= 1: #A process pool is slower than running in place for a single worker
+        for path in paths:
+            yield run_file(path, limits, inputs, show_registers, profile, check, optimize, console, cache, cache_size)
+        return
+    chunksize = max(1, len(paths) // (jobs * 4)) #Sends files in chunks so small programs don't pay for a round trip each
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(run_file, paths, [limits] * len(paths), [tuple(inputs)] * len(paths),
+                                [show_registers] * len(paths), [profile] * len(paths), [check] * len(paths),
+                                [optimize] * len(paths), [console] * len(paths), [cache] * len(paths),
+                                [cache_size] * len(paths), chunksize=chunksize)
+
+def replay_file(path, compile_blocks=False, fast_forward_loops=False):
+    '''Replays a run recording file, returns the verification as a dictionary.'''
+    try:
+        replay = replay_recording(Recording.load(path), compile_blocks, fast_forward_loops)
+    except (OSError, ValueError) as error:
+        return {"file": path, "verified": False, "mismatches": [], "halt_reason": LOAD_ERROR, "error_message": str(error)}
+    return {"file": path, **replay.to_dict()}
+
+def build_parser():
+    '''Creates the command line argument parser.'''
+    parser = argparse.ArgumentParser(prog="python -m simulator", description="Runs BasicML programs without the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run one or more program files and print a JSON line per file.")
+    run_parser.add_argument("files", nargs="+", help="Program files (.txt or .bbx) to run.")
+    run_parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Number of worker processes (default: number of CPUs).")
+    run_parser.add_argument("--max-steps", type=int, default=None, help="Stop each program after this many instructions.")
+    run_parser.add_argument("--max-time", type=float, default=None, help="Stop each program after running this many seconds.")
+    run_parser.add_argument("--detect-loops", action="store_true", help="Stop programs that repeat a state without reading input.")
+    run_parser.add_argument("--input", action="append", default=[], help="Word fed to READ instructions, can be repeated.")
+    run_parser.add_argument("--registers", action="store_true", help="Include the final registers in the output.")
+    run_parser.add_argument("--console", action="store_true", help="Include the console transcript in the output.")
+    run_parser.add_argument("--profile", action="store_true", help="Include execution counts and timing in the output.")
+    run_parser.add_argument("--memory-size", type=int, default=MEMORY_SIZE, help=f"Number of registers (default: {MEMORY_SIZE}).")
+    run_parser.add_argument("--compile", action="store_true", help="Fast mode, compile the programs into Python basic blocks.")
+    run_parser.add_argument("--fast-forward", action="store_true", help="Skip the iterations of counting loops in closed form.")
+    run_parser.add_argument("--check", action="store_true", help="Reject programs the static analysis finds errors in.")
+    run_parser.add_argument("--optimize", action="store_true", help="Fast mode with the peephole stage (constant folding).")
+    run_parser.add_argument("--cache", metavar="DIRECTORY", default=None, help="Reuse the stored results of identical runs from this directory.")
+    run_parser.add_argument("--cache-size", type=int, default=DEFAULT_DISK_SIZE // (1024 * 1024), help="Megabytes the stored results may take (default: %(default)s).")
+    check_parser = commands.add_parser("check", help="Analyze program files without running them and print a JSON line per file.")
+    check_parser.add_argument("files", nargs="+", help="Program files (.txt or .bbx) to analyze.")
+    check_parser.add_argument("--memory-size", type=int, default=MEMORY_SIZE, help=f"Number of registers (default: {MEMORY_SIZE}).")
+    sweep_parser = commands.add_parser("sweep", help="Run a program once per line of input words using the vector engine (requires NumPy).")
+    sweep_parser.add_argument("program", help="Program file (.txt) to run.")
+    sweep_parser.add_argument("inputs", help="File with the READ words of one run per line, separated by spaces or commas.")
+    sweep_parser.add_argument("--max-steps", type=int, default=None, help="Stop each run after this many instructions.")
+    sweep_parser.add_argument("--registers", action="store_true", help="Include the final registers in the output.")
+    sweep_parser.add_argument("--memory-size", type=int, default=MEMORY_SIZE, help=f"Number of registers (default: {MEMORY_SIZE}).")
+    replay_parser = commands.add_parser("replay", help="Replay run recordings and check that they write the same words.")
+    replay_parser.add_argument("files", nargs="+", help="Run recordings (.json) saved from the GUI.")
+    replay_parser.add_argument("--compile", action="store_true", help="Fast mode, compile the programs into Python basic blocks.")
+    replay_parser.add_argument("--fast-forward", action="store_true", help="Skip the iterations of counting loops in closed form.")
+    serve_parser = commands.add_parser("serve", help="Run programs sent as JSON to a local HTTP server.")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address the server listens on (default: 127.0.0.1).")
+    serve_parser.add_argument("--port", type=int, default=8765, help="Port the server listens on (default: 8765).")
+    serve_parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Number of worker processes (default: number of CPUs).")
+    serve_parser.add_argument("--max-steps", type=int, default=10_000_000, help="Most instructions a run may execute, requests can only lower it (default: 10000000).")
+    serve_parser.add_argument("--max-time", type=float, default=10.0, help="Most seconds a run may take, requests can only lower it (default: 10).")
+    convert_parser = commands.add_parser("convert", help="Convert a program between the .txt and program image (.bbx) formats.")
+    convert_parser.add_argument("source", help="Program file to convert (.txt or .bbx).")
+    convert_parser.add_argument("destination", help="File to write the converted program to.")
+    convert_parser.add_argument("--memory-size", type=int, default=MEMORY_SIZE, help=f"Number of registers the program is written for (default: {MEMORY_SIZE}).")
+    return parser
+
+def convert(source, destination, memory_size=MEMORY_SIZE):
+    '''Converts a .txt program to an image or an image to a .txt program, returns (True, []) or (False, errors).'''
+    try:
+        if source.endswith(program_image.IMAGE_EXTENSION):
+            return program_image.image_to_text(source, destination, address_digits(memory_size) + 3)
+        return program_image.text_to_image(source, destination, memory_size)
+    except OSError as error:
+        return (False, [str(error)])
+
+def check_file(path, memory_size=MEMORY_SIZE):
+    '''Loads a program file and returns its analysis as a dictionary.'''
+    sim = Simulator(memory_size=memory_size)
+    try:
+        success, errors = load_file(sim, path)
+    except OSError as error:
+        success, errors = False, [str(error)]
+    if not success:
+        return {"file": path, "errors": errors, "warnings": []}
+    return {"file": path, **analyzer.analyze(sim.registers.words, len(sim.registers)).to_dict()}
+
+def sweep(program_path, inputs_path, max_steps=None, show_registers=False, memory_size=MEMORY_SIZE):
+    '''Runs the program with every line of input words, returns (True, results) or (False, errors).'''
+    try:
+        from vector_engine import VectorSimulator
+        with open(inputs_path) as inputs_file:
+            input_sets = [line.replace(",", " ").split() for line in inputs_file if line.strip()]
+        engine = VectorSimulator(len(input_sets), memory_size, max_steps)
+        with open(program_path, "rb") as program_file:
+            success, errors = engine.load_source(program_file)
+    except (ImportError, OSError) as error:
+        return (False, [str(error)])
+    if not success:
+        return (False, errors)
+    results = []
+    for words, result in zip(input_sets, engine.run(input_sets)):
+        result_dict = result.to_dict()
+        if not show_registers:
+            del result_dict["registers"]
+        results.append({"inputs": words, **result_dict})
+    return (True, results)
+
+def main(argv=None):
+    '''Entry point of the command line runner, returns 0 if every program halted normally.'''
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        from execution_server import serve
+        return serve(args.host, args.port, args.jobs, args.max_steps, args.max_time)
+    if args.command == "replay":
+        exit_code = 0
+        for path in args.files:
+            result = replay_file(path, args.compile, args.fast_forward)
+            print(json.dumps(result), flush=True)
+            if not result["verified"]:
+                exit_code = 1
+        return exit_code
+    if args.memory_size < 1 or args.memory_size > MAX_MEMORY_SIZE:
+        parser.error(f"--memory-size must be between 1 and {MAX_MEMORY_SIZE}")
+    if args.command == "convert":
+        success, errors = convert(args.source, args.destination, args.memory_size)
+        for error in errors:
+            print(error, file=sys.stderr)
+        return 0 if success else 1
+    if args.command == "check":
+        exit_code = 0
+        for path in args.files:
+            result = check_file(path, args.memory_size)
+            print(json.dumps(result), flush=True)
+            if result["errors"]:
+                exit_code = 1
+        return exit_code
+    if args.command == "sweep":
+        success, results = sweep(args.program, args.inputs, args.max_steps, args.registers, args.memory_size)
+        if not success:
+            for error in results:
+                print(error, file=sys.stderr)
+            return 1
+        for result in results:
+            print(json.dumps(result))
+        return 0 if all(result["halt_reason"] == HALTED for result in results) else 1
+    limits = {"max_instructions": args.max_steps, "max_time": args.max_time, "detect_loops": args.detect_loops,
+              "memory_size": args.memory_size, "compile_blocks": args.compile,
+              "fast_forward_loops": args.fast_forward}
+    exit_code = 0
+    for result in run_files(args.files, args.jobs, limits, args.input, args.registers, args.profile, args.check, args.optimize,
+                            args.console, args.cache, args.cache_size * 1024 * 1024):
+        print(json.dumps(result), flush=True)
+        if result["halt_reason"] != HALTED:
+            exit_code = 1
+    return exit_code
@@ -0,0 +1,185 @@
+'''
+Project Blackbox - Benchmarks
+
+Measures the throughput of the simulator core (Simulator.run) and of the GUI execution path
+(Simulator_Controller.run driven by a hidden Tk window) on a set of canned BasicML workloads.
+The results are written as JSON, and can be compared against a previous result file to catch regressions.
+
+Usage:
+
+python benchmark.py --output baseline.json
+python benchmark.py --compare baseline.json --tolerance 0.15
+
+The GUI benchmarks need a display, they are skipped when Tk can't open a window (or with --no-gui).
+The best of --repeat runs is reported for every workload.
+'''
+
+import argparse
+import json
+import platform
+import sys
+import time
+from simulator import Simulator, HALTED
+
+'''Workloads'''
+
+def arithmetic_loop(count):
+    '''Adds 1 to the accumulator from -count until it's no longer negative (2 instructions per iteration).'''
+    program = ["+020010", "+030011", "+041001", "+043000"]
+    return program + ["+000000"] * 6 + [f"{-count:+07d}", "+000001"]
+
+def store_loop(count):
+    '''Counts down from count and stores the counter in 4 registers every iteration (8 instructions per iteration).'''
+    program = ["+020020", "+031021", "+021020", "+021022", "+021023", "+021024", "+042008", "+040000", "+043000"]
+    return program + ["+000000"] * 11 + [f"{count:+07d}", "+000001"]
+
+def branch_loop(count):
+    '''Counts down from count going through 6 branches every iteration (9 instructions per iteration).'''
+    program = ["+020030", "+031031", "+021030", "+042009", "+041009", "+040006", "+042009", "+040008", "+040000", "+043000"]
+    return program + ["+000000"] * 20 + [f"{count:+07d}", "+000001"]
+
+def full_memory():
+    '''Executes all 250 registers: 248 ADD instructions, a HALT and the operand in the last register.'''
+    return ["+030249"] * 248 + ["+043000", "+000001"]
+
+#Name, program and how many times the program is loaded and run for each engine.
+def core_workloads(scale):
+    return [
+        ("arithmetic_loop", arithmetic_loop(int(200000 * scale)), 1),
+        ("store_loop", store_loop(int(50000 * scale)), 1),
+        ("branch_loop", branch_loop(int(50000 * scale)), 1),
+        ("full_memory", full_memory(), int(2000 * scale)),
+    ]
+
+def gui_workloads(scale):
+    return [
+        ("arithmetic_loop", arithmetic_loop(int(20000 * scale)), 1),
+        ("store_loop", store_loop(int(5000 * scale)), 1),
+        ("branch_loop", branch_loop(int(5000 * scale)), 1),
+        ("full_memory", full_memory(), int(20 * scale)),
+    ]
+
+'''Engines'''
+
+def run_core(program, runs, compile_blocks=False, fast_forward_loops=False):
+    '''Loads and runs the program with Simulator.run, returns (instructions executed, seconds).'''
+    sim = Simulator(compile_blocks=compile_blocks, fast_forward_loops=fast_forward_loops)
+    instructions = 0
+    elapsed = 0.0
+    sim.load_program(program)
+    for _ in range(runs):
+        sim.restore() #Only the registers written by the previous run are put back
+        start = time.perf_counter()
+        result = sim.run()
+        elapsed += time.perf_counter() - start
+        if result.halt_reason != HALTED:
+            raise RuntimeError(f"Benchmark program stopped with {result.halt_reason}: {result.error_message}")
+        instructions += result.steps
+    return instructions, elapsed
+
+def run_gui(session, program, runs):
+    '''Loads and runs the program through the controllers of a GUI session, returns (instructions executed, seconds).'''
+    instructions = run_core(program, 1)[0] * runs #The GUI doesn't count instructions, the core run gives the same count
+    session.run_speed.set("Max")
+    session.fast_forward.set(False) #Every iteration is executed, like the core run that counts them
+    elapsed = 0.0
+    for _ in range(runs):
+        session.sim_op.running_state = "idle"
+        session.control.reset_memory()
+        session.sim.load_program(program)
+        session.control.refresh_table()
+        session.run_btn["text"] = "Run"
+        start = time.perf_counter()
+        session.sim_op.run_cancel_control()
+        while session.sim_op.running_state == "running":
+            session.window.update()
+        elapsed += time.perf_counter() - start
+        if session.sim_op.error:
+            raise RuntimeError(f"Benchmark program failed in the GUI: {session.user_messages.cget('text')}")
+    return instructions, elapsed
+
+def run_batch_load(runs):
+    '''Parses and loads a 250 line program text, returns (programs loaded, seconds).'''
+    text = "\n".join(full_memory())
+    sim = Simulator()
+    start = time.perf_counter()
+    for _ in range(runs):
+        success, errors = sim.load_source(text)
+        if not success:
+            raise RuntimeError(errors)
+    return runs, time.perf_counter() - start
+
+def best_of(repeat, function, *args):
+    '''Runs the function repeat times and returns the (operations, seconds) of the fastest run.'''
+    return min((function(*args) for _ in range(repeat)), key=lambda measure: measure[1] / max(measure[0], 1))
+
+def result_entry(engine, workload, unit, measure):
+    operations, seconds = measure
+    return {"engine": engine, "workload": workload, "unit": unit, "operations": operations,
+            "seconds": seconds, "per_second": operations / seconds if seconds else 0.0}
+
+def load_gui():
+    '''Opens a GUI session with a hidden window, returns None if Tk can't open a window.'''
+    try:
+        import gui_app
+        session = gui_app.GUI_App().new_session()
+    except Exception as error: #tkinter raises TclError when there is no display
+        print(f"Skipping GUI benchmarks: {error}", file=sys.stderr)
+        return None
+    session.window.withdraw()
+    return session
+
+def run_benchmarks(repeat=3, scale=1.0, gui=True):
+    '''Runs every benchmark and returns the results as a dictionary.'''
+    results = []
+    for name, program, runs in core_workloads(scale):
+        results.append(result_entry("core", name, "instructions", best_of(repeat, run_core, program, runs)))
+        results.append(result_entry("compiled", name, "instructions", best_of(repeat, run_core, program, runs, True)))
+        results.append(result_entry("fast_forward", name, "instructions", best_of(repeat, run_core, program, runs, False, True)))
+    results.append(result_entry("core", "batch_load", "programs", best_of(repeat, run_batch_load, int(2000 * scale))))
+    session = load_gui() if gui else None
+    if session is not None:
+        for name, program, runs in gui_workloads(scale):
+            results.append(result_entry("gui", name, "instructions", best_of(repeat, run_gui, session, program, runs)))
+        session.app.root.destroy()
+    return {"python": platform.python_version(), "platform": platform.platform(), "repeat": repeat,
+            "scale": scale, "results": results}
+
+def compare(current, baseline, tolerance):
+    '''Returns the messages of the benchmarks that got slower than the baseline by more than the tolerance.'''
+    previous = {(entry["engine"], entry["workload"]): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in current["results"]:
+        old = previous.get((entry["engine"], entry["workload"]))
+        if old is None or not old["per_second"]:
+            continue
+        change = entry["per_second"] / old["per_second"] - 1
+        if change < -tolerance:
+            regressions.append(f"{entry['engine']}/{entry['workload']}: {old['per_second']:.0f} -> {entry['per_second']:.0f} {entry['unit']}/s ({change:+.1%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measures the throughput of the simulator.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of every benchmark, the best one is reported.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies the size of every workload.")
+    parser.add_argument("--no-gui", action="store_true", help="Skip the GUI benchmarks.")
+    parser.add_argument("--output", help="Write the results to this JSON file instead of the screen.")
+    parser.add_argument("--compare", help="JSON file of a previous run, exits with 1 if a benchmark got slower.")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Slowdown allowed by --compare (default: 0.1 = 10%%).")
+    args = parser.parse_args(argv)
+    results = run_benchmarks(args.repeat, args.scale, not args.no_gui)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+'''
+Project Blackbox - Block Compiler
+
+Fast mode of the simulator for long arithmetic programs. Instead of fetching, decoding and dispatching one
+instruction at a time, the registers are split into basic blocks: straight runs of instructions starting at
+the address the program jumps to and ending after a BRANCH (040), BRANCHNEG (041), BRANCHZERO (042) or
+HALT (043). Every block is written as straight Python source, compiled once with compile() and cached in
+the register file, so executing a block is a single function call.
+
+Blocks give exactly the same results as the interpreter: overflows, invalid addresses and division by zero
+stop the program at the same instruction with the same error message (the checks are the same ones used by
+Simulator.set_result, invalid_address and divide), and the instruction count is the same. READ (010),
+invalid instructions and the end of the memory are left to the interpreter.
+
+A STORE (021) or READ (010) into a register that belongs to a compiled block forgets that block, so it's
+compiled again from the new words the next time the program reaches it (see Registers.drop_code).
+
+When the simulator has constants (set by analyzer.optimize) the peephole stage is on: the words of those
+registers are compiled into the blocks as numbers, and a LOAD (020) of a register the accumulator was just stored
+into is skipped. A block that writes one of them itself reads the register after the STORE, and the other blocks
+are forgotten when it's written (see Registers.add_code).
+
+Usage:
+
+sim = Simulator(compile_blocks=True)
+python -m simulator run --compile program.txt
+'''
+
+from functools import lru_cache
+from simulator import HALTED, ERROR
+
+MAX_BLOCK_LENGTH = 256 #Longest block compiled, longer runs are split into several blocks
+BRANCH_CODES = (40, 41, 42)
+#Instructions that can be part of a block, READ (010) waits for input so it is always interpreted.
+COMPILED_CODES = (0, 11, 20, 21, 30, 31, 32, 33, 40, 41, 42, 43)
+
+'''Compiled Block Class'''
+class CompiledBlock:
+    '''A basic block compiled into a Python function.'''
+    __slots__ = ("start", "end", "length", "function", "source")
+
+    def __init__(self, start, end, length, function, source):
+        self.start = start #Address of the first instruction
+        self.end = end #Address of the last instruction
+        self.length = length #Instructions executed when the whole block runs
+        #Called without arguments, runs the block and returns (instructions executed, last address executed, halt reason or None).
+        self.function = function
+        self.source = source #Generated Python source, useful to debug the compiler
+
+@lru_cache(maxsize=4096)
+def compile_source(source):
+    '''Compiles the source of a block once, the same block of another simulator reuses the code object.'''
+    return compile(source, "<basic block>", "exec")
+
+def block_source(sim, start):
+    '''Writes the Python source of the block starting at the address.
+    Returns (source, last address, length, folded constants), or None if the first instruction has to be interpreted.'''
+    registers = sim.registers
+    words = registers.words
+    base = registers.address_base
+    last_register = sim.register_size
+    word_max = sim.word_max
+    limit = min(last_register, start + MAX_BLOCK_LENGTH - 1)
+    lines = ["def block(sim=sim, words=words, write=write, write_operation=write_operation):", "    acc = sim.acc"]
+    length = 0
+    addr = start
+    terminated = False
+    constants = sim.constants
+    folded = set() #Constant registers compiled into the block
+    written = set() #Registers the block stores into, their words are read from the registers after the STORE
+    stored = set() #Registers holding the same word as the accumulator
+
+    def word(operand):
+        '''Expression of the word of the register, a number if it's a constant.'''
+        if constants and operand in constants and operand not in written:
+            folded.add(operand)
+            return f"{words[operand]}"
+        return f"words[{operand}]"
+
+    def fail(addr, count, call):
+        '''Lines that stop the program at the instruction, call sets the error message.'''
+        return ["    sim.acc = acc", f"    {call}", f"    sim.cur_addr = {addr + 1}", f"    return {count}, {addr}, {ERROR!r}"]
+
+    def check_overflow(addr, count):
+        '''Lines that stop the program if result overflows, the same check set_result does.'''
+        return [f"    if result > {word_max} or result < {-word_max}:"] + ["    " + line for line in fail(addr, count, "sim.set_result(result)")] + ["    acc = result"]
+
+    while addr <= limit:
+        if addr == last_register and words[addr] == 0: #Reaching the last empty register is an error the interpreter reports
+            break
+        code, operand = abs(words[addr]) // base, abs(words[addr]) % base
+        if code not in COMPILED_CODES:
+            break
+        length += 1
+        lines.append(f"    #{addr:03d}: {code:03d} {operand:03d}")
+        if code not in (0, 43) and operand > last_register: #The instruction always fails with an invalid address
+            lines += fail(addr, length, f"sim.invalid_address({operand})")
+            terminated = True
+            break
+        if code == 11:
+            lines += ["    sim.acc = acc", f"    sim.cur_addr = {addr}", f"    write_operation({operand})"] #The output callback sees the same state as with the interpreter
+        elif code == 20:
+            if constants is not None and operand in stored: #Peephole: the accumulator already holds the word
+                lines.append("    #LOAD skipped, the word was just stored from the accumulator")
+            else:
+                lines.append(f"    acc = {word(operand)}")
+                stored = set()
+        elif code == 21:
+            lines.append(f"    write({operand}, acc)")
+            stored.add(operand)
+            written.add(operand)
+            if addr < operand <= limit: #The rest of the block would run the old words, so it ends before the changed register
+                limit = operand - 1
+        elif code == 30:
+            lines.append(f"    result = acc + {word(operand)}")
+            lines += check_overflow(addr, length)
+        elif code == 31:
+            lines.append(f"    result = acc - {word(operand)}")
+            lines += check_overflow(addr, length)
+        elif code == 32:
+            lines += [f"    divisor = {word(operand)}", "    if divisor == 0:"]
+            lines += ["    " + line for line in fail(addr, length, f"sim.divide({operand})")]
+            lines.append("    result = acc // divisor")
+            lines += check_overflow(addr, length)
+        elif code == 33:
+            lines.append(f"    result = acc * {word(operand)}")
+            lines += check_overflow(addr, length)
+        elif code == 40:
+            lines += ["    sim.acc = acc", f"    sim.cur_addr = {operand}"]
+        elif code == 41:
+            lines += ["    sim.acc = acc", f"    sim.cur_addr = {operand} if acc < 0 else {addr + 1}"]
+        elif code == 42:
+            lines += ["    sim.acc = acc", f"    sim.cur_addr = {operand} if acc == 0 else {addr + 1}"]
+        if code in (30, 31, 32, 33):
+            stored = set()
+        if code in BRANCH_CODES:
+            lines.append(f"    return {length}, {addr}, None")
+            terminated = True
+            break
+        if code == 43:
+            lines += ["    sim.acc = acc", f"    sim.halt_reason = {HALTED!r}", f"    sim.cur_addr = {addr + 1}", f"    return {length}, {addr}, {HALTED!r}"]
+            terminated = True
+            break
+        addr += 1
+    if length == 0:
+        return None
+    if not terminated: #The next instruction is interpreted or starts another block
+        addr -= 1
+        lines += ["    sim.acc = acc", f"    sim.cur_addr = {addr + 1}", f"    return {length}, {addr}, None"]
+    return ("\n".join(lines) + "\n", addr, length, folded)
+
+def compile_block(sim, start):
+    '''Compiles the block starting at the address and caches it in the registers, returns None if it can't be compiled.'''
+    registers = sim.registers
+    result = block_source(sim, start)
+    if result is None: #Cached too, so the interpreter doesn't try again until the register changes
+        registers.add_code(start, start, None)
+        return None
+    source, end, length, folded = result
+    namespace = {"sim": sim, "words": registers.words, "write": registers.write, "write_operation": sim.write_operation}
+    exec(compile_source(source), namespace)
+    block = CompiledBlock(start, end, length, namespace["block"], source)
+    registers.add_code(start, end, block, folded)
+    return block
@@ -0,0 +1,88 @@
+'''
+Project Blackbox - Console Sink
+
+Collects the console text of a run (written words, input prompts and the halt message) in the engine instead
+of writing every line straight into a Tk Text widget. The display takes the buffered text once per frame and
+inserts it in a single call, so the cost of a frame doesn't depend on how many WRITE (011) instructions ran.
+
+The display keeps at most scrollback lines, the oldest lines are trimmed. Text buffered between two frames is
+trimmed the same way, so a program that writes in a tight loop can't grow the buffer without limit either.
+The full output can also be copied (tee) to a file or an io.StringIO as it's written, which is how headless
+runs keep a transcript.
+
+Usage:
+
+console = ConsoleSink(scrollback=5000, tee=open("run.log", "w"))
+sim.write_output = console.write_output
+...
+text = console.take() #Once per frame
+'''
+
+from simulator import format_word
+
+DEFAULT_SCROLLBACK = 10000 #Lines kept on the display
+HALT_LINE = "-----------------------Program has halted----------------------\n\n"
+
+'''Console Sink Class'''
+class ConsoleSink:
+    '''Buffers console text until the display takes it, with an optional copy of everything written.'''
+    def __init__(self, scrollback=DEFAULT_SCROLLBACK, tee=None, word_digits=6):
+        self.scrollback = scrollback #Lines kept on the display, None keeps every line
+        self.tee = tee #File object that receives the full output, or None
+        self.word_digits = word_digits #Digits of the words written, see simulator.address_digits
+        self.pending = [] #Text written since the last take
+        self.pending_lines = 0 #Lines in the pending text
+
+    def write(self, text):
+        '''Adds text to the console.'''
+        self.pending.append(text)
+        self.pending_lines += text.count("\n")
+        if self.tee is not None:
+            self.tee.write(text)
+        if self.scrollback is not None and self.pending_lines > 2 * self.scrollback: #Lines that would be trimmed anyway
+            text = self.tail("".join(self.pending))
+            self.pending = [text]
+            self.pending_lines = text.count("\n")
+
+    def tail(self, text):
+        '''Returns the last scrollback lines of the text (and the unfinished line after them).'''
+        return "\n".join(text.split("\n")[-(self.scrollback + 1):])
+
+    def take(self):
+        '''Returns the text written since the last call and forgets it.'''
+        text = "".join(self.pending)
+        self.pending = []
+        self.pending_lines = 0
+        return text
+
+    def clear(self):
+        '''Forgets the text that wasn't taken yet.'''
+        self.pending = []
+        self.pending_lines = 0
+
+    def excess_lines(self, shown_lines):
+        '''Returns how many of the oldest lines the display has to delete when it shows shown_lines lines.'''
+        if self.scrollback is None:
+            return 0
+        return max(0, shown_lines - self.scrollback)
+
+    '''Console messages'''
+
+    def write_output(self, addr, word):
+        '''Writes the word of a WRITE (011) instruction, it can be used as the simulator write_output callback.'''
+        self.write(f"Value from register {addr:03d}: {format_word(word, self.word_digits)}\n\n")
+
+    def prompt(self, addr):
+        '''Asks for the word of a READ (010) instruction.'''
+        self.write(f"Enter a positive or negative {self.word_digits} digit number into memory register {addr:03d}, then press the submit button (ex: {format_word(12034, self.word_digits)} or {format_word(-43021, self.word_digits)}): ")
+
+    def input_entered(self, addr, word):
+        '''Records a word entered in advance and used by a READ (010) instruction.'''
+        self.write(f"Value entered into memory register {addr:03d}: {word}\n\n")
+
+    def answer(self, word):
+        '''Records the word entered after a prompt.'''
+        self.write(f"{word}\n\n")
+
+    def halted(self):
+        self.write(HALT_LINE)
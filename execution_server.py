@@ -0,0 +1,246 @@
+'''
+Project Blackbox - Execution Server
+
+Local HTTP server that runs programs sent as JSON, so other tools can run programs without starting Python
+and Tk for every one. The programs run on a pool of worker processes started (and warmed up) with the server,
+each worker keeps one Simulator per memory size and reuses it for every program it runs, so a request only
+pays for sending the program to a worker and loading it.
+
+POST /run with a JSON object describing one program:
+
+    {"program": ["+010009", "+011009", "+043000"],   words as strings or integers, or
+     "source": "+010009\n+011009\n+043000",          text in the .txt format, or
+     "image": "QkJYSQEA...",                         a program image (.bbx) encoded in base64
+     "inputs": ["+000005"],                          words used by READ (010), in order
+     "max_steps": 100000, "max_time": 2.0,           optional limits, see Simulator, at most the server's
+     "memory_size": 250, "compile": false, "fast_forward": false}
+
+Every run is stopped by the limits of the server (--max-steps and --max-time), a request can only lower them.
+The response holds the result of the run: halt_reason, steps, accumulator, cur_addr, error_message, the
+outputs written by WRITE (011) and the final registers. Programs that can't be loaded return the "load_error"
+halt reason with the errors, words are checked like the text loader does. POST /run with {"batch": [program,
+program, ...]} runs every program (spread over the workers) and returns {"results": [result, result, ...]} in the
+same order. A program that fails in its worker returns status 500, in a batch only its result has the
+"server_error" halt reason. GET /health returns the number of workers.
+
+Usage:
+
+python -m simulator serve --port 8765 --jobs 8 --max-steps 1000000 --max-time 5
+curl -d '{"source": "+010009\n+011009\n+043000", "inputs": [5]}' http://127.0.0.1:8765/run
+'''
+
+import base64
+import binascii
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from simulator import Simulator, MEMORY_SIZE, MAX_MEMORY_SIZE
+from batch_runner import LOAD_ERROR
+import program_image
+
+DEFAULT_PORT = 8765
+MAX_REQUEST_SIZE = 64 * 1024 * 1024 #Largest request body accepted, in bytes
+SERVER_ERROR = "server_error" #Halt reason of a batch program that failed in the worker
+DEFAULT_MAX_STEPS = 10_000_000 #Instructions a run may execute unless the server is started with another limit
+DEFAULT_MAX_TIME = 10.0 #Seconds a run may take unless the server is started with another limit
+MAX_SIMULATORS = 4 #Memory sizes a worker keeps a simulator for
+
+'''Worker processes'''
+
+simulators = OrderedDict() #Memory size -> Simulator reused by the programs run in this worker process, the most recently used last
+
+def worker_simulator(memory_size=MEMORY_SIZE):
+    '''Returns the simulator of the worker for the memory size, it's created the first time.
+    Only the last MAX_SIMULATORS memory sizes used keep their simulator.'''
+    sim = simulators.get(memory_size)
+    if sim is None:
+        sim = simulators[memory_size] = Simulator(memory_size=memory_size)
+        while len(simulators) > MAX_SIMULATORS:
+            simulators.popitem(last=False)
+    simulators.move_to_end(memory_size)
+    return sim
+
+def warm_up(_=None):
+    '''Creates the default simulator of the worker before the first program arrives.'''
+    worker_simulator()
+    return os.getpid()
+
+def program_words(sim, program):
+    '''Checks the words of a "program" list like the text loader does, returns (words, errors).'''
+    if not isinstance(program, list):
+        return ([], ["Error: The program must be a list of words."])
+    words = []
+    errors = []
+    for number, word in enumerate(program, 1):
+        if isinstance(word, str):
+            digits = word[1:] if word[:1] in ("+", "-") else word
+            valid = digits.isascii() and digits.isdigit() and len(digits) <= sim.registers.word_digits
+        else: #bool is an int, but not a word
+            valid = isinstance(word, int) and not isinstance(word, bool) and abs(word) <= sim.word_max
+        if not valid:
+            errors.append(f"Error(word {number}): {json.dumps(word)} is not a valid {sim.registers.word_digits} digit word.")
+        else:
+            words.append(int(word))
+    return (words, errors)
+
+def load_job(sim, job):
+    '''Loads the program of a job into the simulator, returns (True, []) or (False, errors).'''
+    if "image" in job:
+        try:
+            buffer = base64.b64decode(job["image"], validate=True)
+        except (binascii.Error, TypeError, ValueError):
+            return (False, ["Error: The image is not valid base64."])
+        return program_image.load_buffer(sim, buffer)
+    if "source" in job:
+        if not isinstance(job["source"], str):
+            return (False, ["Error: The source must be a string."])
+        return sim.load_source(job["source"])
+    if "program" in job:
+        words, errors = program_words(sim, job["program"])
+        if errors:
+            return (False, errors)
+        try:
+            sim.load_program(words)
+        except ValueError as error: #More words than registers
+            return (False, [f"Error: {error}"])
+        return (True, [])
+    return (False, ["Error: The request needs a program, source or image."])
+
+def job_limit(requested, limit):
+    '''Returns the limit of a run, the request can lower the limit of the server but not raise it (None is no limit).'''
+    if limit is None:
+        return requested
+    return limit if requested is None else min(requested, limit)
+
+def run_job(job, max_steps=DEFAULT_MAX_STEPS, max_time=DEFAULT_MAX_TIME):
+    '''Runs one program in the worker, returns its result as a dictionary. max_steps and max_time are the limits
+    of the server.'''
+    if not isinstance(job, dict):
+        return {"halt_reason": LOAD_ERROR, "error_message": "Error: Every program must be a JSON object.", "errors": []}
+    try:
+        memory_size = int(job.get("memory_size", MEMORY_SIZE))
+        max_steps = job_limit(None if job.get("max_steps") is None else int(job["max_steps"]), max_steps)
+        max_time = job_limit(None if job.get("max_time") is None else float(job["max_time"]), max_time)
+        inputs = job.get("inputs", [])
+        if not isinstance(inputs, list):
+            raise TypeError("The inputs must be a list of words.")
+    except (TypeError, ValueError, OverflowError) as error: #OverflowError: a limit of 1e400 is infinite
+        return {"halt_reason": LOAD_ERROR, "error_message": f"Error: {error}", "errors": [f"Error: {error}"]}
+    if memory_size < 1 or memory_size > MAX_MEMORY_SIZE:
+        error = f"Error: The memory size must be between 1 and {MAX_MEMORY_SIZE} registers."
+        return {"halt_reason": LOAD_ERROR, "error_message": error, "errors": [error]}
+    sim = worker_simulator(memory_size)
+    sim.max_instructions = max_steps
+    sim.max_time = max_time
+    sim.compile_blocks = bool(job.get("compile", False))
+    sim.fast_forward_loops = bool(job.get("fast_forward", False))
+    success, errors = load_job(sim, job)
+    if not success:
+        return {"halt_reason": LOAD_ERROR, "error_message": "\n".join(errors), "errors": errors}
+    return sim.run(inputs=[str(word) for word in inputs]).to_dict()
+
+def run_batch_job(job, max_steps=DEFAULT_MAX_STEPS, max_time=DEFAULT_MAX_TIME):
+    '''Runs one program of a batch, an unexpected error only fails that program.'''
+    try:
+        return run_job(job, max_steps, max_time)
+    except Exception as error:
+        return {"halt_reason": SERVER_ERROR, "error_message": f"Error: {error}", "errors": [f"Error: {error}"]}
+
+'''HTTP server'''
+
+class ExecutionServer(ThreadingHTTPServer):
+    '''HTTP server that hands the programs to a pool of warm worker processes.'''
+    daemon_threads = True
+
+    def __init__(self, address, jobs=None, max_steps=DEFAULT_MAX_STEPS, max_time=DEFAULT_MAX_TIME):
+        self.jobs = jobs or os.cpu_count() or 1 #Number of worker processes
+        self.max_steps = max_steps #Limits of every run, None for no limit
+        self.max_time = max_time
+        self.executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=warm_up)
+        list(self.executor.map(warm_up, range(self.jobs))) #Starts the workers now instead of on the first request
+        try:
+            super().__init__(address, RequestHandler)
+        except OSError: #The address is in use
+            self.executor.shutdown()
+            raise
+
+    def run_batch(self, jobs):
+        '''Runs the programs on the workers, returns the results in the same order.'''
+        chunksize = max(1, len(jobs) // (self.jobs * 4))
+        run = partial(run_batch_job, max_steps=self.max_steps, max_time=self.max_time)
+        return list(self.executor.map(run, jobs, chunksize=chunksize))
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(cancel_futures=True)
+
+class RequestHandler(BaseHTTPRequestHandler):
+    '''Handles the JSON requests of the execution server.'''
+    protocol_version = "HTTP/1.1" #Keeps the connection open, so clients don't connect for every program
+    disable_nagle_algorithm = True #The headers and the body are sent separately, they shouldn't wait for each other
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", "workers": self.server.jobs})
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}."})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True #The end of the body is unknown
+            self.send_json(400, {"error": "The Content-Length header is not a valid size."})
+            return
+        if length > MAX_REQUEST_SIZE:
+            self.close_connection = True #The body isn't read
+            self.send_json(413, {"error": f"The request is larger than {MAX_REQUEST_SIZE} bytes."})
+            return
+        body = self.rfile.read(length)
+        if self.path != "/run":
+            self.send_json(404, {"error": f"Unknown path {self.path}."})
+            return
+        try:
+            request = json.loads(body)
+        except ValueError as error:
+            self.send_json(400, {"error": f"The request is not valid JSON: {error}"})
+            return
+        batch = isinstance(request, dict) and "batch" in request
+        if batch and not isinstance(request["batch"], list):
+            self.send_json(400, {"error": "The batch must be a list of programs."})
+            return
+        try:
+            if batch:
+                result = {"results": self.server.run_batch(request["batch"])}
+            else:
+                result = self.server.executor.submit(run_job, request, self.server.max_steps, self.server.max_time).result()
+        except Exception as error: #The program broke the worker, or a worker process died
+            self.send_json(500, {"error": f"The program could not be run: {error}"})
+            return
+        self.send_json(200, result)
+
+    def log_message(self, format, *args):
+        pass #Requests aren't logged, the server may handle thousands per second
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, jobs=None, max_steps=DEFAULT_MAX_STEPS, max_time=DEFAULT_MAX_TIME):
+    '''Runs the execution server until it's interrupted, returns the exit code.'''
+    with ExecutionServer((host, port), jobs, max_steps, max_time) as server:
+        print(f"Serving on http://{host}:{server.server_address[1]} with {server.jobs} workers", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
@@ -3,19 +3,32 @@ import tkinter as tk
 from tkinter import filedialog
 from tkinter import colorchooser
 from tkinter import *
-from simulator import Simulator
-import subprocess
+from simulator import Simulator, HALTED, STEP_LIMIT
+import simulator
+import program_image
+import analyzer
+from console_sink import ConsoleSink
+from result_cache import ResultCache, CachedRun, run_key, DEFAULT_DIRECTORY
+from run_recording import Recording, RECORDING_EXTENSION
+from collections import deque
 import os
 
 class GUI_Controller:
     '''Controls most of the updates to the GUI.'''
-    def __init__(self):
+    def __init__(self, session):
+        self.session = session #Session whose window is controlled
         self.file_addr = "" #Stores the address of the file that is currently open.
+        self.row_ids = [] #Stores the id of the table row of each register, the rows are kept for the whole session.
+        self.frame_interval = 25 #Milliseconds between redraws while a program is running (about 40 per second)
+        self.render_id = None #Id of the scheduled redraw
+        self.shown_accumulator = None #Accumulator value currently displayed
+        self.highlight_addr = 0 #Address of the last instruction executed, highlighted on the next redraw
+        self.shown_addr = None #Address currently highlighted
 
     def save_file(self):
         '''Saves instructions to the same file from which it was opened'''
-        if sim_op.running_state == "running": #It will block the user from saving the file while the program is running.
-            tk.messagebox.showerror("Invalid Operation", "Program is currently running, cancel process before proceeding.", parent=window)
+        if self.session.sim_op.running_state == "running": #It will block the user from saving the file while the program is running.
+            tk.messagebox.showerror("Invalid Operation", "Program is currently running, cancel process before proceeding.", parent=self.session.window)
             return
         
         if self.file_addr == "": #If no file is open, it will prompt the user to save as a new file.
@@ -27,237 +40,214 @@ class GUI_Controller:
 
     def save_as(self):
         '''Saves all the instructions to a new file.'''
-        if sim_op.running_state == "running": #It will block the user from saving the file while the program is running.
-            tk.messagebox.showerror("Invalid Operation", "Program is currently running, cancel process before proceeding.", parent=window)
+        if self.session.sim_op.running_state == "running": #It will block the user from saving the file while the program is running.
+            tk.messagebox.showerror("Invalid Operation", "Program is currently running, cancel process before proceeding.", parent=self.session.window)
             return
         #Creates a dialog box for the user to select the file name and location.
-        savedialog = filedialog.asksaveasfile(initialfile="Instructions.txt", defaultextension=".txt", filetypes=[("Text Documents","*.txt")])
+        savedialog = filedialog.asksaveasfile(initialfile="Instructions.txt", defaultextension=".txt", filetypes=[("Text Documents","*.txt"), ("Program Image","*" + program_image.IMAGE_EXTENSION)], parent=self.session.window)
         self.file_addr = savedialog.name #Stores the address of the file that is currently open.
-        window.title(f"Project Blackbox - ({self.file_addr})")
+        self.session.window.title(f"Project Blackbox - ({self.file_addr})")
         self.save_operation()
 
     def save_operation(self):
         '''Handles the save operation'''
+        sim = self.session.sim
+        if self.file_addr.endswith(program_image.IMAGE_EXTENSION): #Program images store the used registers as binary words
+            program_image.save_image(self.file_addr, program_image.used_words(sim.registers.words))
+            return
         with open(self.file_addr, "w") as save_file: #Creates a new file for the report
-            reg_end = 249 #Will hold the last register that was used once the for loop interates through them.
-            for i in reversed(range(250)): #Finds the last register that was used so we don't write all 250 registers to the file.
-                if insta.registers[i] != "+000000":
+            reg_end = sim.register_size #Will hold the last register that was used once the for loop interates through them.
+            for i in reversed(range(len(sim.registers))): #Finds the last register that was used so we don't write all the registers to the file.
+                if sim.registers.words[i] != 0:
                     reg_end = i
                     break
             for i in range(reg_end): #Writes the final state of the registers to the file
-                save_file.write(insta.registers[i] + "\n")
-            save_file.write(insta.registers[reg_end]) #Writes the final register without a new line character
+                save_file.write(sim.registers[i] + "\n")
+            save_file.write(sim.registers[reg_end]) #Writes the final register without a new line character
         return
 
-    def clear_table(self):
-        '''Deletes all of the rows in the register table.'''
-        for item in reg_table.get_children():
-            reg_table.delete(item)
+    def save_recording(self):
+        '''Saves the inputs and outputs of the last finished run so it can be replayed without the GUI.'''
+        recording = self.session.sim_op.last_recording
+        if recording is None:
+            tk.messagebox.showerror("No recording", "Run a program until it stops before saving its recording.", parent=self.session.window)
+            return
+        #Creates a dialog box for the user to select the file name and location.
+        path = filedialog.asksaveasfilename(initialfile="Recording" + RECORDING_EXTENSION, defaultextension=RECORDING_EXTENSION, filetypes=[("Run Recording", "*" + RECORDING_EXTENSION)], parent=self.session.window)
+        if path:
+            recording.save(path)
+            self.session.user_messages.config(text="Run recording saved, replay it with: python -m simulator replay")
 
     def update_table(self):
         '''Repopulates all of the items in the register table.'''
-        for register, value in insta.registers.items():
-            reg_table.insert("", 'end', text=value,
-                        values =(register, value))
+        for register, value in self.session.sim.registers.items():
+            self.row_ids.append(self.session.reg_table.insert("", 'end', text=value,
+                        values =(register, value)))
+        self.session.sim.registers.take_dirty() #Every row is up to date
             
     def refresh_table(self):
-        '''Updates the register table with the new values.'''
-        self.clear_table()
-        self.update_table()
+        '''Updates the rows of the registers that changed since the last refresh.'''
+        if not self.row_ids: #The table has to be populated first
+            self.update_table()
+            return
+        registers = self.session.sim.registers
+        for register in registers.take_dirty():
+            value = registers[register]
+            self.session.reg_table.item(self.row_ids[register], text=value, values=(register, value))
 
     def refresh_accumulator(self):
         '''Updates the accumulator with new values.'''
+        sim, accumulator_box = self.session.sim, self.session.accumulator_box
+        self.shown_accumulator = sim.acc
         accumulator_box['state'] = 'normal' #Entry has to be enabled to be changed
         accumulator_box.delete(0, END) #Deletes previous value
-        accumulator_box.insert(END, insta.accumulator) #Writes the new accumulator value
+        accumulator_box.insert(END, sim.accumulator) #Writes the new accumulator value
         accumulator_box['state'] = 'readonly' #Disables the entry box after modifications
 
     def reset_memory(self):
         '''Resets the simulator and the GUI.'''
-        if sim_op.running_state == "running": #It will block the user from resetting the simulator while the program is running.
-            tk.messagebox.showerror("Invalid Operation", "Program is currently running, cancel process before proceeding.", parent=window)
+        sim = self.session.sim
+        if self.session.sim_op.running_state == "running": #It will block the user from resetting the simulator while the program is running.
+            tk.messagebox.showerror("Invalid Operation", "Program is currently running, cancel process before proceeding.", parent=self.session.window)
             return
         
-        for i in range(250): #Sets all the registers back to "+000000"
-            insta.registers[i] = "+000000"
-        insta.accumulator = '+000000' #Sets accumulator back to "+000000"
-        insta.cur_addr = 0 #Sets the memory pointer back to the first register
-        insta.console_memory = "" #Clears the console memory
-        insta.log = [] #Clears the logs
+        sim.registers.clear() #Sets all the registers back to "+000000"
+        sim.acc = 0 #Sets accumulator back to "+000000"
+        sim.cur_addr = 0 #Sets the memory pointer back to the first register
+        sim.console_memory = "" #Clears the console memory
+        sim.snapshot() #Rerun starts from the empty memory instead of the previous program
         self.refresh_table() #Resets the GUI register table back to default values
         self.refresh_accumulator() #Resets the GUI display of the accumulator back to default value
 
     def clear_console(self):
         '''Clears all the console outputs.'''
-        if sim_op.running_state == "running": #It will block the user from clearing the console while the program is running.
-            tk.messagebox.showerror("Invalid Operation", "Program is currently running, cancel process before proceeding.", parent=window)
+        console_box = self.session.console_box
+        if self.session.sim_op.running_state == "running": #It will block the user from clearing the console while the program is running.
+            tk.messagebox.showerror("Invalid Operation", "Program is currently running, cancel process before proceeding.", parent=self.session.window)
             return
         
+        self.session.console.clear() #Drops the text that wasn't displayed yet
         console_box.config(state=tk.NORMAL) #Text had to be enabled to be changed.
         console_box.delete('1.0', 'end') #Deletes all of the text in the console box.
         console_box.config(state=tk.DISABLED) #Disables the text box after modifications.
 
     def show_input(self):
         '''Enables the user input box and the submit button.'''
-        input_box['state'] = "normal"
-        submit_input['state'] = 'normal'
+        self.session.input_box['state'] = "normal"
+        self.session.submit_input['state'] = 'normal'
 
     def hide_input(self):
         '''Disables the user input box and the submit button.'''
-        input_box['state'] = "disabled"
-        submit_input['state'] = 'disabled'
+        self.session.input_box['state'] = "disabled"
+        self.session.submit_input['state'] = 'disabled'
 
     def highlight_reg(self):
-        '''Highlights the current isntruction being executed.'''
-        cur_row = reg_table.get_children()[insta.cur_addr]
-        reg_table.selection_set(cur_row)
-        reg_table.focus_set()
+        '''Highlights the last instruction executed.'''
+        self.shown_addr = self.highlight_addr
+        if self.highlight_addr < len(self.row_ids):
+            self.session.reg_table.selection_set(self.row_ids[self.highlight_addr])
+            self.session.reg_table.focus_set()
+
+    def request_render(self):
+        '''Schedules a redraw for the next frame, calls made before it runs are merged into one redraw.'''
+        if self.render_id is None:
+            self.render_id = self.session.window.after(self.frame_interval, self.render)
+
+    def render(self):
+        '''Redraws the parts of the GUI that changed since the last redraw.'''
+        if self.render_id is not None:
+            self.session.window.after_cancel(self.render_id)
+            self.render_id = None
+        if self.session.sim.acc != self.shown_accumulator:
+            self.refresh_accumulator()
+        if self.session.sim.registers.dirty:
+            self.refresh_table()
+        if self.highlight_addr != self.shown_addr:
+            self.highlight_reg()
+        self.flush_console()
+
+    def flush_console(self):
+        '''Inserts the console text written since the last redraw in a single call and trims the oldest lines.'''
+        console, console_box = self.session.console, self.session.console_box
+        text = console.take()
+        if not text:
+            return
+        console_box.config(state='normal') #Text had to be enabled to be changed.
+        console_box.insert(END, text)
+        excess = console.excess_lines(int(console_box.index('end-1c').split('.')[0]))
+        if excess:
+            console_box.delete('1.0', f'{excess + 1}.0') #Deletes the oldest lines past the scrollback
+        console_box.see(END) #Scrolls the console down
+        console_box.config(state='disabled') #Disables the text box after modifications.
 
     def terminate(self):
-        '''Deletes the temp file once operation is completed'''
-        if os.path.exists(sub_windows.temp_file):
-            os.remove(sub_windows.temp_file)
-        window.destroy()
+        '''Closes the session window, the program ends when the last window is closed'''
+        self.session.sim_op.cancel_batch() #Callbacks scheduled on the window can't run once it's destroyed
+        if self.render_id is not None:
+            self.session.window.after_cancel(self.render_id)
+            self.render_id = None
+        self.session.app.close_session(self.session)
 
 class GUI_Subwindows:
     '''Generates and controls all the GUI subwindows'''
-    def __init__(self):
-        self.temp_file = "./temp.txt" #This is the temporary file used to stored the instructions in the registers.
+    def __init__(self, session):
+        self.session = session #Session that owns the subwindows
 
     def load_instructions(self):
         '''Opens instruction input subwindow'''
-        if sim_op.running_state == "running": #It will block the user from loading the instructions while the program is running.
-            tk.messagebox.showerror("Invalid Operation", "Program is currently running, cancel process before proceeding.", parent=window)
+        if self.session.sim_op.running_state == "running": #It will block the user from loading the instructions while the program is running.
+            tk.messagebox.showerror("Invalid Operation", "Program is currently running, cancel process before proceeding.", parent=self.session.window)
             return
 
         def open_file():
             '''Opens file containing instructions'''
             #Creates a dialog box for the user to select the file name and location.
-            file_path = filedialog.askopenfilename(filetypes=(("Text File (*.txt)", "*.txt"),), parent=entry_window)
-            control.file_addr = file_path #Stores the address of the file that is currently open.
+            file_path = filedialog.askopenfilename(filetypes=(("Text File (*.txt)", "*.txt"), ("Program Image", "*" + program_image.IMAGE_EXTENSION)), parent=entry_window)
+            self.session.control.file_addr = file_path #Stores the address of the file that is currently open.
             if file_path:
                 entry_box.delete("1.0", "end") #Deletes the previous text in the input box.
+                if file_path.endswith(program_image.IMAGE_EXTENSION): #Images are shown as text so they can still be edited before loading.
+                    with open(file_path, "rb") as image_file:
+                        image, errors = program_image.decode_image(image_file.read())
+                    if errors:
+                        entry_message.config(text="\n".join(errors))
+                        return
+                    entry_box.insert(END, program_image.program_text(image.words))
+                    return
                 with open(file_path) as input_file: #Opens the file and reads the text to the input box.
                     temp_text = input_file.read()
                     entry_box.insert(END, temp_text)
 
         def process():
             '''Processes the user inputs'''
-            count = 1
-            if not os.path.exists(self.temp_file): #Creates a temporary file if it does not exist.
-                count = 1
-                success = True
-                possible_filename = ''
-                while success: #Checks if the file name is already taken, interates through it until finds an unused filename.
-                    possible_filename = f"./temp{count}.txt"
-                    success = os.path.exists(possible_filename)
-                    count += 1
-                self.temp_file = possible_filename #Saves the temp file location.
-                  
-            with open(self.temp_file, "w") as temp: #Writes the user input to the temp file.
-                temp.write(entry_box.get("1.0", END))
-            size_out = validate_input_size() #Checks if the user input will fit in the registers.
-            size_check = size_out[0] #Stores the result of the size check.
-            loaded_instructions = size_out[1] #Saves the instructions list.
-            loaded_instructions = bit_conversion(loaded_instructions) #Converts 4 bit instructions to 6 bit instructions.
-            if not size_check: #If the user input is too large, it will inform the user and delete the temp file.
+            #Reads, converts and validates the text box in a single pass, nothing is written to disk.
+            words, errors = simulator.read_program(entry_box.get("1.0", END), len(self.session.sim.registers))
+            if not errors: #Programs that can't run correctly (bad instructions or addresses, never halting) are rejected before loading
+                errors = analyzer.analyze(words, len(self.session.sim.registers)).errors
+            if errors: #If the instructions are invalid, it will inform the user of every error found.
+                shown_errors = errors[:5]
+                if len(errors) > 5:
+                    shown_errors.append(f"...and {len(errors) - 5} more errors.")
+                entry_message.config(text="\n".join(shown_errors))
                 return
-            instruction_output = validate_instructions(loaded_instructions) #Checks if the instructions are valid.
-            instruction_check = instruction_output[0] #Stores the result of the instruction check.
-            loaded_instructions = instruction_output[1] #Saves the instructions list.
-            if not instruction_check: #If the instructions are invalid, it will inform the user and delete the temp file.
-                return
-            while loaded_instructions[-1] == '': #Removes any empty lines at the end of the list.
-                loaded_instructions.pop()
-            control.reset_memory() #Resets the simulator and the GUI.
-            populate_registers(loaded_instructions) #Loads the instructions into the registers.
-            control.refresh_table() #Refreshes the GUI register table.
-            run_btn['text'] = "Run" #Changes the run button to have the run functionality
-            executemenu.entryconfigure(1, label="Run") #Changes menu button to cancel
-            user_messages.config(text="Input successfully loaded.") #Informs the user that file loaded sucessfully.
-            if control.file_addr != "":
-                window.title(f"Project Blackbox - ({control.file_addr})")
+            self.session.control.reset_memory() #Resets the simulator and the GUI.
+            self.session.sim.load_program(words) #Loads the instructions into the registers.
+            self.session.control.refresh_table() #Refreshes the GUI register table.
+            self.session.run_btn['text'] = "Run" #Changes the run button to have the run functionality
+            self.session.executemenu.entryconfigure(1, label="Run") #Changes menu button to cancel
+            self.session.user_messages.config(text="Input successfully loaded.") #Informs the user that file loaded sucessfully.
+            if self.session.control.file_addr != "":
+                self.session.window.title(f"Project Blackbox - ({self.session.control.file_addr})")
             else:
-                window.title(f"Project Blackbox - (New file {count - 1})")
+                self.session.app.new_file_count += 1 #Counted for the whole application so two windows don't get the same name
+                self.session.window.title(f"Project Blackbox - (New file {self.session.app.new_file_count})")
             entry_window.destroy() #Closes the input window.
-        
-        def validate_input_size():
-            '''Verifies if the user input will fit in the registers'''
-            line_list = [] 
-            with open(self.temp_file, "r") as temp: #Reads the temp file and stores the lines in a list.
-                for line in temp:
-                    if line != "":
-                        line_list.append(line[0:-1])
-                    elif line == "":
-                        break
-            if len(line_list) > 250: #max line limit 250
-                entry_message.config(text="Error: Your input contain more than 250 instructions.")
-                return (False, []) #Returns false if the input is too large.
-            else:
-                return (True, line_list) #Returns true if the input is valid.
-        
-        def bit_conversion(instruction_list):
-            '''Converts 4 bit instructions to 6 bit instructions'''
-            new_list = []
-            for line in instruction_list:
-                if len(line) == 4:
-                    line = "0" + line[0:2] + "0" + line[2:]
-                elif len(line) == 5:
-                    line = line[0:1] + "0" + line[1:3] + "0" + line[3:]
-                new_list.append(line)
-            return new_list
-
-        def validate_instructions(loaded_instructions):
-            '''Verifies if all of the inputs are valid'''
-            line_list = []
-            line_count = 1
-            for line in loaded_instructions:
-                try:
-                    _line_parse_test = int(line) #Tests if input if an integer
-                except: #If input is not an integer a ValueError will be triggered and an error is recorded
-                    entry_message.config(text=f'Error(line {line_count}): {line} in your input is not a valid instruction.')
-                    return (False, [])
-                if len(line) == 7: #Correct lenght for a value with operator sign
-                    if line[0] == "+" or line[0] == "-": #Checks if operator sign is present
-                        line_count += 1
-                        line_list.append(line) #If operator sign is present, this is a 6 digit number, which is valid
-                        continue #If no errors from parsing, input is valid
-                    else: #If the first character is not a operator sign and length is 7, input is invalid
-                        entry_message.config(text=f'Error(line {line_count}): {line} in your input is not a valid instruction.')
-                        return (False, [])
-                elif len(line) == 6:
-                    if line == "-99999":
-                        return (True, line_list)
-                    elif line[0] == "+" or line[0] == "-": #If operator sign is present, this is a 5 digit number, which is invalid
-                        entry_message.config(text=f'Error(line {line_count}): {line} in your input is not a valid instruction.')
-                        return (False, [])
-                    else: #If the first character is not a operator sign and length is 6, input is valid
-                        line_count += 1
-                        line_list.append(f"+{line}")
-                        continue #If no errors from parsing, input is valid
-                elif line == "-99999": #This means it's the end of the file.
-                    return (True, line_list)
-                elif line == "": #This is the last instruction
-                    return (True, line_list)
-                else: #If none of the conditions above are met, the input is invalid
-                    entry_message.config(text=f'Error: {line} in your input is not a valid instruction.')
-                    return (False, [])
-            return (True, line_list) #If no errors from parsing, input is valid
-        
-        def populate_registers(loaded_instructions):
-            '''Populates all of the registers with user input'''
-            addr = 0
-            if loaded_instructions[-1] == "-99999": #If the last instruction is -99999, it is removed.
-                loaded_instructions.pop()
-            for line in loaded_instructions: #Iterates through the instructions and stores them in the registers.
-                insta.registers[addr] = line
-                addr += 1
-
-        entry_window = Toplevel(window, background=win_style.primarycolor) #Creates a subwindow.
+
+        entry_window = Toplevel(self.session.window, background=self.session.win_style.primarycolor) #Creates a subwindow.
         entry_window.geometry("850x700") #Sets the size of the subwindow.
-        entry_frame = tk.Frame(entry_window, bg=win_style.primarycolor) #Creates a frame for the subwindow that contains everything in the box.
+        entry_frame = tk.Frame(entry_window, bg=self.session.win_style.primarycolor) #Creates a frame for the subwindow that contains everything in the box.
         entry_frame.pack()
-        box_frame = tk.Frame(entry_frame, bg=win_style.primarycolor) #Creates a frame for the text box.
+        box_frame = tk.Frame(entry_frame, bg=self.session.win_style.primarycolor) #Creates a frame for the text box.
         box_frame.pack()
         box_scroll = Scrollbar(box_frame) #Creates a scrollbar for the text box.
         box_scroll.pack(side='right', fill='y', pady=(20, 0))
@@ -265,26 +255,26 @@ class GUI_Subwindows:
         entry_box.pack(side='left', pady=(20, 0))
         box_scroll.config(command = entry_box.yview)
         #Reserves a space to display error messages.
-        entry_message = tk.Label(entry_frame, font=("Arial", 20), text='Enter instructions on the text box above or open a file containing the instructions, then press "Process Entry" to populate the registers.', wraplength=800, bg=win_style.primarycolor)
+        entry_message = tk.Label(entry_frame, font=("Arial", 20), text='Enter instructions on the text box above or open a file containing the instructions, then press "Process Entry" to populate the registers.', wraplength=800, bg=self.session.win_style.primarycolor)
         entry_message.pack(pady=20)
-        entry_button_frame = tk.Frame(entry_frame, bg=win_style.primarycolor) #Creates a frame containing all the buttons.
+        entry_button_frame = tk.Frame(entry_frame, bg=self.session.win_style.primarycolor) #Creates a frame containing all the buttons.
         entry_button_frame.pack()
         #Button to process the user input.
-        process_btn = tk.Button(entry_button_frame, command=process, text="Process Entry", font=("Courier", 20), border=5, width=15, bg=win_style.offcolor, fg='black')
+        process_btn = tk.Button(entry_button_frame, command=process, text="Process Entry", font=("Courier", 20), border=5, width=15, bg=self.session.win_style.offcolor, fg='black')
         process_btn.pack(side="left", padx=30)
         #Button to open a file.
-        file_btn = tk.Button(entry_button_frame, command=open_file, text="Open File", font=("Courier", 20), border=5, width=15, bg=win_style.offcolor, fg='black')
+        file_btn = tk.Button(entry_button_frame, command=open_file, text="Open File", font=("Courier", 20), border=5, width=15, bg=self.session.win_style.offcolor, fg='black')
         file_btn.pack(side="right", padx=30)
         #Populates the text box with the current registers.
-        reg_end = 249
-        for i in reversed(range(250)): #Finds the last register that was used so we don't write all 100 registers to the file.
+        reg_end = self.session.sim.register_size
+        for i in reversed(range(len(self.session.sim.registers))): #Finds the last register that was used so we don't write all the registers to the file.
             reg_end = i
-            if insta.registers[i] != "+000000":
+            if self.session.sim.registers.words[i] != 0:
                 break
-        if reg_end > 0 or (reg_end == 0 and insta.registers[0] != "+000000"):
+        if reg_end > 0 or (reg_end == 0 and self.session.sim.registers.words[0] != 0):
             for i in range(reg_end):
-                entry_box.insert(END, f"{insta.registers[i]}\n")
-            entry_box.insert(END, f"{insta.registers[reg_end]}") #This is to avoid a blank line at the end of the file.
+                entry_box.insert(END, f"{self.session.sim.registers[i]}\n")
+            entry_box.insert(END, f"{self.session.sim.registers[reg_end]}") #This is to avoid a blank line at the end of the file.
 
     def table_edit(self, event):
         '''Opens the subwindow to edit individual registers'''
@@ -296,8 +286,8 @@ class GUI_Subwindows:
             formatted_input = input_out[1] #Gets the formatted input
             if not check_input: #If the input is invalid, the function returns
                 return
-            insta.registers[old_values[0]] = formatted_input #If the input is valid, the register is updated
-            control.refresh_table() #Refreshes the table
+            self.session.sim.registers.patch(int(old_values[0]), formatted_input) #If the input is valid, the register is updated (Rerun keeps the edit)
+            self.session.control.refresh_table() #Refreshes the table
             reg_window.destroy() #Closes the subwindow
 
         def validate_input(user_input):
@@ -332,46 +322,47 @@ class GUI_Subwindows:
         item = event.widget.item(item_id) #Gets the item from the id
         old_values = item['values'] #Gets the values from the item
         old_values[1] = item['text'] #Gets the text from the item
-        reg_window = Toplevel(window, bg=win_style.primarycolor) #Creates a subwindow
+        reg_window = Toplevel(self.session.window, bg=self.session.win_style.primarycolor) #Creates a subwindow
         reg_window.geometry("300x150") #Sets the size of the subwindow
-        edit_label = tk.Label(reg_window, bg=win_style.primarycolor, font=("Arial", 15), text=f"Edit Register {old_values[0]}:")
+        edit_label = tk.Label(reg_window, bg=self.session.win_style.primarycolor, font=("Arial", 15), text=f"Edit Register {old_values[0]}:")
         edit_label.pack(pady=(10, 0))
         edit_box = tk.Entry(reg_window, font=("Arial", 15)) #Creates a text box to enter the new value
         edit_box.insert(0, str(old_values[1])) #Inserts the old value into the text box
         edit_box.pack(pady = (10, 0))
-        edit_submit = tk.Button(reg_window, command=edit_submit, text="Save Register", font=("Courier", 15), border=5, width=15, bg=win_style.offcolor, fg='black') #Creates a button to submit the new value
+        edit_submit = tk.Button(reg_window, command=edit_submit, text="Save Register", font=("Courier", 15), border=5, width=15, bg=self.session.win_style.offcolor, fg='black') #Creates a button to submit the new value
         edit_submit.pack(pady=(10, 0))
 
     def new_window(self):
-        '''Opens a new window to run the program'''
-        subprocess.Popen(["python", "gui_app.py"])
+        '''Opens a new session window to run another program in the same process'''
+        self.session.app.new_session()
 
 
 class Style_Controller:
     '''Controls the program color scheme'''
-    def __init__(self):
+    def __init__(self, session):
+        self.session = session #Session whose window is styled
         self.offcolor = "#FFFFFF" #UVU white
         self.primarycolor='#4C721D' #UVU green
 
     def change_all_colors(self):
         '''Updates all the colors in the GUI'''
-        function_frame.configure(bg=self.primarycolor)
-        accumulator_frame.configure(bg=self.primarycolor)
-        accumulator_label.configure(bg=self.primarycolor)
-        accumulator_box.configure(bg=self.primarycolor)
-        input_frame.configure(bg=self.primarycolor)
-        button_frame.configure(bg=self.primarycolor)
-        run_btn.configure(background=self.offcolor)
-        open_file_btn.configure(background=self.offcolor)
-        input_label.configure(bg=self.primarycolor)
-        console_label.configure(bg=self.primarycolor)
-        user_messages.configure(bg=self.primarycolor)
-        newStyle.configure('My.TFrame', background=self.primarycolor)
+        self.session.function_frame.configure(bg=self.primarycolor)
+        self.session.accumulator_frame.configure(bg=self.primarycolor)
+        self.session.accumulator_label.configure(bg=self.primarycolor)
+        self.session.accumulator_box.configure(bg=self.primarycolor)
+        self.session.input_frame.configure(bg=self.primarycolor)
+        self.session.button_frame.configure(bg=self.primarycolor)
+        self.session.run_btn.configure(background=self.offcolor)
+        self.session.open_file_btn.configure(background=self.offcolor)
+        self.session.input_label.configure(bg=self.primarycolor)
+        self.session.console_label.configure(bg=self.primarycolor)
+        self.session.user_messages.configure(bg=self.primarycolor)
+        self.session.frame_style.configure(self.session.frame_style_name, background=self.primarycolor)
         
     def choose_color(self):
         '''Function will be called when button is clicked in window'''
-        user_color_primary = colorchooser.askcolor(title='choose a PRIMARY color')
-        user_color_secondary = colorchooser.askcolor(title='choose a SECONDARY color')
+        user_color_primary = colorchooser.askcolor(title='choose a PRIMARY color', parent=self.session.window)
+        user_color_secondary = colorchooser.askcolor(title='choose a SECONDARY color', parent=self.session.window)
         
         self.primarycolor = user_color_primary[1] #refers to the HEX value
         self.offcolor = user_color_secondary[1] #hex value
@@ -381,304 +372,368 @@ class Style_Controller:
 class Simulator_Controller:
     '''Holds all of the GUI simulator functions'''
 
-    def __init__(self):
-        self.current_addr = ''
+    #Instructions executed per batch and milliseconds between batches for each run speed.
+    #"Step" doesn't schedule the next batch, it waits for the Step command instead.
+    speeds = {"Step": (1, None), "Slow": (1, 250), "Max": (5000, 1)}
+    time_slice = 0.02 #Longest time in seconds a batch may hold the event loop before the window is redrawn
+
+    def __init__(self, session):
+        self.session = session #Session whose simulator is controlled
         self.error = False
         self.running_state = "idle"
         self.is_paused = False
+        self.after_id = None #Id of the next scheduled batch, used to cancel it
+        self.engine = None #Execution generator of the current batch, kept while it waits for input
+        self.pending_inputs = deque() #Extra words entered in the input box, used by the next READ instructions
+        self.recording = None #Inputs and outputs of the current run
+        self.last_recording = None #Recording of the last run that finished, saved from the File menu
+        self.cache_key = None #Key the result of the current run is cached under, None when it isn't cached
+        self.session.sim.read_input = self.read_pending #READ uses the words entered in advance before asking for input
+        self.session.sim.write_output = self.session.console.write_output #WRITE adds the word to the console, it's displayed on the next redraw
      
     def run_cancel_control(self):
             '''Controls behavior of the run/cancel button'''
-            if run_btn["text"] == 'Run': #If the program is not running the button will have its text set to "Run".
-                run_btn['text'] = "Cancel" #Changes the run button to have the cancel functionality
-                executemenu.entryconfigure(1, label="Cancel") #Changes menu button to cancel
-                run_btn['bg'] = 'red' #Changes button color to red
-                user_messages.config(text=f'Executing program...') #Informs the user that the program is running.
+            if self.session.run_btn["text"] == 'Run': #If the program is not running the button will have its text set to "Run".
+                self.session.run_btn['text'] = "Cancel" #Changes the run button to have the cancel functionality
+                self.session.executemenu.entryconfigure(1, label="Cancel") #Changes menu button to cancel
+                self.session.run_btn['bg'] = 'red' #Changes button color to red
+                self.session.user_messages.config(text=f'Executing program...') #Informs the user that the program is running.
                 self.running_state = "running"
+                self.error = False
                 self.run() #Triggers the simulator run
-            elif run_btn["text"] == 'Rerun': #It will run the program again with the current registers
-                run_btn['text'] = "Cancel" #Changes the run button to have the cancel functionality
-                executemenu.entryconfigure(1, label="Cancel") #Changes menu button to cancel
-                run_btn['bg'] = 'red' #Changes button color to red
-                user_messages.config(text=f'Executing program...') #Informs the user that the program is running.
-                insta.cur_addr = 0 #Brings the program to the start
+            elif self.session.run_btn["text"] == 'Rerun': #It will run the program again with the current registers
+                self.session.run_btn['text'] = "Cancel" #Changes the run button to have the cancel functionality
+                self.session.executemenu.entryconfigure(1, label="Cancel") #Changes menu button to cancel
+                self.session.run_btn['bg'] = 'red' #Changes button color to red
+                self.session.user_messages.config(text=f'Executing program...') #Informs the user that the program is running.
+                self.session.sim.restore() #Brings the registers, accumulator and address back to the loaded program, only the written registers are touched
+                self.session.control.refresh_table()
+                self.session.control.refresh_accumulator()
                 self.running_state = "running"
+                self.error = False
                 self.run() #Triggers the simulator run
             else: #If the button text is not "Run", it's "Cancel".
-                control.hide_input() #It will disable user input
-                sim_op.halt_console() #Triggers the GUI halt operations
+                self.cancel_batch() #Stops the next batch from running
+                self.session.control.hide_input() #It will disable user input
+                self.halt_console() #Triggers the GUI halt operations
        
     def run(self):
-        '''Runs each line of the simulator and calls the controller for the appropriate instructions'''
-        choice = True #Stops while loop if user aborts or halts
-        while insta.cur_addr < 250 and choice:
-            if insta.cur_addr == 249 and insta.registers[249] == "+000000": #this was 99 before
-                user_messages.config(text=f"Error: Entire register was executed and program was not halted.")
-                self.error = True
-                self.halt_console()
-                break
-            control.highlight_reg() #Highlights the register that is currently being executed
-            choice = self.controller(insta.registers[insta.cur_addr][1:4], insta.registers[insta.cur_addr][4:]) #Sends instruction code and address to controller
-            insta.cur_addr += 1 #Moves to next address
-        return
+        '''Starts the program execution, the instructions are executed in batches from the Tk event loop'''
+        self.is_paused = False
+        self.cancel_batch()
+        self.session.sim.fast_forward_loops = bool(self.session.fast_forward.get())
+        self.recording = Recording.start(self.session.sim) #Every word read and written is recorded
+        self.cache_key = None
+        if self.session.use_cache.get(): #A run that was cached before is answered without executing
+            self.cache_key = run_key(self.session.sim)
+            entry = self.session.app.results().get(self.cache_key)
+            if entry is not None:
+                self.replay(entry)
+                return
+        self.after_id = self.session.window.after(0, self.run_batch)
+
+    def replay(self, entry):
+        '''Shows a cached result as if the program had just run'''
+        self.cache_key = None #Already cached
+        entry.apply(self.session.sim)
+        for addr, word in entry.writes:
+            self.session.console.write_output(addr, word)
+        self.recording.writes.extend(entry.writes)
+        self.finish_batch(entry.result())
+
+    def step(self):
+        '''Executes the next instruction when the program is running in "Step" speed'''
+        if self.running_state == "running" and not self.is_paused and self.after_id is None:
+            self.run_batch()
+
+    def cancel_batch(self):
+        '''Cancels the next scheduled batch'''
+        if self.after_id is not None:
+            self.session.window.after_cancel(self.after_id)
+            self.after_id = None
+
+    def run_batch(self):
+        '''Runs a batch of instructions based on the selected run speed'''
+        self.after_id = None
+        if self.running_state != "running" or self.is_paused: #The program was cancelled or is waiting for input
+            return
+        batch_size = self.speeds[self.session.run_speed.get()][0]
+        #The batch stops after batch_size instructions or time_slice seconds to give the window a chance to process events such as Cancel.
+        self.engine = self.session.sim.execute(batch_size, self.time_slice, copy_registers=False) #The registers are shown from the simulator
+        self.advance(None)
 
-    def controller(self, instruction, addr):
-        '''It directs the simulator along with the desired address to the appropriate function based on the instruction'''
-        choice = True #True or false is returned by every function and stored in "choice" variable in order to determine if the program should continue or not.
-        if instruction not in insta.instructions:
-            #If it's not a valid instruction, it will inform the user then halt the program.
-            user_messages.config(text=f"Instruction '{insta.registers[insta.cur_addr]}' on address {insta.cur_addr} is invalid. Program was halted.")
-            self.error = True #Informs the GUI halt operations that the program wasn't executed properly
-            self.halt_console() #Triggers the GUI halt operations
-            choice = insta.halt() #Halts the program by setting choice to False
-        elif instruction == "000":
-            choice = True #Skips empty registers
-        elif instruction == "010":
-            choice = self.read_console(addr) 
-        elif instruction == "011":
-            choice = self.console_write(addr)
-        elif instruction == "020":
-            choice = insta.load(addr)
-            control.refresh_accumulator() #Updates the accumulator after operation
-        elif instruction == "021":
-            choice = insta.store(addr)
-            control.refresh_table()
-        elif instruction == "030":
-            choice = insta.add(addr)
-            control.refresh_accumulator() #Updates the accumulator after operation
-        elif instruction == "031":
-            choice = insta.subtract(addr)
-            control.refresh_accumulator() #Updates the accumulator after operation
-        elif instruction == "032":
-            choice = insta.divide(addr)
-            control.refresh_accumulator() #Updates the accumulator after operation
-        elif instruction == "033":
-            choice = insta.multiply(addr)
-            control.refresh_accumulator() #Updates the accumulator after operation
-        elif instruction == "040":
-            choice = insta.branch(addr)
-        elif instruction == "041":
-            choice = insta.branch_neg(addr)
-        elif instruction == "042":
-            choice = insta.branch_zero(addr)
-        elif instruction == "043":
-            choice = insta.halt()
+    def advance(self, word):
+        '''Sends the input word to the execution generator and runs it until it needs input again or the batch ends'''
+        try:
+            request = self.engine.send(word)
+        except StopIteration as stop:
+            self.engine = None
+            self.finish_batch(stop.value)
+        else:
+            self.wait_for_input(request[1])
+
+    def finish_batch(self, result):
+        '''Schedules the next batch or performs the halt operations, then redraws the GUI'''
+        delay = self.speeds[self.session.run_speed.get()][1]
+        self.session.control.highlight_addr = self.session.sim.last_addr #Highlights the last instruction executed
+        if self.recording is not None and result.halt_reason != STEP_LIMIT: #The run is over
+            sim = self.session.sim
+            recording = self.last_recording = self.recording
+            recording.finish(sim, result)
+            self.recording = None
+            if self.cache_key is not None and not recording.inputs: #Runs that read input depend on what the user typed
+                self.session.app.results().put(self.cache_key, CachedRun(result.halt_reason, recording.steps, sim.acc, list(sim.registers.words),
+                                                                          sim.cur_addr, result.error_message, recording.writes, sim.last_addr))
+            self.cache_key = None
+        if result.halt_reason == STEP_LIMIT: #The batch ended but the program is still running
+            if delay is not None:
+                self.after_id = self.session.window.after(delay, self.run_batch)
+        elif result.halt_reason == HALTED:
             self.halt_console() #Triggers the GUI halt operations
-        
-        if instruction != "043" and not choice and not self.is_paused:
-            user_messages.config(text=insta.error_message) #Displays error message")
+        else:
+            self.session.user_messages.config(text=result.error_message) #Displays error message
             self.error = True #Informs the GUI halt operations that the program wasn't executed properly
             self.halt_console() #Triggers the GUI halt operations
+        if self.after_id is None or delay >= self.session.control.frame_interval: #Stopped or slow enough to draw every batch
+            self.session.control.render()
+        else:
+            self.session.control.request_render()
 
-        return choice
-    
-    def read_console(self, addr):
+    def wait_for_input(self, addr):
         '''Prepares GUI to accept user input.'''
-        if int(addr) > insta.register_size: #Checks if the address is valid.
-            insta.error_message = f"Invalid address: {addr}, the register address must be between 0 and 249."
-            return False
-        self.current_addr = addr #Stores the current address to be used by submit_input function
-        console_box.config(state='normal') #Text had to be enabled to be changed.
-        console_box.insert(END, f'Enter a positive or negative 6 digit number into memory register {addr}, then press the submit button (ex: +012034 or -043021): ')
-        console_box.see(END) #Scrolls the console down
-        console_box.config(state='disabled') #Disables the text box after modifications.
-        control.show_input() #Enables the user input
+        self.session.console.prompt(addr)
+        self.session.control.show_input() #Enables the user input
         self.is_paused = True #Pauses the program
-        return False #Sets choice to false in order to wait for input submission before moving to next instruction.
-
-    def submit_input(self):
-        '''Submits the user input to be loaded into memory'''
-        user_input = input_box.get() #Retrieves information from user input box
-        #From this point down, we validate and format the user input to be stored properly in the registers.
+        self.session.control.highlight_addr = self.session.sim.last_addr #Highlights the READ instruction
+        self.session.control.render()
+
+    def read_pending(self, addr):
+        '''Returns the next word entered in advance, or None to ask the user for input.'''
+        if not self.pending_inputs:
+            return None
+        word = self.pending_inputs.popleft()
+        self.session.console.input_entered(addr, word) #Records the user input in the console
+        return word
+
+    def format_input(self, user_input):
+        '''Validates a word entered by the user and adds the sign if needed, returns None if it's invalid.'''
         #If user entered a positive value or "000000" without a +, it will be added. And it will check if entered a 6 digit number.
-        #Negative values must be entered with a - to be valid. Validated and formated input will be stored in formatted_input.
-        success = False #Informs program if execution was successful in order to display appropriate user messages
+        #Negative values must be entered with a - to be valid.
         try:
-            if len(user_input) == 0: #Error is displayed if no input is entered
-                user_messages.config(text="No input. Please enter a valid positive or negative 6 digit number.")
-                input_box.delete(0, END) #Clears the user input box
-            elif user_input[0] == "-" or user_input[0] == "+": #It first checks if a operation sign is present.
+            if user_input[0] == "-" or user_input[0] == "+": #It first checks if a operation sign is present.
                 if len(user_input) == 7: #If it is, it checks if the number is 6 digits long with sign.
                     _user_int = int(user_input) #If it can't parse, it's not a number. A ValueError is raised.
-                    insta.console_memory = user_input #Sets the console memory to be read by the simulator read function
-                    insta.read(self.current_addr) #Triggers the simulator read function.
-                    console_box.config(state='normal') #Text had to be enabled to be changed.
-                    console_box.insert(END, f'{user_input}\n\n') #Records the user input in the console
-                    console_box.see(END) #Scrolls the console down
-                    console_box.config(state='disabled') #Disables the text box after modifications.
-                    input_box.delete(0, END) #Clears the user input
-                    success = True #Sets success to true to inform program that execution was sucessfull.
-                else: #Triggers error if there's more than 6 digits after operator sign.
-                    user_messages.config(text="Invalid input. Please enter a valid positive or negative 6 digit number.")
-                    input_box.delete(0, END) #Clears the user input box
+                    return user_input
             elif int(user_input) == 0: #If 000000 is entered without a sign, we return it with the + sign..
-                insta.console_memory = f"+000000" #We add the plus sign and add it to the console memory.
-                insta.read(self.current_addr) #Triggers the simulator read function
-                console_box.config(state='normal') #Text had to be enabled to be changed.
-                console_box.insert(END, f'+000000\n\n') #Records the user input in the console
-                console_box.see(END) #Scrolls the console down
-                console_box.config(state='disabled') #Disables the text box after modifications.
-                input_box.delete(0, END) #Clears the user input
-                success = True #Sets success to true to inform program that execution was sucessfull.
-            elif len(user_input) == 6:
-                _user_int = int(user_input) #if it's 6 digits long and it can parse, it's a valid positive number.
-                insta.console_memory = f"+{user_input}" #We add the plus sign and add it to the console memory.
-                insta.read(self.current_addr) #Triggers the simulator read function
-                console_box.config(state='normal') #Text had to be enabled to be changed.
-                console_box.insert(END, f'+{user_input}\n\n') #Records the user input in the console
-                console_box.see(END) #Scrolls the console down
-                console_box.config(state='disabled') #Disables the text box after modifications.
-                input_box.delete(0, END) #Clears the user input
-                success = True #Sets success to true to inform program that execution was sucessfull.
-            else: #Triggers an error if none of the conditions above are met.
-                user_messages.config(text="Invalid input. Please enter a valid positive or negative 6 digit number.")
-                input_box.delete(0, END) #Clears the user input
-        except ValueError: #If number fails to parse, it will trigger this error
-            user_messages.config(text="Invalid input. Please enter a valid positive or negative 6 digit number.")
-            input_box.delete(0, END)
-
-        if success: #If operation is sucessfully executed, program continues to run
-            control.hide_input() #Disables user input
-            user_messages.config(text="Executing program...") #Informs the user that the program is running again.
-            control.refresh_table() #Updates the GUI register table
-            self.run() #Resumes the program execution
-        #If it was not sucessfull, function returns and waits for another input after displaying error message.
-    
-    def console_write(self, addr):
-        '''Writes to the console the value from the register specified.'''
-        if int(addr) > insta.register_size: #Checks if the address is valid.
-            insta.error_message = f"Invalid address: {addr}, the register address must be between 0 and 249."
-            return False
-        console_box.config(state='normal') #Text had to be enabled to be changed.
-        console_box.insert(END, f"Value from register {addr}: {insta.registers[int(addr)]}\n\n") #Displays the value from the register to console
-        console_box.see(END) #Scrolls the console down
-        console_box.config(state='disabled') #Disables the text box after modifications.
-        return True #Continues program execution
+                return "+000000"
+            elif len(user_input) == 6: #if it's 6 digits long and it can parse, it's a valid positive number.
+                return f"+{user_input}"
+        except ValueError: #If number fails to parse, it's invalid
+            pass
+        return None
+
+    def submit_input(self):
+        '''Submits the user input to be loaded into memory'''
+        #Several words can be entered separated by spaces or commas, the extra words are used by the next READ instructions.
+        user_words = self.session.input_box.get().replace(",", " ").split() #Retrieves information from user input box
+        self.session.input_box.delete(0, END) #Clears the user input box
+        if not user_words: #Error is displayed if no input is entered
+            self.session.user_messages.config(text="No input. Please enter a valid positive or negative 6 digit number.")
+            return
+        formatted_words = [self.format_input(user_input) for user_input in user_words]
+        if None in formatted_words: #If it was not sucessfull, function returns and waits for another input after displaying error message.
+            self.session.user_messages.config(text="Invalid input. Please enter a valid positive or negative 6 digit number.")
+            return
+        self.session.console.answer(formatted_words[0]) #Records the user input in the console
+        self.pending_inputs.extend(formatted_words[1:])
+        self.session.control.hide_input() #Disables user input
+        self.session.user_messages.config(text="Executing program...") #Informs the user that the program is running again.
+        self.is_paused = False
+        self.advance(formatted_words[0]) #Resumes the program execution in place
     
     def halt_console(self):
         '''Performs all of the GUI operations necessary after halting.'''
-        console_box.config(state='normal') #Text had to be enabled to be changed.
-        console_box.insert(END, f"-----------------------Program has halted----------------------\n\n")
-        console_box.see(END) #Scrolls the console down
-        console_box.config(state='disabled') #Disables the text box after modifications.
+        self.session.console.halted()
+        self.session.control.flush_console() #The halt message is shown right away, even when the run was cancelled
         #Enables the Open file, Reset Memory, and Clear Console buttons after program execution.
         #Sets the "Cancel" button back to "Run" functionality
-        run_btn["text"] = "Rerun"
-        executemenu.entryconfigure(1, label="Rerun") #Changes menu button to rerun
-        run_btn['bg'] = 'dodgerblue3'
+        self.session.run_btn["text"] = "Rerun"
+        self.session.executemenu.entryconfigure(1, label="Rerun") #Changes menu button to rerun
+        self.session.run_btn['bg'] = 'dodgerblue3'
         self.running_state = "idle"
+        self.cancel_batch()
+        if self.engine is not None: #Drops the generator that was waiting for input
+            self.engine.close()
+            self.engine = None
+        self.pending_inputs.clear()
+        if self.recording is not None: #The run was cancelled, it can't be replayed
+            self.recording.stop(self.session.sim)
+            self.recording = None
         if self.error == False: #If not errors on halting, informs the user that program executed sucessfully
-            user_messages.config(text="Program executed sucessfully.")
+            self.session.user_messages.config(text="Program executed sucessfully.")
         #If there was an error, an error message will already be displaying.
 
-'''Initial GUI render'''
-
-#Initiates all of the class instances
-insta = Simulator()
-control = GUI_Controller()
-sub_windows = GUI_Subwindows()
-sim_op = Simulator_Controller()
-win_style = Style_Controller()
-
-#Creates the window containing the program GUI
-window = tk.Tk()
-window.title("Project Blackbox")
-window.geometry("1000x800")
-window.resizable(False, False)
-window.protocol('WM_DELETE_WINDOW', control.terminate) # calls control.terminate() when window is closed
-
-window.iconbitmap('icon.ico') #Sets the window icon
-
-menubar = Menu(window)
-filemenu = Menu(menubar, tearoff=0)
-filemenu.add_command(label="Open new window", command=sub_windows.new_window)
-filemenu.add_command(label="Load instructions", command=sub_windows.load_instructions)
-filemenu.add_command(label="Save", command=control.save_file)
-filemenu.add_command(label="Save as...", command=control.save_as)
-menubar.add_cascade(label="File", menu=filemenu)
-executemenu = Menu(menubar, tearoff=0)
-executemenu.add_command(label="Run", command=sim_op.run_cancel_control)
-executemenu.add_command(label="Clear console", command=control.clear_console)
-executemenu.add_command(label="Clear registers", command=control.reset_memory)
-executemenu.add_command(label="Clear console", command=control.clear_console)
-menubar.add_cascade(label="Execution", menu=executemenu)
-stylemenu = Menu(menubar, tearoff=0)
-stylemenu.add_command(label="Change color scheme", command=win_style.choose_color)
-menubar.add_cascade(label="Style", menu=stylemenu)
-window.config(menu=menubar)
-
-#Creates and populates the GUI register table
-register_frame = ttk.Frame(window, border=20) #Frame containing the GUI register 
-register_frame.pack(fill='y', side=tk.LEFT)
-newStyle = ttk.Style()
-newStyle.configure('My.TFrame', background=win_style.primarycolor)
-register_frame.config(style='My.TFrame')
-
-reg_table = ttk.Treeview(register_frame, selectmode ='browse', padding=2) #GUI register table
-
-reg_table.pack(side ='left', fill="y")
-
-reg_scroll = ttk.Scrollbar(register_frame,
-						orient =tk.VERTICAL,
-						command = reg_table.yview) #Scrollbar for the register table
-
-reg_scroll.pack(side ='right', fill ="y")
+class GUI_Session:
+    '''One program window with its own simulator, file, console and register table.'''
+    def __init__(self, app, number):
+        self.app = app #Application holding the other sessions
+        #Initiates all of the class instances of the session
+        self.sim = Simulator()
+        self.console = ConsoleSink(word_digits=self.sim.registers.word_digits) #Console text of the runs, displayed once per redraw
+        self.control = GUI_Controller(self)
+        self.sub_windows = GUI_Subwindows(self)
+        self.sim_op = Simulator_Controller(self)
+        self.win_style = Style_Controller(self)
+        self.frame_style_name = f"Session{number}.TFrame" #Every session has its own frame style so color changes stay in its window
+        self.build_window()
+
+    def build_window(self):
+        '''Creates the window containing the session GUI'''
+        win_style = self.win_style
+        self.window = Toplevel(self.app.root)
+        self.window.title("Project Blackbox")
+        self.window.geometry("1000x800")
+        self.window.resizable(False, False)
+        self.window.protocol('WM_DELETE_WINDOW', self.control.terminate) # calls control.terminate() when window is closed
 
-reg_table.configure(yscrollcommand = reg_scroll.set)
-
-reg_table["columns"] = ("1", "2")
-
-reg_table['show'] = 'headings'
-
-reg_table.column("1", width = 60, anchor ='c')
-reg_table.column("2", width = 300, anchor ='c')
-
-reg_table.heading("1", text ="Register")
-reg_table.heading("2", text ="Value")
-
-reg_table.bind("<Double-Button-1>", sub_windows.table_edit)
-
-control.update_table()
-
-#Creates all the other GUI items to the right of the GUI register table
-function_frame = tk.Frame(window, bg =win_style.primarycolor) 
-function_frame.pack(side='right', fill='y')
-
-accumulator_frame = tk.Frame(function_frame, background=win_style.primarycolor) #Frame containing the accumulator display
-accumulator_frame.pack(side="top", pady=(20,0))
-
-accumulator_label = tk.Label(accumulator_frame, text="Accumulator: ", font=("Arial", 20), bg=win_style.primarycolor) #Accumulator title
-accumulator_label.pack(side="left")
-accumulator_box = tk.Entry(accumulator_frame, font=("Arial", 20), width=8, bg=win_style.primarycolor) #Accumulator display
-accumulator_box.pack(side="right")
-
-accumulator_box.insert(END, insta.accumulator) #Populates the accumulator
-accumulator_box['state'] = 'readonly'
-
-input_frame = tk.Frame(function_frame, bg=win_style.primarycolor) #Frame containing console and user input
-input_frame.pack(side='top')
-
-console_label = tk.Label(input_frame, text="Console:", font=("Arial", 10), bg=win_style.primarycolor) #Console title
-console_label.pack(side='top', padx = 20, pady = (10, 5), anchor="w")
-console_box = tk.Text(input_frame, state='disabled', wrap="word", height=18) #Console box
-console_box.pack(side='top', anchor='ne', padx = 20, pady = (0, 20))
-
-input_label = tk.Label(input_frame, text="User input:", font=("Arial", 10), bg=win_style.primarycolor) #Input title
-input_label.pack(padx = 20, pady = (0, 10))
-input_box = tk.Entry(input_frame, font=("Arial", 15), state="disabled") #Input box
-input_box.pack(pady = (0, 10))
-submit_input = tk.Button(input_frame, text="Submit Input", font=("Arial", 10), state='disabled', command=sim_op.submit_input, fg='black', bg=win_style.offcolor) #Input submit button
-submit_input.pack(pady = (0, 10))
-
-user_messages = tk.Label(input_frame, font=("Arial", 15), text="Load instructions to execute.", wraplength="400", bg=win_style.primarycolor) #Text for messages directed to the user.
-user_messages.pack(pady=(5, 10))
-
-button_frame = tk.Frame(function_frame, background=win_style.primarycolor) #Frame containing all the buttons
-button_frame.pack(side='bottom', anchor='c', fill='y', pady=(0, 70))
+        try:
+            self.window.iconbitmap(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'icon.ico')) #Sets the window icon
+        except tk.TclError: #.ico files are only supported on Windows
+            pass
+
+        self.menubar = Menu(self.window)
+        self.filemenu = Menu(self.menubar, tearoff=0)
+        self.filemenu.add_command(label="Open new window", command=self.sub_windows.new_window)
+        self.filemenu.add_command(label="Load instructions", command=self.sub_windows.load_instructions)
+        self.filemenu.add_command(label="Save", command=self.control.save_file)
+        self.filemenu.add_command(label="Save as...", command=self.control.save_as)
+        self.filemenu.add_command(label="Save run recording...", command=self.control.save_recording)
+        self.menubar.add_cascade(label="File", menu=self.filemenu)
+        self.executemenu = Menu(self.menubar, tearoff=0)
+        self.executemenu.add_command(label="Run", command=self.sim_op.run_cancel_control)
+        self.executemenu.add_command(label="Clear console", command=self.control.clear_console)
+        self.executemenu.add_command(label="Clear registers", command=self.control.reset_memory)
+        self.executemenu.add_command(label="Clear console", command=self.control.clear_console)
+        self.executemenu.add_command(label="Step (F10)", command=self.sim_op.step)
+        self.use_cache = tk.BooleanVar(self.window, value=False) #Runs are answered from the result cache when nothing changed
+        self.executemenu.add_checkbutton(label="Cache results", variable=self.use_cache)
+        self.fast_forward = tk.BooleanVar(self.window, value=False) #Counting loops skip their iterations, each batch still stops at its instruction count
+        self.executemenu.add_checkbutton(label="Fast-forward loops", variable=self.fast_forward)
+        self.menubar.add_cascade(label="Execution", menu=self.executemenu)
+        self.run_speed = tk.StringVar(self.window, value="Max") #Selected run speed, see Simulator_Controller.speeds
+        self.speedmenu = Menu(self.menubar, tearoff=0)
+        self.speedmenu.add_radiobutton(label="Step", variable=self.run_speed, value="Step")
+        self.speedmenu.add_radiobutton(label="Slow", variable=self.run_speed, value="Slow")
+        self.speedmenu.add_radiobutton(label="Max", variable=self.run_speed, value="Max")
+        self.menubar.add_cascade(label="Speed", menu=self.speedmenu)
+        self.window.bind("<F10>", lambda event: self.sim_op.step())
+        self.stylemenu = Menu(self.menubar, tearoff=0)
+        self.stylemenu.add_command(label="Change color scheme", command=win_style.choose_color)
+        self.menubar.add_cascade(label="Style", menu=self.stylemenu)
+        self.window.config(menu=self.menubar)
+
+        #Creates and populates the GUI register table
+        self.register_frame = ttk.Frame(self.window, border=20) #Frame containing the GUI register
+        self.register_frame.pack(fill='y', side=tk.LEFT)
+        self.frame_style = ttk.Style()
+        self.frame_style.configure(self.frame_style_name, background=win_style.primarycolor)
+        self.register_frame.config(style=self.frame_style_name)
+
+        self.reg_table = ttk.Treeview(self.register_frame, selectmode ='browse', padding=2) #GUI register table
+        self.reg_table.pack(side ='left', fill="y")
+        self.reg_scroll = ttk.Scrollbar(self.register_frame, orient =tk.VERTICAL, command = self.reg_table.yview) #Scrollbar for the register table
+        self.reg_scroll.pack(side ='right', fill ="y")
+        self.reg_table.configure(yscrollcommand = self.reg_scroll.set)
+        self.reg_table["columns"] = ("1", "2")
+        self.reg_table['show'] = 'headings'
+        self.reg_table.column("1", width = 60, anchor ='c')
+        self.reg_table.column("2", width = 300, anchor ='c')
+        self.reg_table.heading("1", text ="Register")
+        self.reg_table.heading("2", text ="Value")
+        self.reg_table.bind("<Double-Button-1>", self.sub_windows.table_edit)
+
+        self.control.update_table()
+
+        #Creates all the other GUI items to the right of the GUI register table
+        self.function_frame = tk.Frame(self.window, bg =win_style.primarycolor)
+        self.function_frame.pack(side='right', fill='y')
+
+        self.accumulator_frame = tk.Frame(self.function_frame, background=win_style.primarycolor) #Frame containing the accumulator display
+        self.accumulator_frame.pack(side="top", pady=(20,0))
+
+        self.accumulator_label = tk.Label(self.accumulator_frame, text="Accumulator: ", font=("Arial", 20), bg=win_style.primarycolor) #Accumulator title
+        self.accumulator_label.pack(side="left")
+        self.accumulator_box = tk.Entry(self.accumulator_frame, font=("Arial", 20), width=8, bg=win_style.primarycolor) #Accumulator display
+        self.accumulator_box.pack(side="right")
+
+        self.accumulator_box.insert(END, self.sim.accumulator) #Populates the accumulator
+        self.accumulator_box['state'] = 'readonly'
+
+        self.input_frame = tk.Frame(self.function_frame, bg=win_style.primarycolor) #Frame containing console and user input
+        self.input_frame.pack(side='top')
+
+        self.console_label = tk.Label(self.input_frame, text="Console:", font=("Arial", 10), bg=win_style.primarycolor) #Console title
+        self.console_label.pack(side='top', padx = 20, pady = (10, 5), anchor="w")
+        self.console_box = tk.Text(self.input_frame, state='disabled', wrap="word", height=18) #Console box
+        self.console_box.pack(side='top', anchor='ne', padx = 20, pady = (0, 20))
+
+        self.input_label = tk.Label(self.input_frame, text="User input:", font=("Arial", 10), bg=win_style.primarycolor) #Input title
+        self.input_label.pack(padx = 20, pady = (0, 10))
+        self.input_box = tk.Entry(self.input_frame, font=("Arial", 15), state="disabled") #Input box
+        self.input_box.pack(pady = (0, 10))
+        self.submit_input = tk.Button(self.input_frame, text="Submit Input", font=("Arial", 10), state='disabled', command=self.sim_op.submit_input, fg='black', bg=win_style.offcolor) #Input submit button
+        self.submit_input.pack(pady = (0, 10))
+
+        self.user_messages = tk.Label(self.input_frame, font=("Arial", 15), text="Load instructions to execute.", wraplength="400", bg=win_style.primarycolor) #Text for messages directed to the user.
+        self.user_messages.pack(pady=(5, 10))
+
+        self.button_frame = tk.Frame(self.function_frame, background=win_style.primarycolor) #Frame containing all the buttons
+        self.button_frame.pack(side='bottom', anchor='c', fill='y', pady=(0, 70))
+
+        self.open_file_btn = tk.Button(self.button_frame, text="Load Instructions", font=("Courier", 20), command=self.sub_windows.load_instructions, border=5, width=20, bg=win_style.offcolor, fg='black') #Button to open file
+        self.open_file_btn.pack(side='top', pady=(0, 10))
+        self.run_btn = tk.Button(self.button_frame, font=("Courier", 20), command=self.sim_op.run_cancel_control, text="Run", border=5, width=20, bg=win_style.offcolor, fg='black') #Button to run and cancel the program execution, can use disabledforeground to make text more readable in needed
+        self.run_btn.pack(side='bottom', pady=(10, 0))
+
+class GUI_App:
+    '''Holds the Tk root and the open sessions, every program window runs in this process.'''
+    def __init__(self):
+        self.root = tk.Tk() #Hidden root, the sessions are its Toplevel windows so closing one doesn't close the others
+        self.root.withdraw()
+        self.sessions = [] #Open sessions
+        self.opened_count = 0 #Sessions opened since the start, used to name their styles
+        self.new_file_count = 0 #Number of programs loaded without a file, used to name them in the title.
+        self.result_cache = None #Results of the runs of every session, opened the first time a session uses it
+
+    def results(self):
+        '''Returns the result cache shared by the sessions.'''
+        if self.result_cache is None:
+            try:
+                self.result_cache = ResultCache(DEFAULT_DIRECTORY)
+            except OSError: #The directory can't be created, the results are only kept in memory
+                self.result_cache = ResultCache()
+        return self.result_cache
+
+    def new_session(self):
+        '''Opens a new session window and returns it.'''
+        self.opened_count += 1
+        session = GUI_Session(self, self.opened_count)
+        self.sessions.append(session)
+        return session
+
+    def close_session(self, session):
+        '''Closes the session window, the application ends with the last one.'''
+        self.sessions.remove(session)
+        session.window.destroy()
+        if not self.sessions:
+            self.root.destroy()
+
+    def mainloop(self):
+        self.root.mainloop()
 
-open_file_btn = tk.Button(button_frame, text="Load Instructions", font=("Courier", 20), command=sub_windows.load_instructions, border=5, width=20, bg=win_style.offcolor, fg='black') #Button to open file
-open_file_btn.pack(side='top', pady=(0, 10))
-run_btn = tk.Button(button_frame, font=("Courier", 20), command=sim_op.run_cancel_control, text="Run", border=5, width=20, bg=win_style.offcolor, fg='black') #Button to run and cancel the program execution, can use disabledforeground to make text more readable in needed
-run_btn.pack(side='bottom', pady=(10, 0))
+'''Initial GUI render'''
 
-window.mainloop() #Triggers the GUI initialization
+if __name__ == "__main__": #The window is only shown when the script is executed, importing the module doesn't create any window
+    app = GUI_App()
+    app.new_session()
+    app.mainloop() #Triggers the GUI initialization
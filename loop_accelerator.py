@@ -0,0 +1,322 @@
+'''
+Project Blackbox - Loop Accelerator
+
+Fast-forwards counting and delay loops. When the program branches back to an address, the loop starting there
+is traced once: every instruction of one iteration is executed symbolically, keeping the accumulator and the
+registers it stores into as linear expressions of their values when the iteration started. Loops that only
+LOAD, STORE, ADD, SUBTRACT, MULTIPLY by a register they never write, and branch (no READ, WRITE, DIVIDE or
+HALT, and no STORE into their own instructions) are summarized as state = M * state + b.
+
+When M * M = M and M * b = b (the loop counts: every iteration adds the same amounts, possibly after copying
+registers into each other), the state after j more iterations is state + j * b. Every branch condition and
+every arithmetic result of the iteration is then a linear function of j, so the number of iterations that
+take the same path without overflowing is found in closed form, and those iterations are skipped at once.
+The iteration where a branch goes the other way or an ADD/SUBTRACT/MULTIPLY would overflow is executed
+normally, so the results, the error messages and the instruction count are exactly the same as stepping.
+
+With Simulator.detect_loops the loop detection is run over the skipped iterations as if they were stepped, so a
+loop inside a loop that never ends is still found. Loops that would never end are stepped for the detection to
+find them.
+
+Loops that can't be summarized are remembered, and the summary is forgotten when one of the instructions of
+the loop is written (see Registers.drop_code).
+
+Usage:
+
+sim = Simulator(fast_forward_loops=True)
+python -m simulator run --fast-forward program.txt
+'''
+
+from array import array
+from simulator import PagedWords, PAGE_SIZE, LOOP_DETECTED
+
+INFINITE = float("inf")
+MAX_LOOP_LENGTH = 256 #Longest iteration traced, longer loops are stepped
+MAX_RETRACES = 8 #Times a loop is traced again after taking another path before it's always stepped
+ACCUMULATOR = -1 #Variable of the accumulator in the expressions, the registers are their address
+#Instructions a loop may contain: EMPTY, LOAD, STORE, ADD, SUBTRACT, MULTIPLY and the branches.
+TRACED_CODES = (0, 20, 21, 30, 31, 33, 40, 41, 42)
+
+#Conditions checked in every iteration
+IN_RANGE = "in_range" #The arithmetic result fits in a word
+NEGATIVE = "negative" #BRANCHNEG is taken
+NOT_NEGATIVE = "not_negative" #BRANCHNEG is not taken
+ZERO = "zero" #BRANCHZERO is taken
+NOT_ZERO = "not_zero" #BRANCHZERO is not taken
+
+'''Linear expressions, (constant, {variable: coefficient})'''
+
+def variable(var):
+    return (0, {var: 1})
+
+def combine(left, right, sign=1):
+    '''Returns left + sign * right.'''
+    coefficients = dict(left[1])
+    for var, coefficient in right[1].items():
+        coefficients[var] = coefficients.get(var, 0) + sign * coefficient
+    return (left[0] + sign * right[0], {var: coefficient for var, coefficient in coefficients.items() if coefficient})
+
+def scale(expression, factor):
+    if factor == 0:
+        return (0, {})
+    return (expression[0] * factor, {var: coefficient * factor for var, coefficient in expression[1].items()})
+
+def substitute(expression, values):
+    '''Replaces the variables that have a value with it.'''
+    constant = expression[0]
+    coefficients = {}
+    for var, coefficient in expression[1].items():
+        if var in values:
+            constant += coefficient * values[var]
+        else:
+            coefficients[var] = coefficient
+    return (constant, coefficients)
+
+def repeat_count(start, step, condition, word_max):
+    '''Number of consecutive iterations j = 0, 1, 2... where the condition holds for start + j * step.'''
+    if condition == IN_RANGE:
+        if start > word_max or start < -word_max:
+            return 0
+        if step == 0:
+            return INFINITE
+        return (word_max - start) // step + 1 if step > 0 else (start + word_max) // -step + 1
+    if condition == NEGATIVE:
+        if start >= 0:
+            return 0
+        return INFINITE if step <= 0 else (-start + step - 1) // step
+    if condition == NOT_NEGATIVE:
+        if start < 0:
+            return 0
+        return INFINITE if step >= 0 else start // -step + 1
+    if condition == ZERO:
+        if start != 0:
+            return 0
+        return INFINITE if step == 0 else 1
+    if start == 0: #NOT_ZERO
+        return 0
+    if step == 0 or (start > 0) == (step > 0) or start % step != 0: #Moves away from 0 or jumps over it
+        return INFINITE
+    return -start // step
+
+'''Loop Summary Class'''
+class LoopSummary:
+    '''One iteration of a loop as state = M * state + b, the state is the accumulator and the registers it stores into.'''
+    __slots__ = ("head", "length", "tail", "checked_at_head", "registers", "matrix", "offsets", "checks", "guards", "retraces")
+
+    def __init__(self, head, length, registers, matrix, offsets, checks, guards, tail=None, checked_at_head=True):
+        self.head = head #Address the loop branches back to
+        self.length = length #Instructions executed by one iteration
+        self.tail = tail #Address of the branch that ends the iteration
+        #The branch back to head is the only backward branch of the iteration, so the loop detection (which runs on
+        #every backward branch) only sees the states at head.
+        self.checked_at_head = checked_at_head
+        self.registers = registers #Registers of the state after the accumulator, in ascending order
+        self.matrix = matrix #M, rows of coefficients of the state at the start of the iteration
+        self.offsets = offsets #b, added to the state by every iteration
+        #(constant, coefficients, step, condition) of every value the iteration checks, the value of iteration j
+        #is constant + coefficients * state + j * step.
+        self.checks = checks
+        self.guards = guards #Registers read but never written -> word they held when the loop was traced
+        self.retraces = 0 #Times the loop was traced again because it took another path
+
+def trace_loop(sim, head):
+    '''Executes one iteration of the loop starting at head symbolically.
+    Returns (LoopSummary or None if the loop can't be fast-forwarded, addresses of the instructions traced).'''
+    registers = sim.registers
+    words = registers.words
+    base = registers.address_base
+    last_register = sim.register_size
+    acc = variable(ACCUMULATOR)
+    stored = {} #Register -> expression of the word stored into it
+    fixed = set() #Registers used as a MULTIPLY factor, the loop can only be summarized if they're never written
+    checks = [] #(expression, condition)
+    path = []
+    backward_branches = 0
+
+    def value(expression):
+        '''Value of the expression with the current state.'''
+        return expression[0] + sum(coefficient * (sim.acc if var == ACCUMULATOR else words[var]) for var, coefficient in expression[1].items())
+
+    addr = head
+    while True:
+        if len(path) == MAX_LOOP_LENGTH or addr > last_register or (addr == last_register and words[addr] == 0):
+            return (None, path)
+        code, operand = abs(words[addr]) // base, abs(words[addr]) % base
+        if code not in TRACED_CODES or (code != 0 and operand > last_register):
+            return (None, path)
+        path.append(addr)
+        next_addr = addr + 1
+        if code == 20:
+            acc = stored.get(operand) or variable(operand)
+        elif code == 21:
+            stored[operand] = acc
+        elif code in (30, 31):
+            acc = combine(acc, stored.get(operand) or variable(operand), 1 if code == 30 else -1)
+            checks.append((acc, IN_RANGE))
+        elif code == 33:
+            factor = stored.get(operand)
+            if factor is None: #The word the register holds now, it must never be written for the loop to be summarized
+                fixed.add(operand)
+                acc = scale(acc, words[operand])
+            elif not factor[1]:
+                acc = scale(acc, factor[0])
+            elif not acc[1]:
+                acc = scale(factor, acc[0])
+            else: #The product of two variables isn't linear
+                return (None, path)
+            checks.append((acc, IN_RANGE))
+        elif code == 40:
+            next_addr = operand
+        elif code == 41:
+            taken = value(acc) < 0
+            checks.append((acc, NEGATIVE if taken else NOT_NEGATIVE))
+            if taken:
+                next_addr = operand
+        elif code == 42:
+            taken = value(acc) == 0
+            checks.append((acc, ZERO if taken else NOT_ZERO))
+            if taken:
+                next_addr = operand
+        if next_addr <= addr:
+            backward_branches += 1
+        if next_addr == head:
+            checked_at_head = backward_branches == 1 and next_addr <= addr
+            break
+        addr = next_addr
+    if not stored.keys().isdisjoint(path) or not fixed.isdisjoint(stored): #The loop changes its own instructions or factors
+        return (None, path)
+
+    #Registers that are read but never written keep their word, they're replaced by it and checked before fast-forwarding.
+    state = [ACCUMULATOR] + sorted(stored)
+    outputs = [acc] + [stored[register] for register in state[1:]]
+    guards = {register: words[register] for register in fixed}
+    for expression in outputs + [expression for expression, condition in checks]:
+        for var in expression[1]:
+            if var != ACCUMULATOR and var not in stored:
+                guards[var] = words[var]
+    outputs = [substitute(expression, guards) for expression in outputs]
+    checks = [(substitute(expression, guards), condition) for expression, condition in checks]
+
+    matrix = [[expression[1].get(var, 0) for var in state] for expression in outputs]
+    offsets = [expression[0] for expression in outputs]
+    size = len(state)
+    for row in range(size):
+        if any(sum(matrix[row][k] * matrix[k][column] for k in range(size)) != matrix[row][column] for column in range(size)):
+            return (None, path) #M * M != M, the state doesn't change by the same amount every iteration
+        if sum(matrix[row][k] * offsets[k] for k in range(size)) != offsets[row]:
+            return (None, path)
+    summary_checks = []
+    for expression, condition in checks:
+        coefficients = [expression[1].get(var, 0) for var in state]
+        step = sum(coefficient * offset for coefficient, offset in zip(coefficients, offsets))
+        summary_checks.append((expression[0], coefficients, step, condition))
+    return (LoopSummary(head, len(path), state[1:], matrix, offsets, summary_checks, guards, path[-1], checked_at_head), path)
+
+def fast_forward_loop(sim, head, budget):
+    '''Skips the iterations of the loop starting at head that are known to take the same path without an error,
+    at most budget instructions. Returns the number of instructions skipped.'''
+    registers = sim.registers
+    words = registers.words
+    summary = registers.loops.get(head, False)
+    if summary is False:
+        summary, path = trace_loop(sim, head)
+        registers.add_loop(head, summary, path)
+    if summary is None:
+        return 0
+    state = [sim.acc] + [words[register] for register in summary.registers]
+    if any(words[register] != word for register, word in summary.guards.items()):
+        iterations = 0
+    else:
+        for row, value in zip(summary.matrix, state): #The state must be one the loop reaches (M * state = state)
+            if sum(coefficient * current for coefficient, current in zip(row, state)) != value:
+                return 0
+        iterations = INFINITE
+        for constant, coefficients, step, condition in summary.checks:
+            start = constant + sum(coefficient * current for coefficient, current in zip(coefficients, state))
+            iterations = min(iterations, repeat_count(start, step, condition, sim.word_max))
+            if iterations == 0:
+                break
+    if iterations == 0: #The loop takes another path now, it's traced again with the current words
+        retraces = summary.retraces + 1
+        summary, path = trace_loop(sim, head)
+        if summary is not None:
+            summary.retraces = retraces
+        registers.add_loop(head, summary if retraces <= MAX_RETRACES else None, path)
+        return 0
+    if sim.detect_loops and (iterations == INFINITE or not summary.checked_at_head):
+        return 0 #The loop detection finds a loop that never ends, or has to see the states inside the iteration
+    iterations = min(iterations, budget // summary.length)
+    if iterations == INFINITE or iterations < 1: #A loop that never ends without a limit is left to run step by step
+        return 0
+    iterations = int(iterations)
+    repeated = detect_repeat(sim, summary, state, iterations) if sim.detect_loops else None
+    if repeated is not None:
+        iterations = repeated
+    sim.acc += iterations * summary.offsets[0]
+    for register, offset in zip(summary.registers, summary.offsets[1:]):
+        if offset:
+            registers.write(register, words[register] + iterations * offset)
+    sim.last_addr = summary.tail #Last instruction skipped
+    if repeated is not None:
+        sim.error_message = f"Error: The program is stuck in an infinite loop at address {summary.tail}."
+        sim.halt_reason = LOOP_DETECTED
+    return iterations * summary.length
+
+'''Loop Detection'''
+
+def state_words(sim, summary, values):
+    '''Returns the words of the registers as Simulator.loop_found saves them, with the loop registers set to values.'''
+    words = sim.registers.words
+    current = [words[register] for register in summary.registers]
+    for register, value in zip(summary.registers, values):
+        words[register] = value
+    data = words.tobytes()
+    for register, value in zip(summary.registers, current):
+        words[register] = value
+    return data
+
+def saved_word(words, data, addr):
+    '''Returns the word of the register in the words saved by Simulator.loop_found.'''
+    if isinstance(words, PagedWords):
+        record = 4 + 4 * PAGE_SIZE
+        for start in range(0, len(data), record):
+            if int.from_bytes(data[start:start + 4], "little") == addr // PAGE_SIZE:
+                start += 4 + 4 * (addr % PAGE_SIZE)
+                return array('i', data[start:start + 4])[0]
+        return 0
+    return array('i', data[4 * addr:4 * addr + 4])[0]
+
+def detect_repeat(sim, summary, state, iterations):
+    '''Runs the loop detection of the simulator over the iterations about to be skipped, as if they were stepped.
+    Returns the number of iterations after which a repeated state is found, or None after updating the detection.'''
+    #Each iteration adds the offsets and at least one of them isn't 0, so the skipped states are all different
+    #and only the state saved before the loop can be repeated, until the detection replaces it.
+    offsets = summary.offsets
+    count, power = sim.loop_count, sim.loop_power
+    saved = sim.loop_state
+    if saved is not None and saved[0] == summary.head:
+        moved = next(number for number, offset in enumerate(offsets) if offset)
+        if moved == 0:
+            distance = saved[1] - state[0]
+        else:
+            distance = saved_word(sim.registers.words, saved[2], summary.registers[moved - 1]) - state[moved]
+        repeated = distance // offsets[moved]
+        if distance % offsets[moved] == 0 and 1 <= repeated <= min(iterations, power - count):
+            values = [value + repeated * offset for value, offset in zip(state, offsets)]
+            if saved == (summary.head, values[0], state_words(sim, summary, values[1:])):
+                return repeated
+    #The saved state is replaced after power - count more backward branches, then after 2 * power...
+    skipped = 0
+    replaced = None
+    remaining = iterations
+    while remaining >= power - count:
+        remaining -= power - count
+        skipped += power - count
+        replaced = skipped
+        power *= 2
+        count = 0
+    sim.loop_count, sim.loop_power = count + remaining, power
+    if replaced is not None:
+        values = [value + replaced * offset for value, offset in zip(state, offsets)]
+        sim.loop_state = (summary.head, values[0], state_words(sim, summary, values[1:]))
+    return None
@@ -0,0 +1,163 @@
+'''
+Project Blackbox - Profiler
+
+Counts how many times each address and instruction is executed by a headless run, how often every branch is
+taken, how much time is spent outside of the instructions (the interpreter overhead), and optionally keeps
+the last executed instructions in a ring buffer trace.
+
+The profiler works by replacing the simulator dispatch table with wrappers while it is attached, so runs
+without a profiler attached don't pay anything for it:
+
+profiler = Profiler(trace_size=4096)
+result = profiler.run(sim, max_steps=100000)
+print(profiler.report())
+
+Each trace record is (step, address, instruction code, address operand, accumulator after the instruction).
+save_trace writes the records as native byte order signed 64 bit integers, 5 per record, oldest first.
+'''
+
+import time
+from array import array
+from simulator import INSTRUCTION_NAMES
+
+TRACE_FIELDS = 5 #Integers per trace record
+BRANCH_CODES = (40, 41, 42) #BRANCH, BRANCHNEG and BRANCHZERO
+
+class Profiler:
+    '''Collects execution counts, branch statistics, timing and a trace from a simulator.'''
+    def __init__(self, trace_size=0):
+        self.trace_size = trace_size #Number of records kept in the trace, 0 disables the trace
+        self.sim = None #Simulator the profiler is attached to
+        self.original_dispatch = None #Dispatch table restored when the profiler is detached
+        self.compile_blocks = False #Fast mode setting of the simulator, restored when the profiler is detached
+        self.fast_forward_loops = False #Loop fast-forwarding setting of the simulator, restored when the profiler is detached
+        self.reset()
+
+    def reset(self):
+        '''Clears all of the collected data.'''
+        self.steps = 0 #Instructions executed while attached
+        self.address_counts = {} #Executions per address
+        self.opcode_counts = {} #Executions per instruction code
+        self.branches = {} #[taken, not taken] per branch address
+        self.instruction_time = 0.0 #Seconds spent inside the instructions
+        self.total_time = 0.0 #Seconds spent in runs made through Profiler.run
+        self.trace = array('q', bytes(8 * TRACE_FIELDS * self.trace_size))
+        self.trace_next = 0 #Record that will be written next in the ring buffer
+
+    def attach(self, sim):
+        '''Replaces the simulator dispatch table with profiled versions of each instruction.'''
+        if self.sim is not None:
+            self.detach()
+        self.sim = sim
+        self.original_dispatch = sim.dispatch
+        self.compile_blocks = sim.compile_blocks
+        sim.compile_blocks = False #Compiled blocks don't go through the dispatch table, so every instruction is interpreted
+        self.fast_forward_loops = sim.fast_forward_loops
+        sim.fast_forward_loops = False #Skipped iterations wouldn't be counted
+        sim.dispatch = {code: self.wrap(code, handler) for code, handler in sim.dispatch.items()}
+
+    def detach(self):
+        '''Restores the original dispatch table of the simulator.'''
+        if self.sim is not None:
+            self.sim.dispatch = self.original_dispatch
+            self.sim.compile_blocks = self.compile_blocks
+            self.sim.fast_forward_loops = self.fast_forward_loops
+            self.sim = None
+            self.original_dispatch = None
+
+    def wrap(self, code, handler):
+        '''Returns a handler that records the instruction before executing it.'''
+        profiler = self
+        address_counts = self.address_counts
+        opcode_counts = self.opcode_counts
+        branches = self.branches
+        clock = time.perf_counter
+        is_branch = code in BRANCH_CODES
+
+        def profiled(operand):
+            simulator = profiler.sim
+            addr = simulator.cur_addr
+            address_counts[addr] = address_counts.get(addr, 0) + 1
+            opcode_counts[code] = opcode_counts.get(code, 0) + 1
+            if is_branch: #Branches don't change the accumulator, so the outcome is known before executing it
+                acc = simulator.acc
+                taken = code == 40 or (code == 41 and acc < 0) or (code == 42 and acc == 0)
+                counts = branches.setdefault(addr, [0, 0])
+                counts[0 if taken else 1] += 1
+            start = clock()
+            choice = handler(operand)
+            profiler.instruction_time += clock() - start
+            if profiler.trace_size:
+                profiler.record(addr, code, operand, simulator.acc)
+            profiler.steps += 1
+            return choice
+        return profiled
+
+    def record(self, addr, code, operand, acc):
+        '''Writes a record to the trace ring buffer, replacing the oldest one when it is full.'''
+        start = self.trace_next % self.trace_size * TRACE_FIELDS
+        self.trace[start:start + TRACE_FIELDS] = array('q', (self.steps, addr, code, operand, acc))
+        self.trace_next += 1
+
+    def run(self, sim, **run_options):
+        '''Runs the simulator with the profiler attached and returns the RunResult.'''
+        self.attach(sim)
+        start = time.perf_counter()
+        try:
+            return sim.run(**run_options)
+        finally:
+            self.total_time += time.perf_counter() - start
+            self.detach()
+
+    def trace_records(self):
+        '''Returns the trace records from the oldest to the newest.'''
+        count = min(self.trace_next, self.trace_size)
+        first = self.trace_next - count
+        records = []
+        for i in range(first, self.trace_next):
+            start = i % self.trace_size * TRACE_FIELDS
+            records.append(tuple(self.trace[start:start + TRACE_FIELDS]))
+        return records
+
+    def save_trace(self, path):
+        '''Writes the trace records to a binary file, oldest first.'''
+        with open(path, "wb") as trace_file:
+            array('q', [field for record in self.trace_records() for field in record]).tofile(trace_file)
+
+    def hot_addresses(self, top=10):
+        '''Returns the (address, executions) pairs of the most executed addresses.'''
+        return sorted(self.address_counts.items(), key=lambda item: (-item[1], item[0]))[:top]
+
+    def overhead_per_instruction(self):
+        '''Returns the average seconds spent outside of the instructions per instruction executed.'''
+        if self.steps == 0:
+            return 0.0
+        return max(0.0, self.total_time - self.instruction_time) / self.steps
+
+    def to_dict(self, top=10):
+        '''Returns the collected data as a dictionary that can be written as JSON.'''
+        return {
+            "steps": self.steps,
+            "hot_addresses": self.hot_addresses(top),
+            "opcodes": {INSTRUCTION_NAMES.get(code, str(code)): count for code, count in sorted(self.opcode_counts.items())},
+            "branches": {addr: {"taken": taken, "not_taken": not_taken} for addr, (taken, not_taken) in sorted(self.branches.items())},
+            "instruction_time": self.instruction_time,
+            "total_time": self.total_time,
+            "overhead_per_instruction": self.overhead_per_instruction(),
+        }
+
+    def report(self, top=10):
+        '''Returns a text report of the most executed addresses, instructions and branches.'''
+        lines = [f"Instructions executed: {self.steps}", "", "Hot addresses:"]
+        for addr, count in self.hot_addresses(top):
+            share = count / self.steps * 100 if self.steps else 0
+            lines.append(f"  {addr:03d}: {count} ({share:.1f}%)")
+        lines += ["", "Instructions:"]
+        for code, count in sorted(self.opcode_counts.items(), key=lambda item: -item[1]):
+            lines.append(f"  {INSTRUCTION_NAMES.get(code, code)}: {count}")
+        if self.branches:
+            lines += ["", "Branches (taken / not taken):"]
+            for addr, (taken, not_taken) in sorted(self.branches.items()):
+                lines.append(f"  {addr:03d}: {taken} / {not_taken}")
+        lines += ["", f"Interpreter overhead: {self.overhead_per_instruction() * 1e9:.0f} ns per instruction"]
+        return "\n".join(lines)
@@ -0,0 +1,149 @@
+'''
+Project Blackbox - Program Images
+
+Binary format to store a loaded program so it can be loaded again without parsing text. An image holds:
+
+Header (24 bytes, little endian):
+    magic          4 bytes   b"BBXI"
+    version        uint16    IMAGE_VERSION
+    flags          uint16    HAS_ACCUMULATOR and HAS_CUR_ADDR, set when the initial state is stored
+    word count     uint32    number of registers stored, starting at address 0
+    accumulator    int32     initial accumulator (0 if HAS_ACCUMULATOR is not set)
+    current addr   uint32    initial address (0 if HAS_CUR_ADDR is not set)
+    checksum       uint32    CRC32 of the words
+Words: word count signed 32 bit little endian integers.
+
+Images are read through mmap and copied straight from the file into the simulator register file.
+Converters to and from the .txt format are included, they are also available from the command line:
+
+python -m simulator convert program.txt program.bbx
+python -m simulator convert program.bbx program.txt
+'''
+
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from simulator import read_program, format_word, MEMORY_SIZE
+
+IMAGE_MAGIC = b"BBXI"
+IMAGE_VERSION = 1
+IMAGE_EXTENSION = ".bbx"
+HEADER = struct.Struct("<4sHHIiII")
+HAS_ACCUMULATOR = 1
+HAS_CUR_ADDR = 2
+
+'''Program Image Class'''
+class ProgramImage:
+    '''Words and optional initial state read from an image.'''
+    def __init__(self, words, accumulator=None, cur_addr=None):
+        self.words = words #Register values as a memoryview of integers
+        self.accumulator = accumulator #Initial accumulator, None if the image doesn't set it
+        self.cur_addr = cur_addr #Initial address, None if the image doesn't set it
+
+def image_bytes(words, accumulator=None, cur_addr=None):
+    '''Packs the words and the optional initial state into an image.'''
+    words = array('i', words)
+    if sys.byteorder != "little": #Images are always stored in little endian
+        words.byteswap()
+    payload = words.tobytes()
+    flags = (HAS_ACCUMULATOR if accumulator is not None else 0) | (HAS_CUR_ADDR if cur_addr is not None else 0)
+    header = HEADER.pack(IMAGE_MAGIC, IMAGE_VERSION, flags, len(words), accumulator or 0, cur_addr or 0, zlib.crc32(payload))
+    return header + payload
+
+def decode_image(buffer):
+    '''Reads an image from bytes, a memoryview or a mmap, returns (ProgramImage, []) or (None, errors).'''
+    view = memoryview(buffer)
+    if len(view) < HEADER.size:
+        return (None, ["Error: The file is too small to be a program image."])
+    magic, version, flags, count, accumulator, cur_addr, checksum = HEADER.unpack_from(view)
+    if magic != IMAGE_MAGIC:
+        return (None, ["Error: The file is not a program image."])
+    if version != IMAGE_VERSION:
+        return (None, [f"Error: Program image version {version} is not supported (expected {IMAGE_VERSION})."])
+    payload = view[HEADER.size:HEADER.size + 4 * count]
+    if len(payload) != 4 * count:
+        return (None, [f"Error: The program image is truncated, it should contain {count} words."])
+    if zlib.crc32(payload) != checksum:
+        return (None, ["Error: The program image checksum doesn't match, the file is corrupted."])
+    if sys.byteorder == "little":
+        words = payload.cast('i') #No copy, the words are read straight from the buffer
+    else:
+        swapped = array('i', payload.tobytes())
+        swapped.byteswap()
+        words = memoryview(swapped)
+    return (ProgramImage(words,
+                         accumulator if flags & HAS_ACCUMULATOR else None,
+                         cur_addr if flags & HAS_CUR_ADDR else None), [])
+
+def load_buffer(sim, buffer):
+    '''Loads an image from bytes, a memoryview or a mmap into the simulator, returns (True, []) or (False, errors)
+    leaving the simulator unchanged.'''
+    image, errors = decode_image(buffer)
+    if errors:
+        return (False, errors)
+    word_max = sim.word_max
+    digits = sim.registers.word_digits
+    if image.accumulator is not None and abs(image.accumulator) > word_max:
+        errors.append(f"Error: The accumulator of the program image ({image.accumulator}) is not a valid {digits} digit word.")
+    if image.cur_addr is not None and not 0 <= image.cur_addr <= sim.register_size:
+        errors.append(f"Error: The current address of the program image ({image.cur_addr}) is not a register.")
+    with image.words as words: #The view must be released before a mapped file is unmapped
+        if len(words) > len(sim.registers):
+            return (False, [f"Error: The program image has {len(words)} words but there are only {len(sim.registers)} registers."])
+        if len(words) and (max(words) > word_max or min(words) < -word_max):
+            addr, word = next((addr, word) for addr, word in enumerate(words) if abs(word) > word_max)
+            errors.append(f"Error: Register {addr} of the program image holds {word}, which is not a valid {digits} digit word.")
+        if errors:
+            return (False, errors)
+        sim.load_program(words)
+    if image.accumulator is not None:
+        sim.acc = image.accumulator
+    if image.cur_addr is not None:
+        sim.cur_addr = image.cur_addr
+    sim.snapshot() #Restoring goes back to the initial state stored in the image
+    return (True, [])
+
+def load_image(sim, path):
+    '''Loads an image file into the simulator, returns (True, []) or (False, errors) leaving the simulator unchanged.'''
+    with open(path, "rb") as image_file:
+        if image_file.seek(0, 2) == 0: #mmap can't map empty files
+            return (False, ["Error: The file is too small to be a program image."])
+        with mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return load_buffer(sim, mapped)
+
+def save_image(path, words, accumulator=None, cur_addr=None):
+    '''Writes the words and the optional initial state to an image file.'''
+    with open(path, "wb") as image_file:
+        image_file.write(image_bytes(words, accumulator, cur_addr))
+
+def used_words(words):
+    '''Returns the words up to the last register that isn't empty.'''
+    end = len(words)
+    while end > 0 and words[end - 1] == 0:
+        end -= 1
+    return words[:end]
+
+def program_text(words, digits=6):
+    '''Returns the used words in the .txt format, one word per line without a final new line.'''
+    return "\n".join(format_word(word, digits) for word in used_words(words))
+
+def text_to_image(text_path, image_path, size=MEMORY_SIZE):
+    '''Converts a .txt program for a memory of the given size into an image, returns (True, []) or (False, errors).'''
+    with open(text_path, "rb") as text_file:
+        words, errors = read_program(text_file, size)
+    if errors:
+        return (False, errors)
+    save_image(image_path, words)
+    return (True, [])
+
+def image_to_text(image_path, text_path, digits=6):
+    '''Converts an image into a .txt program with one word of the given digits per line, returns (True, []) or (False, errors).'''
+    with open(image_path, "rb") as image_file:
+        image, errors = decode_image(image_file.read())
+    if errors:
+        return (False, errors)
+    with open(text_path, "w") as text_file:
+        text_file.write(program_text(image.words, digits))
+    return (True, [])
@@ -0,0 +1,228 @@
+'''
+Project Blackbox - Result Cache
+
+Stores the results of program runs so running the same program with the same inputs again returns the stored
+result without executing it. A run is fully determined by the memory it starts from (registers, accumulator and
+current address), the words given to its READ (010) instructions and the limits that can stop it, so the result
+is stored under a SHA-256 hash of those and of simulator.ENGINE_VERSION, which changes whenever a change to the
+engine can change a result. Compile and fast-forward modes give the same results, so they share the entries.
+
+The results are kept in a small in-memory LRU in front of an optional directory, where every result is a file
+named after its key. When the files grow past max_disk_size bytes the least recently used ones are deleted (a
+hit touches its file), and several processes can share the same directory.
+
+Runs stopped by max_time or max_steps aren't stored, they depend on the machine or on where the run was
+resumed. A result taken from the cache doesn't take any time, so it's returned even if max_time is lower than
+the time the original run took.
+
+Usage:
+
+cache = ResultCache("~/.cache/project-blackbox")
+key = run_key(sim, inputs)
+entry = cache.get(key)
+if entry is None:
+    result = sim.run(inputs=inputs)
+    cache.put(key, CachedRun.from_result(result, writes, sim.last_addr))
+'''
+
+import hashlib
+import json
+import os
+import sys
+import zlib
+from array import array
+from collections import OrderedDict
+from simulator import RunResult, ENGINE_VERSION, STEP_LIMIT, TIME_LIMIT
+
+RESULT_EXTENSION = ".run"
+DEFAULT_DIRECTORY = os.path.join("~", ".cache", "project-blackbox") #Directory used by the GUI
+DEFAULT_MEMORY_ENTRIES = 256 #Results kept in memory
+DEFAULT_DISK_SIZE = 256 * 1024 * 1024 #Bytes the result files may take before the oldest are deleted
+UNCACHED_REASONS = (STEP_LIMIT, TIME_LIMIT) #Halt reasons of runs that can't be repeated exactly
+
+def run_key(sim, inputs=()):
+    '''Returns the key of a run starting from the current state of the simulator with the inputs.'''
+    digest = hashlib.sha256()
+    header = [ENGINE_VERSION, len(sim.registers), sim.acc, sim.cur_addr, sim.max_instructions, sim.detect_loops,
+              [str(word) for word in inputs]]
+    digest.update(json.dumps(header).encode())
+    digest.update(sim.registers.words.tobytes())
+    return digest.hexdigest()
+
+'''Cached Run Class'''
+class CachedRun:
+    '''Result of a run stored in the cache, with the address of every word written.'''
+    __slots__ = ("halt_reason", "steps", "accumulator", "registers", "cur_addr", "error_message", "writes", "last_addr")
+
+    def __init__(self, halt_reason, steps, accumulator, registers, cur_addr, error_message="", writes=(), last_addr=0):
+        self.halt_reason = halt_reason
+        self.steps = steps #Instructions executed by the original run
+        self.accumulator = accumulator
+        self.registers = registers #Final register values as a list of integers
+        self.cur_addr = cur_addr
+        self.error_message = error_message
+        self.writes = [tuple(write) for write in writes] #(address, word) of every WRITE (011) in order
+        self.last_addr = last_addr #Address of the last instruction executed
+
+    @classmethod
+    def from_result(cls, result, writes, last_addr=0):
+        '''Creates the entry of a RunResult, writes holds the (address, word) pairs the run wrote.'''
+        return cls(result.halt_reason, result.steps, result.accumulator, result.registers, result.cur_addr,
+                   result.error_message, writes, last_addr)
+
+    @property
+    def outputs(self):
+        return [word for _, word in self.writes]
+
+    def result(self):
+        '''Returns the entry as a RunResult.'''
+        return RunResult(self.halt_reason, self.steps, self.accumulator, list(self.registers), self.cur_addr,
+                         self.error_message, self.outputs)
+
+    def apply(self, sim):
+        '''Puts the simulator in the state the run ended in, only the registers that differ are written.'''
+        words = sim.registers.words
+        for addr, word in enumerate(self.registers):
+            if words[addr] != word:
+                sim.registers.write(addr, word)
+        sim.acc = self.accumulator
+        sim.cur_addr = self.cur_addr
+        sim.last_addr = self.last_addr
+        sim.error_message = self.error_message
+        sim.halt_reason = self.halt_reason
+        sim.executed += self.steps
+
+    def to_bytes(self):
+        '''Encodes the entry as a JSON line followed by the compressed registers.'''
+        header = {"halt_reason": self.halt_reason, "steps": self.steps, "accumulator": self.accumulator,
+                  "cur_addr": self.cur_addr, "error_message": self.error_message, "writes": self.writes,
+                  "last_addr": self.last_addr}
+        words = array('i', self.registers)
+        if sys.byteorder != "little": #Files are always stored in little endian
+            words.byteswap()
+        return json.dumps(header).encode() + b"\n" + zlib.compress(words.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        '''Decodes an entry written by to_bytes, returns None if the data is damaged.'''
+        header, _, payload = data.partition(b"\n")
+        try:
+            fields = json.loads(header)
+            words = array('i')
+            words.frombytes(zlib.decompress(payload))
+            if sys.byteorder != "little":
+                words.byteswap()
+            return cls(fields["halt_reason"], fields["steps"], fields["accumulator"], words.tolist(),
+                       fields["cur_addr"], fields["error_message"], fields["writes"], fields["last_addr"])
+        except (ValueError, KeyError, TypeError, zlib.error):
+            return None
+
+'''Result Cache Class'''
+class ResultCache:
+    '''In-memory LRU of run results in front of an optional directory of result files.'''
+    def __init__(self, directory=None, memory_entries=DEFAULT_MEMORY_ENTRIES, max_disk_size=DEFAULT_DISK_SIZE):
+        self.directory = os.path.expanduser(directory) if directory is not None else None #None keeps the results in memory only
+        self.memory_entries = memory_entries #Results kept in memory
+        self.max_disk_size = max_disk_size #Bytes the result files may take
+        self.memory = OrderedDict() #Key -> CachedRun, the most recently used last
+        self.hits = 0
+        self.misses = 0
+        self.disk_size = 0 #Bytes of the result files, recounted when they're evicted
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.disk_size = sum(size for _, size, _ in self.result_files())
+
+    def path(self, key):
+        return os.path.join(self.directory, key + RESULT_EXTENSION)
+
+    def get(self, key):
+        '''Returns the CachedRun stored under the key, or None.'''
+        entry = self.memory.get(key)
+        if entry is None and self.directory is not None:
+            path = self.path(key)
+            try:
+                with open(path, "rb") as result_file:
+                    entry = CachedRun.from_bytes(result_file.read())
+                os.utime(path) #Marks the file as recently used
+            except OSError: #Not stored, or deleted by another process
+                entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.remember(key, entry)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        '''Stores the entry under the key, returns False if the run can't be cached.'''
+        if entry.halt_reason in UNCACHED_REASONS:
+            return False
+        self.remember(key, entry)
+        if self.directory is not None:
+            data = entry.to_bytes()
+            path = self.path(key)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, "wb") as result_file:
+                    result_file.write(data)
+                os.replace(temp_path, path) #Other processes never read a file that is only partly written
+            except OSError: #The directory can't be written, the result is still cached in memory
+                return True
+            self.disk_size += len(data)
+            if self.disk_size > self.max_disk_size:
+                self.evict()
+        return True
+
+    def remember(self, key, entry):
+        '''Adds the entry to the in-memory LRU, dropping the least recently used past memory_entries.'''
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def result_files(self):
+        '''Returns (modification time, size, path) of every result file.'''
+        files = []
+        with os.scandir(self.directory) as entries:
+            for item in entries:
+                if item.name.endswith(RESULT_EXTENSION):
+                    try:
+                        stat = item.stat()
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, item.path))
+        return files
+
+    def evict(self):
+        '''Deletes the least recently used result files until they fit in max_disk_size.'''
+        files = sorted(self.result_files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_disk_size:
+                break
+            try:
+                os.remove(path)
+            except OSError: #Already deleted by another process
+                pass
+            total -= size
+        self.disk_size = total
+
+    def clear(self):
+        '''Forgets every result, in memory and on disk.'''
+        self.memory.clear()
+        if self.directory is not None:
+            for _, _, path in self.result_files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.disk_size = 0
+
+caches = {} #Directory -> ResultCache of this process, shared by the runs of a batch
+
+def open_cache(directory, max_disk_size=DEFAULT_DISK_SIZE):
+    '''Returns the cache of the process for the directory, it's created the first time.'''
+    cache = caches.get(directory)
+    if cache is None:
+        cache = caches[directory] = ResultCache(directory, max_disk_size=max_disk_size)
+    return cache
@@ -0,0 +1,174 @@
+'''
+Project Blackbox - Run Recording
+
+Records the words a run reads, and optionally the words it writes, so the run can be replayed exactly without the
+GUI. A recording holds the state the run started from as a program image (see program_image.py), every word
+given to a READ (010) instruction in order, the address and word of every WRITE (011), and how the run stopped.
+Replaying loads the image, feeds the input words back to the READ instructions and checks that the program writes
+the same words and stops the same way after the same number of instructions, so an interactive session becomes a
+headless regression case. The replay is stopped once it executes more instructions than the recorded run, so a
+program that changed can't hang it.
+
+The words are recorded by the simulator itself (Simulator.input_log and output_log), so every way of running a
+program is recorded the same way: words entered in the GUI, input callbacks, input queues and compiled blocks.
+
+Recordings are saved as JSON. The "image", "inputs" and "memory_size" fields are the ones the execution server
+(see execution_server.py) accepts, so a recording can also be posted to its /run path.
+
+Usage:
+
+recording = Recording.start(sim)
+result = sim.run(inputs=["+000005"])
+recording.finish(sim, result)
+recording.save("session.json")
+
+replay = replay_recording(Recording.load("session.json"))
+replay.verified, replay.mismatches
+
+python -m simulator replay session.json
+'''
+
+import base64
+import json
+import time
+from array import array
+from simulator import Simulator, ENGINE_VERSION, INSTRUCTION_LIMIT, format_word, address_digits
+import program_image
+
+RECORDING_VERSION = 1
+RECORDING_EXTENSION = ".json"
+MAX_MISMATCHES = 10 #Output differences reported by a replay, the rest are counted
+
+'''Recording Class'''
+class Recording:
+    '''Starting state, input words and written words of one run.'''
+    def __init__(self, image, memory_size, inputs=None, writes=None, detect_loops=False, halt_reason=None, steps=None):
+        self.image = image #Program image (bytes) of the registers, accumulator and address the run started from
+        self.memory_size = memory_size
+        self.inputs = inputs if inputs is not None else [] #Words given to READ in order, as strings
+        self.writes = writes #(address, word) of every WRITE in order, or None if the outputs aren't recorded
+        self.detect_loops = detect_loops #The loop detection can stop the run, so the replay uses it too
+        self.halt_reason = halt_reason #How the run stopped, None until it's finished
+        self.steps = steps #Instructions executed by the run, None until it's finished
+        self.start_executed = 0 #Instructions the simulator had executed when the recording started
+
+    @classmethod
+    def start(cls, sim, record_outputs=True):
+        '''Starts recording the run of the simulator from its current state, returns the recording.'''
+        words = program_image.used_words(array('i', sim.registers.words))
+        image = program_image.image_bytes(words, sim.acc, sim.cur_addr)
+        recording = cls(image, len(sim.registers), writes=[] if record_outputs else None, detect_loops=sim.detect_loops)
+        recording.start_executed = sim.executed
+        sim.input_log = recording.inputs
+        sim.output_log = recording.writes
+        return recording
+
+    def stop(self, sim):
+        '''Stops recording the words of the simulator.'''
+        sim.input_log = None
+        sim.output_log = None
+
+    def finish(self, sim, result):
+        '''Stops recording and stores how the run stopped.'''
+        self.stop(sim)
+        self.halt_reason = result.halt_reason
+        self.steps = sim.executed - self.start_executed
+
+    def to_dict(self):
+        recording = {"version": RECORDING_VERSION, "engine_version": ENGINE_VERSION, "memory_size": self.memory_size,
+                     "detect_loops": self.detect_loops, "image": base64.b64encode(self.image).decode("ascii"),
+                     "inputs": self.inputs, "halt_reason": self.halt_reason, "steps": self.steps}
+        if self.writes is not None:
+            recording["outputs"] = [[addr, word] for addr, word in self.writes]
+        return recording
+
+    @classmethod
+    def from_dict(cls, recording):
+        '''Reads a recording written by to_dict, raises ValueError if it isn't valid.'''
+        try:
+            if recording["version"] != RECORDING_VERSION:
+                raise ValueError(f"Recording version {recording['version']} is not supported.")
+            writes = recording.get("outputs")
+            return cls(base64.b64decode(recording["image"], validate=True), int(recording["memory_size"]),
+                       [str(word) for word in recording["inputs"]],
+                       [(int(addr), int(word)) for addr, word in writes] if writes is not None else None,
+                       bool(recording.get("detect_loops", False)), recording.get("halt_reason"), recording.get("steps"))
+        except (KeyError, TypeError) as error:
+            raise ValueError(f"The recording is not valid: {error}")
+
+    def save(self, path):
+        with open(path, "w") as recording_file:
+            json.dump(self.to_dict(), recording_file)
+
+    @classmethod
+    def load(cls, path):
+        '''Reads a recording file, raises ValueError if it isn't valid.'''
+        with open(path) as recording_file:
+            return cls.from_dict(json.load(recording_file))
+
+'''Replay'''
+
+class Replay:
+    '''Result of replaying a recording.'''
+    def __init__(self, result, writes, mismatches, seconds):
+        self.result = result #RunResult of the replay
+        self.writes = writes #(address, word) of every WRITE of the replay
+        self.mismatches = mismatches #Differences with the recording, as messages
+        self.seconds = seconds #Time spent executing the replay
+
+    @property
+    def verified(self):
+        return not self.mismatches
+
+    def to_dict(self):
+        return {"verified": self.verified, "mismatches": self.mismatches, "halt_reason": self.result.halt_reason,
+                "steps": self.result.steps, "seconds": self.seconds}
+
+def replay_recording(recording, compile_blocks=False, fast_forward_loops=False):
+    '''Runs the recorded program with the recorded inputs, returns a Replay with the differences found.'''
+    #A replay that runs past the recorded instructions has already diverged, it's stopped right after them.
+    max_instructions = recording.steps
+    if max_instructions is not None and recording.halt_reason != INSTRUCTION_LIMIT:
+        max_instructions += 1
+    sim = Simulator(max_instructions=max_instructions, detect_loops=recording.detect_loops,
+                    memory_size=recording.memory_size, compile_blocks=compile_blocks, fast_forward_loops=fast_forward_loops)
+    success, errors = program_image.load_buffer(sim, recording.image)
+    if not success:
+        raise ValueError("\n".join(errors))
+    writes = []
+    sim.output_log = writes
+    start = time.perf_counter()
+    result = sim.run(inputs=recording.inputs)
+    seconds = time.perf_counter() - start
+    mismatches = compare(recording, result, writes, len(sim.input_queue))
+    return Replay(result, writes, mismatches, seconds)
+
+def compare(recording, result, writes, unread):
+    '''Returns the differences between the recorded run and its replay as messages.'''
+    digits = address_digits(recording.memory_size) + 3
+    mismatches = []
+    if recording.writes is not None:
+        differences = 0
+        for number in range(max(len(writes), len(recording.writes))):
+            expected = recording.writes[number] if number < len(recording.writes) else None
+            written = writes[number] if number < len(writes) else None
+            if expected == written:
+                continue
+            differences += 1
+            if differences > MAX_MISMATCHES:
+                continue
+            if written is None:
+                mismatches.append(f"Output {number + 1}: expected {format_word(expected[1], digits)} from register {expected[0]:03d}, the replay wrote nothing.")
+            elif expected is None:
+                mismatches.append(f"Output {number + 1}: the replay wrote {format_word(written[1], digits)} from register {written[0]:03d}, the recording has no more outputs.")
+            else:
+                mismatches.append(f"Output {number + 1}: expected {format_word(expected[1], digits)} from register {expected[0]:03d}, got {format_word(written[1], digits)} from register {written[0]:03d}.")
+        if differences > MAX_MISMATCHES:
+            mismatches.append(f"...and {differences - MAX_MISMATCHES} more different outputs.")
+    if recording.halt_reason is not None and result.halt_reason != recording.halt_reason:
+        mismatches.append(f"The replay stopped with {result.halt_reason} instead of {recording.halt_reason}.")
+    if recording.steps is not None and result.steps != recording.steps:
+        mismatches.append(f"The replay executed {result.steps} instructions instead of {recording.steps}.")
+    if unread:
+        mismatches.append(f"The replay didn't read the last {unread} input words.")
+    return mismatches
@@ -4,7 +4,7 @@ Project Blackbox
 Designed and built by: Branson Petty, Connor Barry, Noah Potter, and Pedro Valente.
 
 The purpose of this program is to create a functional assembly program that reads an instruction file
-line by line. Executing commands and utilizing 250 registers as virtual memory that each store signed 
+line by line. Executing commands and utilizing 250 registers (by default) as virtual memory that each store signed 
 6 digit numbers, referred to as words, and the each of the operations.
 
 The program was designed to only run .txt files. This decision was made to assure maximum accuracy
@@ -35,129 +35,517 @@ BRANCHZERO = 042 Branch to a specific location in memory if the accumulator is z
 HALT = 043 Pause the program
 '''
 
+from array import array
+from collections import deque
+import io
+import mmap
+import time
+
+WORD_MAX = 999999 #Largest value a register or the accumulator can hold with the default 250 registers
+WORD_MIN = -999999 #Smallest value a register or the accumulator can hold with the default 250 registers
+
+MEMORY_SIZE = 250 #Default number of registers
+MAX_MEMORY_SIZE = 1000000 #Addresses have at most 6 digits, so every word still fits in a 32 bit integer
+DENSE_MEMORY_LIMIT = 65536 #Larger memories are paged and only allocate the pages that hold a word
+PAGE_SIZE = 4096 #Registers per page of a paged memory
+ENGINE_VERSION = 1 #Changed whenever a change to the engine can change the result of a run, cached results of other versions are ignored (see result_cache.py)
+
+#Reasons a headless run can stop
+HALTED = "halt" #The program reached a HALT (043) instruction
+ERROR = "error" #An invalid instruction, address, input or an overflow stopped the program
+END_OF_MEMORY = "end_of_memory" #The program ran past the last register without halting
+INPUT_NEEDED = "input" #A READ (010) instruction has no input available, calling run again resumes it
+STEP_LIMIT = "step_limit" #The max_steps given to run was reached, calling run again resumes it
+INSTRUCTION_LIMIT = "instruction_limit" #The program executed more instructions than the simulator max_instructions
+TIME_LIMIT = "time_limit" #The program ran for longer than the simulator max_time
+LOOP_DETECTED = "loop_detected" #The program returned to a state it was already in, so it would never halt
+
+#Names of the valid instruction codes
+INSTRUCTION_NAMES = {0: "EMPTY", 10: "READ", 11: "WRITE", 20: "LOAD", 21: "STORE", 30: "ADD", 31: "SUBTRACT",
+                     32: "DIVIDE", 33: "MULTIPLY", 40: "BRANCH", 41: "BRANCHNEG", 42: "BRANCHZERO", 43: "HALT"}
+
+LIMIT_CHECK_INTERVAL = 1024 #Instructions executed between checks of the wall clock
+
+def format_word(value, digits=6):
+    '''Formats an integer as a signed 6 digit word (ex: 12 -> "+000012", -5 -> "-000005").
+    Memories with more than 1000 registers use longer words, given by digits.'''
+    return f"{value:+0{digits + 1}d}"
+
+def address_digits(size):
+    '''Returns the number of address digits of a word for a memory of the given size (3 for up to 1000 registers).
+    The instruction code always takes 3 digits, so the words have 3 more digits than the addresses.'''
+    return max(3, len(str(size - 1)))
+
+'''Program loading'''
+
+def program_lines(source):
+    '''Returns an iterator over the lines of a string, bytes, mmap or file object without copying it.'''
+    if isinstance(source, str):
+        return io.StringIO(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    if isinstance(source, mmap.mmap):
+        return iter(source.readline, b"")
+    return source #File objects and lists of lines are already iterable line by line
+
+def read_program(source, size=MEMORY_SIZE):
+    '''Reads a program in a single pass using the same rules as the Load Instructions window.
+    The source may be a string, bytes, a mmap or a file object opened in text or binary mode.
+    4 digit words are converted to 6 digit words, unsigned words become positive, and the program ends at
+    the first empty line or -99999. Returns (words, errors): the words as an array of integers and the
+    list of every error found with its line number, the program is only valid if the list is empty.
+    Memories with more than 1000 registers (size) expect longer words, see address_digits.'''
+    address_padding = "0" * (address_digits(size) - 2) #Pads the 2 digit address of 4 digit words
+    word_digits = address_digits(size) + 3
+    words = array('i')
+    errors = []
+    too_long = False
+    for line_number, line in enumerate(program_lines(source), 1):
+        if isinstance(line, bytes):
+            line = line.decode("ascii", "replace")
+        line = line.rstrip("\r\n")
+        if line == "" or line == "-99999": #This means it's the end of the program.
+            break
+        word = line
+        if len(word) == 4: #4 bit instruction without sign: "1007" -> "010007"
+            word = "0" + word[0:2] + address_padding + word[2:]
+        elif len(word) == 5: #4 bit instruction with sign: "+1007" -> "+010007"
+            word = word[0:1] + "0" + word[1:3] + address_padding + word[3:]
+        if len(word) == word_digits + 1 and (word[0] == "+" or word[0] == "-"): #6 digit number with operator sign
+            digits = word[1:]
+        elif len(word) == word_digits: #6 digit number without sign is positive
+            digits = word
+        else:
+            digits = ""
+        if not (digits.isascii() and digits.isdigit()):
+            errors.append(f"Error(line {line_number}): {line} in your input is not a valid instruction.")
+        elif len(words) == size: #max line limit, reported once
+            if not too_long:
+                errors.append(f"Error: Your input contain more than {size} instructions.")
+                too_long = True
+        else:
+            words.append(int(word))
+    return words, errors
+
+'''Paged Memory Classes'''
+class PagedWords:
+    '''Indexed like an array of words, but only allocates the pages of PAGE_SIZE registers that hold a word.'''
+    __slots__ = ("size", "pages")
+
+    def __init__(self, size):
+        self.size = size #Number of registers
+        self.pages = {} #Page number -> array with the words of the page, missing pages only hold 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, addr):
+        if isinstance(addr, slice):
+            return array('i', (self[i] for i in range(*addr.indices(self.size))))
+        if addr < 0 or addr >= self.size:
+            raise IndexError("register address out of range")
+        page = self.pages.get(addr // PAGE_SIZE)
+        return page[addr % PAGE_SIZE] if page is not None else 0
+
+    def __setitem__(self, addr, value):
+        if addr < 0 or addr >= self.size:
+            raise IndexError("register address out of range")
+        page = self.pages.get(addr // PAGE_SIZE)
+        if page is None:
+            if value == 0: #Writing 0 to a missing page doesn't change anything
+                return
+            page = self.pages[addr // PAGE_SIZE] = array('i', bytes(4 * PAGE_SIZE))
+        page[addr % PAGE_SIZE] = value
+
+    def __iter__(self):
+        empty = array('i', bytes(4 * PAGE_SIZE))
+        for start in range(0, self.size, PAGE_SIZE):
+            yield from self.pages.get(start // PAGE_SIZE, empty)[:self.size - start]
+
+    def used(self):
+        '''Returns the addresses of the registers that aren't 0 in ascending order.'''
+        return [number * PAGE_SIZE + offset for number, page in sorted(self.pages.items())
+                for offset, word in enumerate(page) if word != 0]
+
+    def clear(self):
+        self.pages.clear()
+
+    def load(self, words):
+        '''Copies an 'i' array or memoryview starting at address 0, pages that would only hold 0 aren't allocated.'''
+        with memoryview(words) as view:
+            for start in range(0, len(view), PAGE_SIZE):
+                page = array('i')
+                page.frombytes(view[start:start + PAGE_SIZE].cast('B'))
+                if any(page):
+                    page.frombytes(bytes(4 * (PAGE_SIZE - len(page))))
+                    self.pages[start // PAGE_SIZE] = page
+
+    def tobytes(self):
+        '''Returns the allocated pages and their numbers as bytes, used to compare memory states.'''
+        return b"".join(number.to_bytes(4, "little") + page.tobytes() for number, page in sorted(self.pages.items()))
+
+class DecodeCache(dict):
+    '''Sparse replacement for the decoded list of paged memories, registers that weren't decoded return None.'''
+    __slots__ = ()
+
+    def __missing__(self, addr):
+        return None
+
+'''Register File Class'''
+class Registers:
+    '''Stores every register as a plain integer and exposes them as signed 6 digit strings.'''
+    __slots__ = ("words", "decoded", "dirty", "journal", "address_base", "word_digits", "compiled", "loops", "code")
+
+    def __init__(self, size=MEMORY_SIZE):
+        if size > DENSE_MEMORY_LIMIT: #Large memories are mostly empty, so only the pages in use take memory
+            self.words = PagedWords(size)
+            self.decoded = DecodeCache()
+        else:
+            self.words = array('i', bytes(4 * size)) #Preallocates all registers with 0 (+000000)
+            self.decoded = [None] * size #Caches the (instruction code, address) pair of each register
+        self.dirty = set() #Addresses written since the last take_dirty call, used to redraw only what changed
+        self.journal = {} #Word each register held when the snapshot was taken, recorded on its first write
+        self.compiled = {} #First address -> compiled block starting there (or None if it can't be compiled), see block_compiler.py
+        self.loops = {} #Loop head -> summary of the loop (or None if it can't be fast-forwarded), see loop_accelerator.py
+        self.code = {} #Address -> first addresses of the compiled blocks (and heads of the loops) that contain it
+        self.address_base = 10 ** address_digits(size) #The instruction code is the word divided by this number
+        self.word_digits = address_digits(size) + 3 #Digits of a word without the sign
+
+    def decode(self, addr):
+        '''Splits the word into (instruction code, address) integers and caches it until the register is written.'''
+        word = abs(self.words[addr]) #The sign is ignored the same way "-010005"[1:4] ignored it
+        decoded = self.decoded[addr] = (word // self.address_base, word % self.address_base)
+        return decoded
+
+    def __getitem__(self, addr):
+        '''Returns the word stored in the register as a string.'''
+        return format_word(self.words[addr], self.word_digits)
+
+    def __setitem__(self, addr, word):
+        '''Stores a word in the register, the word may be a string ("+001234") or an integer.'''
+        self.write(addr, int(word))
+
+    def write(self, addr, value):
+        '''Stores an integer in the register, the previous word is journaled so the snapshot can be restored.'''
+        if addr not in self.journal:
+            self.journal[addr] = self.words[addr]
+        self.words[addr] = value
+        self.decoded[addr] = None #The cached instruction is no longer valid
+        self.dirty.add(addr)
+        if addr in self.code: #The compiled blocks holding the register are no longer valid either
+            self.drop_code(addr)
+
+    def patch(self, addr, word):
+        '''Stores a word in the register and in the snapshot, so restoring keeps the new word.'''
+        value = int(word)
+        if addr in self.journal:
+            self.journal[addr] = value
+        self.words[addr] = value
+        self.decoded[addr] = None
+        self.dirty.add(addr)
+        if addr in self.code:
+            self.drop_code(addr)
+
+    def add_code(self, start, end, block, constants=()):
+        '''Caches the compiled block of the registers from start to end (inclusive).
+        constants are the other registers whose words were compiled into the block.'''
+        self.compiled[start] = block
+        for addr in range(start, end + 1):
+            self.code.setdefault(addr, set()).add(start)
+        for addr in constants:
+            self.code.setdefault(addr, set()).add(start)
+
+    def add_loop(self, head, summary, path):
+        '''Caches the summary of the loop starting at head, path holds the addresses of its instructions.'''
+        self.loops[head] = summary
+        for addr in path:
+            self.code.setdefault(addr, set()).add(head)
+
+    def drop_code(self, addr):
+        '''Forgets the compiled blocks and loops that contain the register so they're compiled again from the new word.'''
+        for start in self.code.pop(addr, ()):
+            self.compiled.pop(start, None)
+            self.loops.pop(start, None)
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self):
+        '''Iterates through the register addresses.'''
+        return iter(range(len(self.words)))
+
+    def keys(self):
+        return range(len(self.words))
+
+    def values(self):
+        return [format_word(word, self.word_digits) for word in self.words]
+
+    def items(self):
+        return [(addr, format_word(word, self.word_digits)) for addr, word in enumerate(self.words)]
+
+    def used(self):
+        '''Returns the addresses of the registers that aren't 0 in ascending order.'''
+        if isinstance(self.words, PagedWords):
+            return self.words.used()
+        return [addr for addr, word in enumerate(self.words) if word != 0]
+
+    def clear(self):
+        '''Sets all the registers back to 0.'''
+        used = self.used() #Empty registers don't change
+        for addr in used:
+            if addr not in self.journal:
+                self.journal[addr] = self.words[addr]
+        self.compiled.clear()
+        self.loops.clear()
+        self.code.clear()
+        if isinstance(self.words, PagedWords):
+            self.words.clear()
+            self.decoded.clear()
+        else:
+            self.words[:] = array('i', bytes(4 * len(self.words))) #Cleared in place so references to the words stay valid
+            self.decoded[:] = [None] * len(self.words) #Cleared in place so references to the cache stay valid
+        self.dirty.update(used)
+
+    def load(self, words):
+        '''Copies an 'i' array or memoryview into the registers starting at address 0 without journaling it.'''
+        self.compiled.clear()
+        self.loops.clear()
+        self.code.clear()
+        if isinstance(self.words, PagedWords):
+            self.words.load(words)
+        else:
+            with memoryview(self.words) as view:
+                view[:len(words)] = words #Copies straight from the source buffer, which may be a mapped program image
+        self.dirty.update(range(len(words)))
+
+    def snapshot(self):
+        '''Makes the current words the snapshot, nothing is copied until a register is written.'''
+        self.journal.clear()
+
+    def restore(self):
+        '''Puts back the words journaled since the snapshot, only the registers that were written are touched.'''
+        words = self.words
+        decoded = self.decoded
+        for addr, word in self.journal.items():
+            words[addr] = word
+            decoded[addr] = None
+            if addr in self.code:
+                self.drop_code(addr)
+        self.dirty.update(self.journal)
+        self.journal.clear()
+
+    def take_dirty(self):
+        '''Returns the addresses written since the last call in ascending order and forgets them.'''
+        dirty = sorted(self.dirty)
+        self.dirty.clear()
+        return dirty
+
+'''Run Result Class'''
+class RunResult:
+    '''Holds the outcome of a headless run.'''
+    def __init__(self, halt_reason, steps, accumulator, registers, cur_addr, error_message="", outputs=None):
+        self.halt_reason = halt_reason #One of HALTED, ERROR, END_OF_MEMORY, INPUT_NEEDED, STEP_LIMIT, INSTRUCTION_LIMIT, TIME_LIMIT or LOOP_DETECTED
+        self.steps = steps #Number of instructions executed by the run
+        self.accumulator = accumulator #Final accumulator as an integer
+        self.registers = registers #Final register values as a list of integers
+        self.cur_addr = cur_addr #Address the program stopped at
+        self.error_message = error_message #Error message if the program stopped with an error
+        self.outputs = outputs if outputs is not None else [] #Words written by WRITE (011) when no output callback is given
+
+    def to_dict(self):
+        '''Returns the result as a dictionary that can be written as JSON.'''
+        return {
+            "halt_reason": self.halt_reason,
+            "steps": self.steps,
+            "accumulator": self.accumulator,
+            "cur_addr": self.cur_addr,
+            "error_message": self.error_message,
+            "outputs": self.outputs,
+            "registers": self.registers,
+        }
+
 '''Simulator  Class'''
 class Simulator:
-    def __init__(self):
-        self.registers = {} #Initializes the registers
-        self.register_size = 249 #Saves the number of the last register
-        self.accumulator = "+000000" #Initializes the accumulator
+    def __init__(self, max_instructions=None, max_time=None, detect_loops=False, memory_size=MEMORY_SIZE, compile_blocks=False,
+                 fast_forward_loops=False):
+        if memory_size < 1 or memory_size > MAX_MEMORY_SIZE:
+            raise ValueError(f"The memory size must be between 1 and {MAX_MEMORY_SIZE} registers.")
+        self.registers = Registers(memory_size) #Initializes the registers
+        self.register_size = memory_size - 1 #Saves the number of the last register
+        self.word_max = 10 ** self.registers.word_digits - 1 #Largest value a register or the accumulator can hold
+        self.acc = 0 #Initializes the accumulator
         self.cur_addr = 0 #Initializes the current address
         self.console_memory = ""
         self.instructions = ["000", "010", "011", "020", "021", "030", "031", "032", "033", "040", "041", "042", "043"] #Lists all the valid instructions
         self.error_message = '' #Stores the last error message encountered
+        self.input_queue = deque() #Words read by READ (010) before the read_input callback is used
+        self.read_input = None #Called with the address on READ (010), returns the word to store or None if no input is available
+        self.write_output = None #Called with the address and the integer word on WRITE (011)
+        self.halt_reason = None #Set by the instructions that stop a headless run without an error
+        self.outputs = [] #Words written during the last headless run when there is no write_output callback
+        self.input_log = None #List receiving every word given to READ (010) while a run is recorded (see run_recording.py)
+        self.output_log = None #List receiving the (address, word) of every WRITE (011) while a run is recorded
+        #Execution limits of headless runs, they apply to the whole program even if the run is resumed.
+        self.max_instructions = max_instructions #Largest number of instructions the program may execute
+        self.max_time = max_time #Longest time in seconds the program may spend executing
+        self.detect_loops = detect_loops #Stops programs that return to the exact same state without reading input
+        self.compile_blocks = compile_blocks #Fast mode, runs compiled basic blocks instead of single instructions (see block_compiler.py)
+        self.fast_forward_loops = fast_forward_loops #Skips the iterations of counting loops at once (see loop_accelerator.py)
+        self.constants = None #Registers the block compiler may fold into the blocks (peephole stage), set by analyzer.optimize
+        self.executed = 0 #Instructions executed since the program was loaded
+        self.run_time = 0.0 #Seconds spent executing since the program was loaded
+        self.last_addr = 0 #Address of the last instruction executed by a headless run
+        self.initial_state = (0, 0) #Accumulator and current address of the last snapshot
+        self.reset_loop_detection()
+        #Maps each instruction code to the function that executes it during a headless run.
+        self.dispatch = {
+            0: self.skip,
+            10: self.read_operation,
+            11: self.write_operation,
+            20: self.load,
+            21: self.store,
+            30: self.add,
+            31: self.subtract,
+            32: self.divide,
+            33: self.multiply,
+            40: self.branch,
+            41: self.branch_neg,
+            42: self.branch_zero,
+            43: self.halt_operation,
+        }
+
+    @property
+    def accumulator(self):
+        '''Returns the accumulator as a signed 6 digit string.'''
+        return format_word(self.acc, self.registers.word_digits)
+
+    @accumulator.setter
+    def accumulator(self, word):
+        self.acc = int(word)
+
+    def load_program(self, words):
+        '''Resets the simulator and loads the words (strings, integers or an 'i' array/memoryview) into the registers starting at address 0.'''
+        if not isinstance(words, (array, memoryview)):
+            words = array('i', [int(word) for word in words])
+        if len(words) > len(self.registers):
+            raise ValueError(f"The program has {len(words)} words but there are only {len(self.registers)} registers.")
+        self.registers.clear()
+        self.registers.load(words)
+        self.acc = 0
+        self.cur_addr = 0
+        self.snapshot() #The loaded program is what restore goes back to
+        self.restart()
+
+    def snapshot(self):
+        '''Saves the registers, the accumulator and the current address so restore can go back to them.
+        Nothing is copied, each register keeps its snapshot word in the journal from its first write on.'''
+        self.registers.snapshot()
+        self.initial_state = (self.acc, self.cur_addr)
+
+    def restore(self):
+        '''Goes back to the last snapshot (the loaded program by default) in time proportional to the registers written.'''
+        self.registers.restore()
+        self.acc, self.cur_addr = self.initial_state
+        self.restart()
+
+    def restart(self):
+        '''Clears the console, the input queue and the execution counters before a new run.'''
+        self.console_memory = ""
+        self.input_queue.clear()
+        self.error_message = ""
+        self.halt_reason = None
+        self.executed = 0
+        self.run_time = 0.0
+        self.reset_loop_detection()
+
+    def load_source(self, source):
+        '''Reads a program with read_program and loads it, returns (True, []) or (False, errors) leaving the registers unchanged.'''
+        words, errors = read_program(source, len(self.registers))
+        if errors:
+            return (False, errors)
+        self.load_program(words)
+        return (True, [])
+
+    def invalid_address(self, addr):
+        '''Records the invalid address error message and returns False.'''
+        self.error_message = f"Invalid address: {addr}, the register address must be between 0 and {self.register_size}."
+        return False
+
+    def set_result(self, result):
+        '''Stores an arithmetic result in the accumulator, returns False if it overflows.'''
+        if result > self.word_max or result < -self.word_max: #Checks if the result is too large to be stored in the accumulator.
+            self.error_message = f"Overflow error: The result ({result}) contain more digits than it can be stored in the registers."
+            return False
+        self.acc = result
+        return True
 
-        for i in range(250): #Creates the registers using a dictionary
-            self.registers[i] = "+000000"
-            
     def read(self, addr):
         '''Reads a word from the keyboard into a specific location in memory.'''
-        if int(addr) > self.register_size: #Checks if the address is valid.
-            self.error_message = f"Invalid address: {addr}, the register address must be between 0 and 249."
-            return False
-        self.registers[int(addr)] = self.console_memory #Stores the formatted input into the desired register.
+        addr = int(addr)
+        if addr > self.register_size: #Checks if the address is valid.
+            return self.invalid_address(addr)
+        self.registers.write(addr, int(self.console_memory)) #Stores the formatted input into the desired register.
         return True
         
     def write(self, addr):
         '''Writes a word from a specific location in memory to screen.'''
-        if int(addr) > self.register_size: #Checks if the address is valid.
-            self.error_message = f"Invalid address: {addr}, the register address must be between 0 and 249."
-            return False
-        self.console_memory = self.registers[int(addr)] #Gets the word from the register.
+        addr = int(addr)
+        if addr > self.register_size: #Checks if the address is valid.
+            return self.invalid_address(addr)
+        self.console_memory = self.registers[addr] #Gets the word from the register.
         return True
         
     '''Load/store operations'''
     
     def load(self, addr):
         '''Loads a word from a specific location in memory into the accumulator.'''
-        if int(addr) > self.register_size: #Checks if the address is valid.
-            self.error_message = f"Invalid address: {addr}, the register address must be between 0 and 249."
-            return False
-        word = self.registers[int(addr)] #Gets the word from the register.
-        self.accumulator = word #Loads the word into the accumulator.
+        addr = int(addr)
+        if addr > self.register_size: #Checks if the address is valid.
+            return self.invalid_address(addr)
+        self.acc = self.registers.words[addr] #Loads the word into the accumulator.
         return True
 
     def store(self, addr):
         '''Stores a word from the accumulator into a specific location in memory.'''
-        if int(addr) > self.register_size: #Checks if the address is valid.
-            self.error_message = f"Invalid address: {addr}, the register address must be between 0 and 249."
-            return False
-        self.registers[int(addr)] = self.accumulator #Stores the word from the accumulator into the register.
+        addr = int(addr)
+        if addr > self.register_size: #Checks if the address is valid.
+            return self.invalid_address(addr)
+        self.registers.write(addr, self.acc) #Stores the word from the accumulator into the register.
         return True
     
     '''Arithmetic operations'''
     
     def add(self, addr):
         '''Adds a word from a specific location in memory to the word in the accumulator (leaves the result in the accumulator)'''
-        if int(addr) > self.register_size: #Checks if the address is valid.
-            self.error_message = f"Invalid address: {addr}, the register address must be between 0 and 249."
-            return False
-        result = int(self.accumulator) + int(self.registers[int(addr)]) #Adds the word from the register to the word in the accumulator.
-        if result > 999999 or result < -999999: #Checks if the result is too large to be stored in the accumulator.
-            self.error_message = f"Overflow error: The result ({result}) contain more digits than it can be stored in the registers."
-            return False
-        #The following elif and else statements format the result to be stored in the accumulator.
-        elif result > 0: 
-            self.accumulator = f"+{str(result).zfill(6)}" #This could be wrong because it might add two zeros to the beginning of the number
-        elif result == 0:
-            self.accumulator = "+000000"
-        else:
-            self.accumulator = f"{str(result).zfill(7)}" #changing this to be a 6, lets see what happens
-        return True
+        addr = int(addr)
+        if addr > self.register_size: #Checks if the address is valid.
+            return self.invalid_address(addr)
+        return self.set_result(self.acc + self.registers.words[addr])
 
     def subtract(self, addr):
         '''Subtracts a word from a specific location in memory from the word in the accumulator (leaves the result in the accumulator)'''
-        if int(addr) > self.register_size: #Checks if the address is valid.
-            self.error_message = f"Invalid address: {addr}, the register address must be between 0 and 249."
-            return False
-        result = int(self.accumulator) - int(self.registers[int(addr)]) #Subtracts the word from the register from the word in the accumulator.
-        if result > 999999 or result < -999999: #Checks if the result is too large to be stored in the accumulator.
-            self.error_message = f"Overflow error: The result ({result}) contain more digits than it can be stored in the registers."
-            return False
-        #The following elif and else statements format the result to be stored in the accumulator.
-        elif result > 0:
-            self.accumulator = f"+{str(result).zfill(6)}"#This could be wrong because it might add two zeros to the beginning of the number
-        elif result == 0:
-            self.accumulator = "+000000"
-        else:
-            self.accumulator = f"{str(result).zfill(7)}"#changing this to be a 6, lets see what happens
-        return True
+        addr = int(addr)
+        if addr > self.register_size: #Checks if the address is valid.
+            return self.invalid_address(addr)
+        return self.set_result(self.acc - self.registers.words[addr])
 
     def divide(self, addr):
         '''Divides the word in the accumulator by a word from a specific location in memory (leaves the result in the accumulator).'''
-        if int(addr) > self.register_size: #Checks if the address is valid.
-            self.error_message = f"Invalid address: {addr}, the register address must be between 0 and 249."
+        addr = int(addr)
+        if addr > self.register_size: #Checks if the address is valid.
+            return self.invalid_address(addr)
+        if self.registers.words[addr] == 0: #Stops the program instead of raising ZeroDivisionError
+            self.error_message = f"Division by zero: register {addr} holds 0, the accumulator can't be divided by it."
             return False
-        result = int(self.accumulator) // int(self.registers[int(addr)]) #Divides the word in the accumulator by the word from the register.
-        #NO DIVISION OPERATION SHOULD RESULT IN OVERFLOW, I'M STILL LEAVING THIS HERE IN CASE THERE IS ANY ABNORMALITY I DIDN'T PREDICT.
-        if result > 999999 or result < -999999: #Checks if the result is too large to be stored in the accumulator.
-            self.error_message = f"Overflow error: The result ({result}) contain more digits than it can be stored in the registers."
-            return False
-        #The following elif and else statements format the result to be stored in the accumulator.
-        elif result > 0:
-            self.accumulator = f"+{str(result).zfill(6)}"#This could be wrong because it might add two zeros to the beginning of the number
-        elif result == 0:
-            self.accumulator = "+000000"
-        else:
-            self.accumulator = f"{str(result).zfill(7)}"#changing this to be a 6, lets see what happens
-        return True
+        #NO DIVISION OPERATION SHOULD RESULT IN OVERFLOW, set_result STILL CHECKS IN CASE THERE IS ANY ABNORMALITY I DIDN'T PREDICT.
+        return self.set_result(self.acc // self.registers.words[addr])
 
     def multiply(self, addr):
         '''Multiplies a word from a specific location in memory to the word in the accumulator (leaves the result in the accumulator).'''
-        if int(addr) > self.register_size: #Checks if the address is valid.
-            self.error_message = f"Invalid address: {addr}, the register address must be between 0 and 249."
-            return False
-        result = int(self.accumulator) * int(self.registers[int(addr)]) #Multiplies the word in the accumulator by the word from the register.
-        if result > 999999 or result < -999999: #Checks if the result is too large to be stored in the accumulator.
-            self.error_message = f"Overflow error: The result ({result}) contain more digits than it can be stored in the registers."
-            return False
-        #The following elif and else statements format the result to be stored in the accumulator.
-        elif result > 0:
-            self.accumulator = f"+{str(result).zfill(6)}" #This could be wrong because it might add two zeros to the beginning of the number
-        elif result == 0:
-            self.accumulator = "+000000"
-        else:
-            self.accumulator = f"{str(result).zfill(7)}" #changing this to be a 6, lets see what happens
-        return True
+        addr = int(addr)
+        if addr > self.register_size: #Checks if the address is valid.
+            return self.invalid_address(addr)
+        return self.set_result(self.acc * self.registers.words[addr])
     
     '''Control operations'''
 
@@ -165,34 +553,243 @@ class Simulator:
         '''Branches to a specific location in memory.'''
         #Sets the current address to the address specified in the instruction.
         #It subtracts 1 from the desired address since the program moves to next location upon returning.
-        if int(addr) > self.register_size: #Checks if the address is valid.
-            self.error_message = f"Invalid address: {addr}, the register address must be between 0 and 249."
-            return False
-        self.cur_addr = int(addr) - 1
+        addr = int(addr)
+        if addr > self.register_size: #Checks if the address is valid.
+            return self.invalid_address(addr)
+        self.cur_addr = addr - 1
         return True
     
     def branch_neg(self, addr):
         '''Branches to a specific location in memory if the accumulator is negative.'''
         #Sets the current address to the address specified in the instruction if accumulator is negative.
         #It subtracts 1 from the desired address since the program moves to next location upon returning.
-        if int(addr) > self.register_size: #Checks if the address is valid.
-            self.error_message = f"Invalid address: {addr}, the register address must be between 0 and 249."
-            return False
-        if int(int(self.accumulator)) < 0:
-            self.cur_addr = int(addr) - 1
+        addr = int(addr)
+        if addr > self.register_size: #Checks if the address is valid.
+            return self.invalid_address(addr)
+        if self.acc < 0:
+            self.cur_addr = addr - 1
         return True
     
     def branch_zero(self, addr):
         '''Branches to a specific location in memory if the accumulator is zero.'''
         #Sets the current address to the address specified in the instruction if accumulator is "+000000".
         #It subtracts 1 from the desired address since the program moves to next location upon returning.
-        if int(addr) > self.register_size: #Checks if the address is valid.
-            self.error_message = f"Invalid address: {addr}, the register address must be between 0 and 249."
-            return False
-        if self.accumulator == "+000000":
-            self.cur_addr = int(addr) - 1
+        addr = int(addr)
+        if addr > self.register_size: #Checks if the address is valid.
+            return self.invalid_address(addr)
+        if self.acc == 0:
+            self.cur_addr = addr - 1
         return True
     
     def halt(self):
         '''Halts the program.'''
-        return False #Returns false to stop the program.
\ No newline at end of file
+        return False #Returns false to stop the program.
+
+    '''Headless execution'''
+
+    def skip(self, addr):
+        '''Skips empty registers.'''
+        return True
+
+    def halt_operation(self, addr):
+        '''Executes the HALT (043) instruction during a headless run.'''
+        self.halt_reason = HALTED
+        return self.halt()
+
+    def read_operation(self, addr):
+        '''Executes the READ (010) instruction with the next word of the input queue or from the read_input callback.'''
+        if addr > self.register_size: #Checks if the address is valid.
+            return self.invalid_address(addr)
+        if self.input_queue:
+            word = self.input_queue.popleft()
+        elif self.read_input is not None:
+            word = self.read_input(addr)
+        else:
+            word = None
+        if word is None: #No input available, execute yields and waits for the word to be sent.
+            self.halt_reason = INPUT_NEEDED
+            return False
+        return self.store_input(addr, word)
+
+    def store_input(self, addr, word):
+        '''Validates a word read from the input and stores it in the register.'''
+        if self.input_log is not None: #Invalid words are recorded too, replaying them stops the program the same way
+            self.input_log.append(str(word))
+        try:
+            value = int(word)
+        except ValueError: #If the input is not a number it's treated as out of range
+            value = self.word_max + 1
+        if value > self.word_max or value < -self.word_max:
+            self.error_message = f"Invalid input: {word} is not a valid positive or negative {self.registers.word_digits} digit number."
+            return False
+        self.registers.write(addr, value)
+        self.reset_loop_detection() #States seen before the input may lead somewhere else now
+        return True
+
+    def write_operation(self, addr):
+        '''Executes the WRITE (011) instruction by passing the word to the write_output callback.'''
+        if addr > self.register_size: #Checks if the address is valid.
+            return self.invalid_address(addr)
+        if self.output_log is not None:
+            self.output_log.append((addr, self.registers.words[addr]))
+        if self.write_output is None:
+            self.outputs.append(self.registers.words[addr])
+        else:
+            self.write_output(addr, self.registers.words[addr])
+        return True
+
+    def reset_loop_detection(self):
+        '''Forgets the states saved by the loop detection.'''
+        self.loop_state = None #State saved to be compared with the states reached by backward branches
+        self.loop_power = 1 #Backward branches allowed before the saved state is replaced
+        self.loop_count = 0 #Backward branches since the saved state was replaced
+
+    def loop_found(self):
+        '''Returns True if the current state was seen before since the last input.'''
+        #Brent's cycle detection: the state is compared with a single saved state that is replaced after
+        #1, 2, 4, 8... backward branches, so every cycle is found within twice its length using constant memory.
+        #Without READ instructions the next state only depends on these values, so a repeat can never halt.
+        state = (self.cur_addr, self.acc, self.registers.words.tobytes())
+        if state == self.loop_state:
+            return True
+        self.loop_count += 1
+        if self.loop_count == self.loop_power:
+            self.loop_state = state
+            self.loop_power *= 2
+            self.loop_count = 0
+        return False
+
+    def run(self, max_steps=None, read_input=None, write_output=None, inputs=None):
+        '''Executes the program from the current address without a GUI and returns a RunResult.
+        The inputs are added to the input queue, when the queue is empty READ asks the read_input callback.'''
+        if read_input is not None:
+            self.read_input = read_input
+        if write_output is not None:
+            self.write_output = write_output
+        if inputs is not None:
+            self.input_queue.extend(inputs)
+        engine = self.execute(max_steps)
+        try:
+            next(engine)
+            while True: #There is no input to send, so the run stops at the READ with the INPUT_NEEDED reason
+                engine.send(None)
+        except StopIteration as stop:
+            return stop.value
+
+    def execute(self, max_steps=None, max_seconds=None, copy_registers=True):
+        '''Generator that executes the program from the current address and returns a RunResult.
+        When a READ (010) has no input it yields (INPUT_NEEDED, address), send it the word to continue in place or
+        None to stop at the READ. max_steps and max_seconds limit this call only, it stops with STEP_LIMIT.
+        With copy_registers=False the result doesn't copy the registers (RunResult.registers is None), for callers that
+        run a program in slices and only need them at the end.'''
+        self.outputs = [] #Without a write_output callback the written words are collected in the result.
+        registers = self.registers
+        words = registers.words
+        decoded = registers.decoded #Instructions are only decoded again after their register is written
+        dispatch = self.dispatch
+        compiled = registers.compiled if self.compile_blocks else None
+        if compiled is not None:
+            from block_compiler import compile_block
+        fast_forward = self.fast_forward_loops
+        if fast_forward:
+            from loop_accelerator import fast_forward_loop
+        last_addr = self.register_size
+        detect_loops = self.detect_loops
+        self.error_message = ''
+        self.halt_reason = None
+        clock = time.perf_counter
+        start_time = clock()
+        #The limits are only checked when steps reaches next_check, which keeps the loop down to one comparison.
+        step_budget = max_steps if max_steps is not None else float("inf")
+        instruction_budget = self.max_instructions - self.executed if self.max_instructions is not None else float("inf")
+        deadline = start_time + self.max_time - self.run_time if self.max_time is not None else float("inf")
+        slice_deadline = start_time + max_seconds if max_seconds is not None else float("inf")
+        check_clock = self.max_time is not None or max_seconds is not None
+        next_check = 0
+        steps = 0
+        addr = self.cur_addr
+        reason = None
+        while reason is None:
+            if steps >= next_check:
+                if steps >= step_budget:
+                    reason = STEP_LIMIT
+                    break
+                if steps >= instruction_budget:
+                    self.error_message = f"Error: The program reached the limit of {self.max_instructions} instructions without halting."
+                    reason = INSTRUCTION_LIMIT
+                    break
+                if check_clock:
+                    now = clock()
+                    if now >= deadline:
+                        self.error_message = f"Error: The program reached the limit of {self.max_time} seconds without halting."
+                        reason = TIME_LIMIT
+                        break
+                    if now >= slice_deadline:
+                        reason = STEP_LIMIT
+                        break
+                next_check = min(step_budget, instruction_budget, steps + LIMIT_CHECK_INTERVAL if check_clock else float("inf"))
+            addr = self.cur_addr
+            if addr > last_addr or (addr == last_addr and words[addr] == 0):
+                self.error_message = "Error: Entire register was executed and program was not halted."
+                reason = END_OF_MEMORY
+                break
+            if compiled is not None:
+                block = compiled.get(addr, False)
+                if block is False:
+                    block = compile_block(self, addr)
+                if block is not None and steps + block.length <= next_check: #Blocks never skip a limit check
+                    ran, addr, reason = block.function()
+                    steps += ran
+                    if detect_loops and self.cur_addr <= addr and reason is None and self.loop_found():
+                        self.error_message = f"Error: The program is stuck in an infinite loop at address {addr}."
+                        reason = LOOP_DETECTED
+                    if fast_forward and self.cur_addr <= addr and reason is None:
+                        skipped = fast_forward_loop(self, self.cur_addr, min(step_budget, instruction_budget) - steps)
+                        if skipped: #The last instruction skipped is the branch that ends the iteration
+                            steps += skipped
+                            addr = self.last_addr
+                            if self.halt_reason == LOOP_DETECTED:
+                                reason = LOOP_DETECTED
+                    continue
+            instruction, operand = decoded[addr] or registers.decode(addr)
+            handler = dispatch.get(instruction)
+            if handler is None:
+                self.error_message = f"Instruction '{registers[addr]}' on address {addr} is invalid. Program was halted."
+                reason = ERROR
+                break
+            if not handler(operand):
+                reason = self.halt_reason or ERROR
+                if reason == INPUT_NEEDED: #Waits for the word without leaving the loop
+                    self.last_addr = addr
+                    wait_start = clock()
+                    word = yield (INPUT_NEEDED, operand)
+                    waited = clock() - wait_start #Time spent waiting for input doesn't count towards the limits
+                    start_time += waited
+                    deadline += waited
+                    slice_deadline += waited
+                    if word is None: #The READ is executed again once the program is resumed
+                        break
+                    self.halt_reason = reason = None
+                    if not self.store_input(operand, word):
+                        reason = ERROR
+            self.cur_addr += 1 #Moves to next address
+            steps += 1
+            if detect_loops and self.cur_addr <= addr and reason is None and self.loop_found(): #Only backward branches can repeat a state
+                self.error_message = f"Error: The program is stuck in an infinite loop at address {addr}."
+                reason = LOOP_DETECTED
+            if fast_forward and self.cur_addr <= addr and reason is None: #Backward branches start the loops
+                skipped = fast_forward_loop(self, self.cur_addr, min(step_budget, instruction_budget) - steps)
+                if skipped: #The last instruction skipped is the branch that ends the iteration
+                    steps += skipped
+                    addr = self.last_addr
+                    if self.halt_reason == LOOP_DETECTED: #Found in the skipped iterations
+                        reason = LOOP_DETECTED
+        self.last_addr = addr #Last address executed, or the one that stopped the program
+        self.executed += steps
+        self.run_time += clock() - start_time
+        return RunResult(reason, steps, self.acc, list(words) if copy_registers else None, self.cur_addr, self.error_message, self.outputs)
+
+if __name__ == "__main__":
+    import sys
+    from batch_runner import main
+    sys.exit(main())
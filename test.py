@@ -10,7 +10,27 @@ A few observations about the tests:
 - The "main" and "simulation_run" functions were not tested as they are part of the Terminal UI and they would be too complex to test.
 '''
 
-from simulator import Simulator
+import asyncio
+import base64
+import http.client
+import io
+import json
+import mmap
+import os
+import threading
+import time
+import pytest
+import batch_runner
+import benchmark
+import program_image
+import analyzer
+import execution_server
+from console_sink import ConsoleSink
+from result_cache import ResultCache, CachedRun, run_key
+from run_recording import Recording, replay_recording
+from async_engine import AsyncEngine
+from profiler import Profiler
+from simulator import Simulator, Registers, format_word, read_program
 
 '''INSTRUCTION FUNCTION TESTS'''
 '''TESTS FOR "read" INSTRUCTION FUNCTION'''
@@ -235,4 +255,802 @@ def test_branch_zero_stay():
 def test_halt_success():
     '''Tests if function returns False to terminate program'''
     temp = Simulator()
-    assert temp.halt() == False
\ No newline at end of file
+    assert temp.halt() == False
+
+'''REGISTER FILE TESTS'''
+
+def test_format_word():
+    '''Tests if integers are formatted as signed 6 digit words'''
+    assert format_word(0) == "+000000"
+    assert format_word(1234) == "+001234"
+    assert format_word(-5) == "-000005"
+
+def test_registers_store_integers():
+    '''Tests if the register file keeps integers and exposes strings'''
+    temp = Registers(250)
+    temp[3] = "-000042"
+    assert temp.words[3] == -42
+    assert temp[3] == "-000042"
+    assert len(temp) == 250
+    temp.clear()
+    assert temp[3] == "+000000"
+
+def test_accumulator_view():
+    '''Tests if the accumulator string view follows the integer accumulator'''
+    temp = Simulator()
+    temp.acc = -7
+    assert temp.accumulator == "-000007"
+    temp.accumulator = "+000123"
+    assert temp.acc == 123
+
+def test_decode_cache():
+    '''Tests if decoded instructions are cached and invalidated when the register is written'''
+    temp = Simulator()
+    temp.registers[5] = "-020007"
+    assert temp.registers.decode(5) == (20, 7)
+    assert temp.registers.decoded[5] == (20, 7)
+    temp.acc = 43000
+    temp.store(5)
+    assert temp.registers.decoded[5] is None
+    assert temp.registers.decode(5) == (43, 0)
+
+'''HEADLESS RUN TESTS'''
+
+def load_program(temp, program):
+    '''Loads a list of words into the simulator registers starting at address 0'''
+    for addr, word in enumerate(program):
+        temp.registers[addr] = word
+
+def test_run_halt():
+    '''Tests if a headless run reads, adds, writes and halts'''
+    temp = Simulator()
+    load_program(temp, ["+010010", "+010011", "+020010", "+030011", "+021012", "+011012", "+043000"])
+    inputs = iter(["+000004", "-000010"])
+    result = temp.run(read_input=lambda addr: next(inputs))
+    assert result.halt_reason == "halt"
+    assert result.steps == 7
+    assert result.accumulator == -6
+    assert result.outputs == [-6]
+    assert result.registers[12] == -6
+
+def test_run_input_needed_resumes():
+    '''Tests if a run without input stops at the READ instruction and resumes from it'''
+    temp = Simulator()
+    load_program(temp, ["+010010", "+011010", "+043000"])
+    result = temp.run()
+    assert result.halt_reason == "input"
+    assert result.cur_addr == 0
+    written = []
+    result = temp.run(read_input=lambda addr: 7, write_output=lambda addr, word: written.append((addr, word)))
+    assert result.halt_reason == "halt"
+    assert written == [(10, 7)]
+
+def test_run_step_limit():
+    '''Tests if an infinite loop stops at the step limit'''
+    temp = Simulator()
+    load_program(temp, ["+040000"])
+    result = temp.run(max_steps=100)
+    assert result.halt_reason == "step_limit"
+    assert result.steps == 100
+
+def test_run_errors():
+    '''Tests if invalid instructions, overflows and running off the end of memory are reported'''
+    temp = Simulator()
+    load_program(temp, ["+099000"])
+    assert temp.run().halt_reason == "error"
+    temp = Simulator()
+    load_program(temp, ["+020003", "+030003", "+043000", "+600000"])
+    result = temp.run()
+    assert result.halt_reason == "error"
+    assert "Overflow" in result.error_message
+    temp = Simulator()
+    assert temp.run().halt_reason == "end_of_memory"
+
+'''PROGRAM LOADING TESTS'''
+
+def test_read_program_converts_4_digit_words():
+    '''Tests if 4 digit words are converted, unsigned 6 digit words get a sign and the program ends at -99999'''
+    words, errors = read_program("1007\n+2008\n043000\n-1007\n-99999\n+000001")
+    assert errors == []
+    assert list(words) == [10007, 20008, 43000, -10007]
+
+def test_read_program_reports_every_error():
+    '''Tests if every invalid line is reported with its line number'''
+    words, errors = read_program("+010007\nabc\n+00001\n+043000")
+    assert errors == ["Error(line 2): abc in your input is not a valid instruction.",
+                      "Error(line 3): +00001 in your input is not a valid instruction."]
+    assert read_program("+000000\n" * 251)[1] == ["Error: Your input contain more than 250 instructions."]
+
+def test_read_program_sources(tmp_path):
+    '''Tests if programs are read the same from files, bytes and mmap'''
+    path = tmp_path / "program.txt"
+    path.write_bytes(b"+010007\r\n1008\r\n")
+    with open(path) as text_file:
+        assert list(read_program(text_file)[0]) == [10007, 10008]
+    assert list(read_program(path.read_bytes())[0]) == [10007, 10008]
+    with open(path, "rb") as binary_file, mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        assert list(read_program(mapped)[0]) == [10007, 10008]
+
+def test_load_source():
+    '''Tests if an invalid program leaves the registers unchanged'''
+    temp = Simulator()
+    assert temp.load_source("+010007\n+043000") == (True, [])
+    assert temp.registers[1] == "+043000"
+    assert temp.load_source("+010008\nbad")[0] == False
+    assert temp.registers[0] == "+010007"
+
+'''BATCH RUNNER TESTS'''
+
+def test_batch_runner(tmp_path, capsys):
+    '''Tests if the command line runner prints a JSON line for every file'''
+    good = tmp_path / "good.txt"
+    good.write_text("+010010\n+011010\n+043000\n")
+    bad = tmp_path / "bad.txt"
+    bad.write_text("hello")
+    assert batch_runner.main(["run", "--jobs", "1", "--input", "+000009", str(good), str(bad)]) == 1
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert lines[0]["halt_reason"] == "halt"
+    assert lines[0]["outputs"] == [9]
+    assert lines[1]["halt_reason"] == "load_error"
+
+def test_batch_runner_parallel(tmp_path):
+    '''Tests if results from the process pool come back in the same order as the files'''
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"program{i}.txt"
+        path.write_text(f"+020003\n+011003\n+043000\n+00000{i}")
+        paths.append(str(path))
+    results = list(batch_runner.run_files(paths, jobs=2))
+    assert [result["outputs"] for result in results] == [[0], [1], [2], [3]]
+
+def test_dirty_registers():
+    '''Tests if the register file tracks which registers were written'''
+    temp = Simulator()
+    temp.registers.take_dirty()
+    temp.acc = 5
+    temp.store(7)
+    temp.registers[3] = "+000001"
+    temp.console_memory = "+000002"
+    temp.read(7)
+    assert temp.registers.take_dirty() == [3, 7]
+    assert temp.registers.take_dirty() == []
+
+'''EXECUTION LIMIT TESTS'''
+
+def test_instruction_limit_across_resumes():
+    '''Tests if the instruction limit counts the instructions of every resumed run'''
+    temp = Simulator(max_instructions=150)
+    load_program(temp, ["+040000"])
+    assert temp.run(max_steps=100).halt_reason == "step_limit"
+    result = temp.run()
+    assert result.halt_reason == "instruction_limit"
+    assert result.steps == 50
+
+def test_time_limit():
+    '''Tests if a program that never halts is stopped by the time limit'''
+    temp = Simulator(max_time=0.05)
+    load_program(temp, ["+040000"])
+    assert temp.run().halt_reason == "time_limit"
+
+def test_loop_detection():
+    '''Tests if a loop that never changes the state is detected but a counting loop is not'''
+    temp = Simulator(detect_loops=True)
+    load_program(temp, ["+020010", "+040000"])
+    assert temp.run().halt_reason == "loop_detected"
+    temp = Simulator(detect_loops=True)
+    #Counts register 10 down from 500 to 0 then halts
+    load_program(temp, ["+020010", "+031011", "+021010", "+042005", "+040000", "+043000"])
+    temp.registers[10] = 500
+    temp.registers[11] = 1
+    assert temp.run().halt_reason == "halt"
+
+'''PROFILER TESTS'''
+
+def test_profiler_counts_and_trace(tmp_path):
+    '''Tests if the profiler counts addresses, instructions and branches and keeps the last trace records'''
+    temp = Simulator()
+    #Counts register 10 down from 3 to 0 then halts
+    load_program(temp, ["+020010", "+031011", "+021010", "+042005", "+040000", "+043000"])
+    temp.registers[10] = 3
+    temp.registers[11] = 1
+    profiler = Profiler(trace_size=4)
+    result = profiler.run(temp)
+    assert result.halt_reason == "halt"
+    assert profiler.steps == result.steps == 15
+    assert profiler.hot_addresses(1) == [(0, 3)]
+    assert profiler.opcode_counts[31] == 3
+    assert profiler.branches[3] == [1, 2]
+    assert profiler.branches[4] == [2, 0]
+    assert profiler.trace_records()[-1] == (14, 5, 43, 0, 0)
+    assert len(profiler.trace_records()) == 4
+    profiler.save_trace(tmp_path / "trace.bin")
+    assert (tmp_path / "trace.bin").stat().st_size == 4 * 5 * 8
+    assert temp.dispatch[31] == temp.subtract #The original dispatch table is restored
+
+'''BENCHMARK TESTS'''
+
+def test_benchmark_workloads_halt():
+    '''Tests if every benchmark workload halts and the comparison reports slowdowns'''
+    for name, program, runs in benchmark.core_workloads(0.01):
+        instructions, seconds = benchmark.run_core(program, 1)
+        assert instructions > 0
+    baseline = {"results": [{"engine": "core", "workload": "store_loop", "unit": "instructions", "per_second": 100.0}]}
+    current = {"results": [{"engine": "core", "workload": "store_loop", "unit": "instructions", "per_second": 80.0}]}
+    assert len(benchmark.compare(current, baseline, 0.1)) == 1
+    assert benchmark.compare(current, baseline, 0.25) == []
+
+'''RESUMABLE EXECUTION TESTS'''
+
+def test_execute_yields_for_input():
+    '''Tests if execute waits for input without leaving the loop and continues in place'''
+    temp = Simulator()
+    load_program(temp, ["+010010", "+010011", "+020010", "+030011", "+043000"])
+    engine = temp.execute()
+    assert next(engine) == ("input", 10)
+    assert engine.send("+000002") == ("input", 11)
+    try:
+        engine.send(5)
+    except StopIteration as stop:
+        result = stop.value
+    assert result.halt_reason == "halt"
+    assert result.accumulator == 7
+    assert result.steps == 5
+
+def test_run_input_queue():
+    '''Tests if queued inputs are read before the read_input callback is used'''
+    temp = Simulator()
+    load_program(temp, ["+010010", "+010011", "+010012", "+043000"])
+    result = temp.run(inputs=["+000001", "+000002"], read_input=lambda addr: addr)
+    assert result.halt_reason == "halt"
+    assert result.registers[10:13] == [1, 2, 12]
+
+'''PROGRAM IMAGE TESTS'''
+
+def test_program_image_round_trip(tmp_path):
+    '''Tests if a program converted to an image loads and converts back to the same text'''
+    text = "+020005\n+030006\n+021007\n+011007\n+043000\n+000010\n+000032"
+    (tmp_path / "program.txt").write_text(text)
+    assert program_image.text_to_image(str(tmp_path / "program.txt"), str(tmp_path / "program.bbx")) == (True, [])
+    temp = Simulator()
+    assert program_image.load_image(temp, str(tmp_path / "program.bbx")) == (True, [])
+    assert temp.run().outputs == [42]
+    assert program_image.image_to_text(str(tmp_path / "program.bbx"), str(tmp_path / "copy.txt")) == (True, [])
+    assert (tmp_path / "copy.txt").read_text() == text
+
+def test_program_image_state_and_errors(tmp_path):
+    '''Tests if images restore the initial state and corrupted images are rejected without changing the registers'''
+    program_image.save_image(str(tmp_path / "state.bbx"), [43000], accumulator=-5, cur_addr=0)
+    temp = Simulator()
+    assert program_image.load_image(temp, str(tmp_path / "state.bbx")) == (True, [])
+    assert temp.acc == -5
+    data = bytearray((tmp_path / "state.bbx").read_bytes())
+    data[-1] ^= 1
+    (tmp_path / "corrupt.bbx").write_bytes(data)
+    success, errors = program_image.load_image(temp, str(tmp_path / "corrupt.bbx"))
+    assert not success and "checksum" in errors[0]
+    program_image.save_image(str(tmp_path / "big.bbx"), [1] * 300)
+    assert not program_image.load_image(temp, str(tmp_path / "big.bbx"))[0]
+    for words, accumulator, cur_addr in (([43000, 1000000], None, None), ([43000], -1000000, None), ([43000], None, 250)):
+        success, errors = program_image.load_buffer(temp, program_image.image_bytes(words, accumulator, cur_addr))
+        assert not success and len(errors) == 1
+    assert temp.registers[0] == "+043000"
+    assert temp.acc == -5
+
+def test_batch_runner_image(tmp_path):
+    '''Tests if the batch runner converts programs and runs program images'''
+    (tmp_path / "program.txt").write_text("+010005\n+011005\n+043000")
+    assert batch_runner.main(["convert", str(tmp_path / "program.txt"), str(tmp_path / "program.bbx")]) == 0
+    result = batch_runner.run_file(str(tmp_path / "program.bbx"), inputs=["+000009"])
+    assert result["halt_reason"] == "halt"
+    assert result["outputs"] == [9]
+
+'''SNAPSHOT TESTS'''
+
+def test_restore_loaded_program():
+    '''Tests if restore brings back the loaded program after a run changed the registers'''
+    temp = Simulator()
+    temp.load_program(["+010010", "+020010", "+030011", "+021011", "+043000", "+000000", "+000000", "+000000", "+000000", "+000000", "+000000", "+000005"])
+    first = temp.run(inputs=["+000002"])
+    assert first.registers[10:12] == [2, 7]
+    temp.restore()
+    assert temp.registers.journal == {}
+    assert temp.registers[10] == "+000000"
+    assert temp.registers[11] == "+000005"
+    second = temp.run(inputs=["+000003"])
+    assert second.registers[10:12] == [3, 8]
+    assert second.steps == first.steps
+
+def test_restore_self_modifying_program():
+    '''Tests if instructions overwritten during a run are decoded again after restore'''
+    temp = Simulator()
+    temp.load_program(["+020005", "+021002", "+011006", "+043000", "+000000", "+043000", "+000007"])
+    assert temp.run().outputs == []
+    temp.restore()
+    temp.registers.patch(5, "+011006") #The edit is kept by the snapshot
+    assert temp.run().outputs == [7]
+    temp.restore()
+    assert temp.registers[2] == "+011006"
+    assert temp.registers[5] == "+011006"
+
+'''MEMORY SIZE TESTS'''
+
+def test_memory_size_address_width():
+    '''Tests if the word and address width follow the memory size'''
+    temp = Simulator(memory_size=5000)
+    assert temp.register_size == 4999
+    assert read_program("1007\n+1099", 5000) == (read_program("+0100007\n+0100099", 5000)[0], [])
+    assert temp.load_source("+0209999\n+0432000")[0]
+    assert temp.run().error_message == "Invalid address: 9999, the register address must be between 0 and 4999."
+    assert not temp.load_source("+020005")[0] #6 digit words don't fit a 4 digit address
+
+def test_paged_memory():
+    '''Tests if large memories only allocate the pages that are written and restore like small ones'''
+    temp = Simulator(memory_size=100000)
+    assert temp.load_source("+02099000\n+03099001\n+02199002\n+01199002\n+04300000")[0]
+    temp.registers.patch(99000, 40)
+    temp.registers.patch(99001, "+00000002")
+    result = temp.run()
+    assert result.outputs == [42]
+    assert temp.registers[99002] == "+00000042"
+    assert sorted(temp.registers.words.pages) == [0, 99000 // 4096]
+    temp.restore()
+    assert temp.registers.used() == [0, 1, 2, 3, 4, 99000, 99001]
+    temp.registers.clear()
+    assert temp.registers.words.pages == {}
+
+'''VECTOR ENGINE TESTS'''
+
+def test_divide_by_zero_error():
+    '''Tests if dividing by an empty register stops the program with an error'''
+    temp = Simulator()
+    temp.load_program(["+020005", "+032006", "+043000", "+000000", "+000000", "+000008"])
+    result = temp.run()
+    assert result.halt_reason == "error"
+    assert result.error_message.startswith("Division by zero")
+
+def test_vector_engine_matches_simulator():
+    '''Tests if every lane of the vector engine gets the same result as a Simulator run with the same inputs'''
+    pytest.importorskip("numpy")
+    from vector_engine import VectorSimulator
+    #Reads a count and a divisor, counts down writing the count divided by the divisor, then halts.
+    program = ["+010020", "+010021", "+020020", "+041011", "+032021", "+021022", "+011022", "+020020", "+031023",
+               "+021020", "+040002", "+043000", "+000000", "+000000", "+000000", "+000000", "+000000", "+000000",
+               "+000000", "+000000", "+000000", "+000000", "+000000", "+000001"]
+    input_sets = [[3, 1], [5, -2], [0, 7], [2, 0], [4], [], ["abc", 1], [999999, 1], [-1, 5]]
+    engine = VectorSimulator(len(input_sets), max_instructions=200)
+    engine.load_program(program)
+    for inputs, result in zip(input_sets, engine.run(input_sets)):
+        temp = Simulator(max_instructions=200)
+        temp.load_program(program)
+        assert result.to_dict() == temp.run(inputs=inputs).to_dict()
+
+def test_batch_runner_sweep(tmp_path):
+    '''Tests if the sweep command runs the program once per line of inputs'''
+    pytest.importorskip("numpy")
+    (tmp_path / "program.txt").write_text("+010010\n+020010\n+030010\n+021010\n+011010\n+043000")
+    (tmp_path / "inputs.txt").write_text("+000002\n-000004\n\n")
+    success, results = batch_runner.sweep(str(tmp_path / "program.txt"), str(tmp_path / "inputs.txt"))
+    assert success
+    assert [result["outputs"] for result in results] == [[4], [-8]]
+
+'''BLOCK COMPILER TESTS'''
+
+def test_compiled_blocks_match_interpreter():
+    '''Tests if fast mode gives the same results as the interpreter, including overflows and limits'''
+    programs = [
+        ["+020010", "+033010", "+021010", "+011010", "+040000", "+000000", "+000000", "+000000", "+000000", "+000000", "+000007"], #Overflows
+        ["+020010", "+031011", "+021010", "+041005", "+040000", "+011010", "+043000", "+000000", "+000000", "+000000", "+000100", "+000003"], #Counts down
+        ["+020005", "+032006", "+043000", "+000000", "+000000", "+000008"], #Divides by zero
+        ["+010010", "+020010", "+030010", "+021010", "+040001"], #Reads then loops until the limit
+        ["+020003", "+021002", "+043000", "+040000"], #Overwrites its own HALT with a branch
+    ]
+    for program in programs:
+        results = []
+        for compile_blocks in (False, True):
+            temp = Simulator(max_instructions=500, compile_blocks=compile_blocks)
+            temp.load_program(program)
+            results.append(temp.run(inputs=["+000002"]).to_dict())
+        assert results[0] == results[1]
+
+def test_compiled_block_invalidated_by_store():
+    '''Tests if writing into a compiled block forgets it and the new instruction is executed'''
+    temp = Simulator(compile_blocks=True)
+    temp.load_program(["+020010", "+030011", "+021010", "+041000", "+043000", "+000000", "+000000", "+000000", "+000000", "+000000", "-000003", "+000001"])
+    assert temp.run().accumulator == 0
+    assert 0 in temp.registers.compiled
+    temp.restore()
+    temp.registers.patch(1, "+031011") #Counts down instead of up
+    assert 0 not in temp.registers.compiled
+    result = temp.run(max_steps=20)
+    assert result.halt_reason == "step_limit"
+    assert result.accumulator == -8
+
+'''PROGRAM ANALYSIS TESTS'''
+
+def test_analysis_finds_invalid_instructions_and_addresses():
+    '''Tests if reachable invalid instructions and addresses are errors and the code and data are found'''
+    analysis = analyzer.analyze([int(word) for word in ["+020004", "+041003", "+099000", "+020300", "+043000"]])
+    assert analysis.errors == ["Error(address 002): Instruction '+099000' is invalid.",
+                               "Error(address 003): LOAD uses address 300, the register address must be between 0 and 249."]
+    assert analysis.code == {0, 1, 2, 3}
+    assert analysis.data == {4}
+    assert analysis.constants == {4}
+
+def test_analysis_rejects_endless_program():
+    '''Tests if a program that can never halt is an error and an unused word is a warning'''
+    analysis = analyzer.analyze([int(word) for word in ["+020005", "+021006", "+040000", "+043000", "+000000", "+000007"]])
+    assert analysis.errors == ["Error(address 000): The program can never halt, every path ends in a loop without a HALT."]
+    assert analysis.unused == [3]
+    temp = Simulator()
+    temp.load_program(["+020005", "+041003", "+040002", "+043000", "+000000", "-000001"])
+    analysis = analyzer.analyze(temp.registers.words, len(temp.registers))
+    assert analysis.errors == []
+    assert analysis.endless_loops == [2]
+
+def test_analysis_of_self_modifying_program():
+    '''Tests if the errors of a program that writes over its own instructions are only warnings'''
+    analysis = analyzer.analyze([int(word) for word in ["+020004", "+021002", "+000000", "+040000", "+043000"]])
+    assert analysis.self_modifying
+    assert analysis.errors == []
+    assert "Error" not in " ".join(analysis.warnings)
+    assert len(analysis.warnings) == 2
+
+def test_optimized_run_matches_interpreter():
+    '''Tests if the peephole stage gives the same results and forgets folded constants that are edited'''
+    program = ["+020010", "+031011", "+021010", "+020010", "+041006", "+040001", "+011010", "+043000", "+000000", "+000000", "+000100", "+000003"]
+    temp = Simulator()
+    temp.load_program(program)
+    expected = temp.run().to_dict()
+    temp = Simulator()
+    temp.load_program(program)
+    analysis = analyzer.optimize(temp)
+    assert analysis.constants == {11}
+    assert temp.run().to_dict() == expected
+    assert "words[11]" not in temp.registers.compiled[1].source
+    assert "LOAD skipped" in temp.registers.compiled[1].source
+    temp.restore()
+    temp.registers.patch(11, "+000100") #The folded constant changes, so the block is compiled again
+    assert temp.run().outputs == [-100]
+    #Writes over its own instruction, then stores into a register the analysis thinks is constant and reads it in the same block
+    program = ["+020022", "+041005", "+021003", "+040003", "+021021", "+030021", "+021023", "+011023", "+043000"] + ["+000000"] * 12 + ["+000007", "+000000"]
+    temp = Simulator()
+    temp.load_program(program)
+    expected = temp.run().to_dict()
+    assert expected["outputs"] == [0]
+    temp = Simulator()
+    temp.load_program(program)
+    analyzer.optimize(temp)
+    assert temp.run().to_dict() == expected
+    temp = Simulator(compile_blocks=True) #Folding stops at the STORE even if the register is a constant
+    temp.load_program(program)
+    temp.constants = frozenset({21})
+    assert temp.run().to_dict() == expected
+
+def test_batch_runner_check(tmp_path):
+    '''Tests if --check rejects programs with analysis errors and the check command reports them'''
+    (tmp_path / "loop.txt").write_text("+040000")
+    result = batch_runner.run_file(str(tmp_path / "loop.txt"), check=True)
+    assert result["halt_reason"] == batch_runner.LOAD_ERROR
+    assert batch_runner.check_file(str(tmp_path / "loop.txt"))["errors"] == result["errors"]
+    (tmp_path / "good.txt").write_text("+020003\n+011003\n+043000\n+000005")
+    assert batch_runner.run_file(str(tmp_path / "good.txt"), check=True, optimize=True)["outputs"] == [5]
+
+'''LOOP FAST-FORWARD TESTS'''
+
+def test_fast_forward_matches_stepping():
+    '''Tests if fast-forwarded loops give the same results as stepping, including overflows and limits'''
+    programs = [
+        (["+020010", "+031011", "+021010", "+021012", "+042006", "+040000", "+011012", "+043000", "+000000", "+000000", "+000900", "+000001"], None), #Counts down to 0
+        (["+020010", "+030011", "+041001", "+043000", "+000000", "+000000", "+000000", "+000000", "+000000", "+000000", "-000500", "+000003"], None), #Counts up
+        (["+020010", "+030011", "+021010", "+040000", "+000000", "+000000", "+000000", "+000000", "+000000", "+000000", "+990001", "+000007"], None), #Overflows
+        (["+020010", "+030011", "+021010", "+040000", "+000000", "+000000", "+000000", "+000000", "+000000", "+000000", "+000001", "+000007"], 1000), #Limit
+        (["+020010", "+033011", "+021010", "+041005", "+040000", "+043000", "+000000", "+000000", "+000000", "+000000", "-000001", "+000003"], None), #Multiplies
+    ]
+    for program, limit in programs:
+        results = []
+        for fast_forward_loops in (False, True):
+            temp = Simulator(max_instructions=limit, fast_forward_loops=fast_forward_loops)
+            temp.load_program(program)
+            results.append(temp.run().to_dict())
+        assert results[0] == results[1]
+    temp = Simulator(fast_forward_loops=True)
+    temp.load_program(programs[0][0])
+    result = temp.run(max_steps=100) #Limits of a single run are kept
+    assert result.halt_reason == "step_limit"
+    assert result.steps == 100
+
+def test_fast_forward_long_loop():
+    '''Tests if a long delay loop finishes at once with the same instruction count'''
+    temp = Simulator(fast_forward_loops=True)
+    temp.load_program(["+020010", "+031011", "+021010", "+042005", "+040000", "+043000", "+000000", "+000000", "+000000", "+000000", "+999999", "+000001"])
+    start = time.perf_counter()
+    result = temp.run()
+    assert time.perf_counter() - start < 0.1
+    assert result.halt_reason == "halt"
+    assert result.steps == 999998 * 5 + 5
+    assert temp.registers[10] == "+000000"
+    assert 0 in temp.registers.loops
+    temp.restore()
+    temp.registers.patch(1, "+030011") #Counts up instead, the loop is traced again and overflows
+    assert 0 not in temp.registers.loops
+    result = temp.run()
+    assert result.halt_reason == "error"
+    assert result.error_message.startswith("Overflow error")
+
+def test_fast_forward_detects_loops():
+    '''Tests if loops that never end are still detected when fast-forwarding, with the same results as stepping'''
+    programs = [
+        ["+040000"], #Branches to itself
+        ["+042000"], #BRANCHZERO with the accumulator at 0
+        ["+020020", "+021021", "+020021", "+031022", "+021021", "+042007", "+040002", "+040000"] + ["+000000"] * 12 + ["+000500", "+000000", "+000001"], #Counts down again and again
+        [42007, 40007, 30007, 31001, 42002, 42004, 41001, 31011, 21015, 33016, 41005, 40005, 12345, 999999, 100, -999999, 0], #The iteration returns to its head with a forward branch
+    ]
+    for program in programs:
+        results = []
+        for fast_forward_loops, compile_blocks in ((False, False), (True, False), (True, True)):
+            temp = Simulator(max_instructions=100000, detect_loops=True, fast_forward_loops=fast_forward_loops, compile_blocks=compile_blocks)
+            temp.load_program(program)
+            results.append((temp.run().to_dict(), temp.last_addr))
+        assert results[0][0]["halt_reason"] == "loop_detected"
+        assert results[0] == results[1] == results[2]
+
+'''CONSOLE SINK TESTS'''
+
+def test_console_sink_buffers_and_trims():
+    '''Tests if the console text is taken in one chunk, trimmed to the scrollback and copied to the tee'''
+    transcript = io.StringIO()
+    console = ConsoleSink(scrollback=10, tee=transcript)
+    temp = Simulator()
+    temp.load_program(["+020010", "+030011", "+021010", "+011010", "+041000", "+043000", "+000000", "+000000", "+000000", "+000000", "-000050", "+000001"])
+    temp.run(write_output=console.write_output)
+    assert console.pending_lines <= 20
+    text = console.take()
+    assert text.endswith("Value from register 010: +000000\n\n")
+    assert text.count("\n") <= 20
+    assert console.take() == ""
+    assert transcript.getvalue().count("Value from register") == 50
+    assert console.excess_lines(25) == 15
+
+def test_batch_runner_console(tmp_path):
+    '''Tests if --console adds the console transcript to the result'''
+    (tmp_path / "echo.txt").write_text("+010009\n+011009\n+043000")
+    result = batch_runner.run_file(str(tmp_path / "echo.txt"), inputs=["+000042"], console=True)
+    assert result["outputs"] == [42]
+    assert result["console"] == ("Value entered into memory register 009: +000042\n\nValue from register 009: +000042\n\n"
+                                 "-----------------------Program has halted----------------------\n\n")
+
+'''ASYNC ENGINE TESTS'''
+
+def test_async_engine_sessions():
+    '''Tests if many sessions waiting for input run concurrently in one event loop'''
+    async def session(number):
+        engine = AsyncEngine(slice_size=10)
+        engine.sim.load_program(["+010010", "+020010", "+030010", "+021010", "+011010", "+043000"])
+        task = asyncio.create_task(engine.run())
+        await asyncio.sleep(0) #Every session is waiting for its input before any word is sent
+        assert not task.done()
+        await engine.inputs.put(number)
+        assert await engine.outputs.get() == 2 * number
+        assert await engine.outputs.get() is None
+        return await task
+
+    async def main():
+        return await asyncio.gather(*(session(number) for number in range(1000)))
+    results = asyncio.run(main())
+    assert all(result.halt_reason == "halt" and result.outputs == [2 * number] for number, result in enumerate(results))
+
+def test_async_engine_slices_and_limits():
+    '''Tests if a long run yields between slices and stops the same way as a headless run'''
+    async def main():
+        engine = AsyncEngine(Simulator(max_instructions=5000), slice_size=100)
+        engine.sim.load_program(["+040000"])
+        ticks = 0
+        task = asyncio.create_task(engine.run())
+        while not task.done():
+            ticks += 1
+            await asyncio.sleep(0)
+        stopped = AsyncEngine(slice_size=100)
+        stopped.sim.load_program(["+010005", "+043000"])
+        waiting = asyncio.create_task(stopped.run())
+        await stopped.inputs.put(None) #Stops the run waiting for input
+        return ticks, await task, await waiting
+    ticks, result, waiting = asyncio.run(main())
+    assert ticks >= 50
+    assert result.halt_reason == "instruction_limit"
+    assert result.steps == 5000
+    assert result.registers == [40000] + [0] * 249
+    assert waiting.halt_reason == "input"
+    temp = Simulator()
+    temp.load_program(["+040000"])
+    assert temp.run(max_steps=10).registers[0] == 40000
+    execution = temp.execute(10, copy_registers=False) #Slices don't copy the registers
+    with pytest.raises(StopIteration) as stop:
+        next(execution)
+    assert stop.value.value.registers is None
+
+'''EXECUTION SERVER TESTS'''
+
+def test_run_job():
+    '''Tests if the worker runs programs given as words, text or images and reports load errors'''
+    image = base64.b64encode(program_image.image_bytes([10009, 11009, 43000])).decode()
+    for job in ({"program": ["+010009", "+011009", "+043000"]}, {"source": "+010009\n+011009\n+043000"}, {"image": image}):
+        result = execution_server.run_job({**job, "inputs": ["+000005"]})
+        assert result["halt_reason"] == "halt"
+        assert result["outputs"] == [5]
+        assert result["registers"][9] == 5
+    assert execution_server.run_job({"source": "hello"})["halt_reason"] == "load_error"
+    assert execution_server.run_job({"program": ["+043000"], "memory_size": 0})["halt_reason"] == "load_error"
+    assert execution_server.run_job({"program": ["+040000"], "max_steps": 50})["halt_reason"] == "instruction_limit"
+    for program in ([2 ** 40], ["+9999999"], [1.7], [True], ["12a"], "+043000"): #Checked like the text loader
+        assert execution_server.run_job({"program": program})["halt_reason"] == "load_error"
+    assert execution_server.run_job({"program": ["+043000"], "inputs": "abc"})["halt_reason"] == "load_error"
+    for memory_size in range(100, 120): #Only the last memory sizes keep their simulator
+        assert execution_server.run_job({"program": ["+043000"], "memory_size": memory_size})["halt_reason"] == "halt"
+    assert list(execution_server.simulators) == list(range(120 - execution_server.MAX_SIMULATORS, 120))
+    result = execution_server.run_job({"program": ["+040000"], "max_steps": 10 ** 9}, max_steps=1000) #Limited by the server
+    assert result["halt_reason"] == "instruction_limit"
+    assert result["steps"] == 1000
+
+def test_execution_server():
+    '''Tests if the server runs single programs and batches on its workers'''
+    server = execution_server.ExecutionServer(("127.0.0.1", 0), jobs=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+
+        def post(request):
+            connection.request("POST", "/run", json.dumps(request))
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        status, result = post({"program": ["+010009", "+011009", "+043000"], "inputs": [7]})
+        assert status == 200
+        assert result["outputs"] == [7]
+        status, batch = post({"batch": [{"program": ["+010009", "+011009", "+043000"], "inputs": [number]} for number in range(20)]})
+        assert [result["outputs"] for result in batch["results"]] == [[number] for number in range(20)]
+        assert post({"batch": 5})[0] == 400
+        connection.request("POST", "/run", "{not json")
+        response = connection.getresponse()
+        assert response.status == 400
+        response.read()
+        for length in ("abc", "-1"):
+            connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+            connection.putrequest("POST", "/run")
+            connection.putheader("Content-Length", length)
+            connection.endheaders()
+            response = connection.getresponse()
+            assert response.status == 400
+            response.read()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+'''RESULT CACHE TESTS'''
+
+def cached_run(sim, inputs=()):
+    '''Runs the loaded program and returns its result as a CachedRun'''
+    writes = []
+    result = sim.run(inputs=inputs, write_output=lambda addr, word: writes.append((addr, word)))
+    return CachedRun.from_result(result, writes, sim.last_addr)
+
+def test_result_cache_key():
+    '''Tests if the key changes with the registers, the inputs and the limits but not with the fast modes'''
+    program = ["+010009", "+020009", "+011009", "+043000"]
+    temp = Simulator()
+    temp.load_program(program)
+    key = run_key(temp, ["+000005"])
+    assert run_key(temp, ["+000005"]) == key
+    assert run_key(temp, ["+000006"]) != key
+    assert run_key(Simulator(compile_blocks=True, fast_forward_loops=True), []) == run_key(Simulator(), [])
+    assert run_key(Simulator(max_instructions=10), []) != run_key(Simulator(), [])
+    temp.registers.patch(9, "+000001")
+    assert run_key(temp, ["+000005"]) != key
+
+def test_result_cache_memory_lru():
+    '''Tests if the in-memory cache drops the least recently used result and skips runs stopped by a limit'''
+    cache = ResultCache(memory_entries=2)
+    temp = Simulator()
+    temp.load_program(["+043000"])
+    entry = cached_run(temp)
+    for key in ("a", "b", "c"):
+        assert cache.put(key, entry)
+        cache.get("a") #"a" stays the most recently used
+    assert cache.get("b") is None
+    assert cache.get("a") is entry and cache.get("c") is entry
+    assert not cache.put("d", CachedRun("time_limit", 10, 0, [], 0))
+    assert cache.get("d") is None
+
+def test_result_cache_disk(tmp_path):
+    '''Tests if results are read back from the directory by another cache and applied to a simulator'''
+    temp = Simulator()
+    temp.load_program(["+010009", "+020009", "+030009", "+021009", "+011009", "+043000"])
+    key = run_key(temp, ["+000021"])
+    ResultCache(str(tmp_path)).put(key, cached_run(temp, ["+000021"]))
+    other = Simulator()
+    other.load_program(["+010009", "+020009", "+030009", "+021009", "+011009", "+043000"])
+    entry = ResultCache(str(tmp_path)).get(run_key(other, ["+000021"]))
+    assert entry.outputs == [42] and entry.writes == [(9, 42)] and entry.steps == 6
+    entry.apply(other)
+    assert other.registers[9] == "+000042" and other.accumulator == "+000042" and other.last_addr == 5
+    other.restore() #The cached state is journaled like a run
+    assert other.registers[9] == "+000000"
+
+def test_result_cache_disk_eviction(tmp_path):
+    '''Tests if the least recently used result files are deleted once they take more than max_disk_size'''
+    temp = Simulator()
+    temp.load_program(["+043000"])
+    entry = cached_run(temp)
+    size = len(entry.to_bytes())
+    cache = ResultCache(str(tmp_path), memory_entries=0, max_disk_size=2 * size)
+    for number, key in enumerate(("a", "b", "c")):
+        cache.put(key, entry)
+        os.utime(tmp_path / f"{key}.run", (number, number)) #Written in order a, b, c
+    cache.put("d", entry)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["c.run", "d.run"]
+    assert cache.disk_size == 2 * size
+
+def test_batch_runner_cache(tmp_path):
+    '''Tests if --cache answers the second identical run from the cache with the same result'''
+    (tmp_path / "echo.txt").write_text("+010009\n+011009\n+043000")
+    cache = str(tmp_path / "cache")
+    first = batch_runner.run_file(str(tmp_path / "echo.txt"), inputs=["+000042"], cache=cache)
+    second = batch_runner.run_file(str(tmp_path / "echo.txt"), inputs=["+000042"], cache=cache)
+    third = batch_runner.run_file(str(tmp_path / "echo.txt"), inputs=["+000043"], cache=cache)
+    assert not first.pop("cached") and second.pop("cached") and not third["cached"]
+    assert first == second and first["outputs"] == [42]
+    assert third["outputs"] == [43]
+
+'''RUN RECORDING TESTS'''
+
+def test_recording_replay(tmp_path):
+    '''Tests if the words entered during an interactive run are recorded and replayed with the same outputs'''
+    temp = Simulator()
+    temp.load_program(["+010020", "+010021", "+020020", "+030021", "+021022", "+011022", "+043000"])
+    temp.read_input = lambda addr: "+000012" if addr == 21 else None #Words entered in advance
+    recording = Recording.start(temp)
+    execution = temp.execute()
+    assert next(execution) == ("input", 20)
+    with pytest.raises(StopIteration) as stop:
+        execution.send("+000030") #Word entered after the prompt
+    recording.finish(temp, stop.value.value)
+    assert temp.input_log is None and temp.output_log is None
+    assert recording.inputs == ["+000030", "+000012"] and recording.writes == [(22, 42)]
+    assert recording.halt_reason == "halt" and recording.steps == 7
+    recording.save(str(tmp_path / "session.json"))
+    loaded = Recording.load(str(tmp_path / "session.json"))
+    for compile_blocks in (False, True):
+        replay = replay_recording(loaded, compile_blocks=compile_blocks, fast_forward_loops=compile_blocks)
+        assert replay.verified and replay.writes == [(22, 42)] and replay.result.steps == 7
+
+def test_recording_replay_mismatch():
+    '''Tests if a replay reports different outputs and stops a program that no longer halts'''
+    temp = Simulator()
+    temp.load_program(["+010009", "+011009", "+043000"])
+    recording = Recording.start(temp)
+    recording.finish(temp, temp.run(inputs=["+000005"]))
+    recording.writes = [(9, 6)]
+    assert replay_recording(recording).mismatches == ["Output 1: expected +000006 from register 009, got +000005 from register 009."]
+    temp.load_program(["+010009", "+011009", "+040001"]) #Writes the word forever
+    changed = Recording.start(temp)
+    changed.inputs, changed.writes, changed.halt_reason, changed.steps = recording.inputs, [(9, 5)], "halt", 3
+    replay = replay_recording(changed)
+    assert replay.result.halt_reason == "instruction_limit" and replay.result.steps == 4
+    assert replay.mismatches[0] == "Output 2: the replay wrote +000005 from register 009, the recording has no more outputs."
+    assert replay.mismatches[1:] == ["The replay stopped with instruction_limit instead of halt.", "The replay executed 4 instructions instead of 3."]
+
+def test_batch_runner_replay(tmp_path, capsys):
+    '''Tests if the replay command prints the verification of every recording and fails on mismatches'''
+    temp = Simulator()
+    temp.load_program(["+010009", "+011009", "+043000"])
+    recording = Recording.start(temp)
+    recording.finish(temp, temp.run(inputs=["+000005"]))
+    recording.save(str(tmp_path / "good.json"))
+    assert batch_runner.main(["replay", str(tmp_path / "good.json")]) == 0
+    assert json.loads(capsys.readouterr().out)["verified"]
+    recording.inputs = ["+000007"]
+    recording.save(str(tmp_path / "bad.json"))
+    (tmp_path / "broken.json").write_text("{}")
+    assert batch_runner.main(["replay", str(tmp_path / "bad.json"), str(tmp_path / "broken.json")]) == 1
+    bad, broken = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert not bad["verified"] and bad["mismatches"] == ["Output 1: expected +000005 from register 009, got +000007 from register 009."]
+    assert broken["halt_reason"] == "load_error"
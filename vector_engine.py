@@ -0,0 +1,257 @@
+'''
+Project Blackbox - Vector Engine
+
+Runs one program against many sets of input words at once. Every lane has its own registers, accumulator,
+current address and input words, all of them stored as NumPy arrays, and the lanes execute the program in
+lockstep: each cycle executes one instruction on every running lane. Lanes at the same address (holding the
+same word) execute the instruction together with a single array operation, so branches that send lanes to
+different addresses only split them into more groups until they meet again.
+
+Every lane stops for the same reasons and with the same results as a Simulator run with the same input
+words (overflow, invalid addresses and instructions, halting, running out of input or memory, and the
+max_instructions limit), so the results are returned as the same RunResult objects.
+
+NumPy is an optional dependency only needed by this module (pip install numpy).
+
+Usage:
+
+from vector_engine import VectorSimulator
+engine = VectorSimulator(lanes=1000)
+engine.load_source(open("program.txt"))
+results = engine.run([[n, 2 * n] for n in range(1000)]) #READ inputs of each lane
+
+python -m simulator sweep program.txt input_sets.txt
+'''
+
+from simulator import (RunResult, MEMORY_SIZE, HALTED, ERROR, END_OF_MEMORY, INPUT_NEEDED, INSTRUCTION_LIMIT,
+                       address_digits, format_word, read_program)
+try:
+    import numpy as np
+except ImportError: #The rest of the simulator works without NumPy
+    np = None
+
+RUNNING = 0
+#Halt reason of each lane status code
+STATUS_REASONS = [None, HALTED, ERROR, END_OF_MEMORY, INPUT_NEEDED, INSTRUCTION_LIMIT]
+STATUS_CODES = {reason: code for code, reason in enumerate(STATUS_REASONS)}
+
+'''Vector Simulator Class'''
+class VectorSimulator:
+    '''Executes one program on many lanes in lockstep.'''
+    def __init__(self, lanes, memory_size=MEMORY_SIZE, max_instructions=None):
+        if np is None:
+            raise ImportError("The vector engine requires NumPy, install it with: pip install numpy")
+        self.lanes = lanes #Number of input sets executed together
+        self.register_size = memory_size - 1 #Number of the last register
+        self.address_base = 10 ** address_digits(memory_size) #The instruction code is the word divided by this number
+        self.word_digits = address_digits(memory_size) + 3
+        self.word_max = 10 ** self.word_digits - 1 #Largest value a register or the accumulator can hold
+        self.max_instructions = max_instructions #Largest number of instructions each lane may execute
+        self.program = np.zeros(memory_size, dtype=np.int64) #Registers every lane starts with
+        #Maps each instruction code to the function that executes it on a group of lanes.
+        self.dispatch = {
+            0: self.skip,
+            10: self.read,
+            11: self.write,
+            20: self.load,
+            21: self.store,
+            30: self.add,
+            31: self.subtract,
+            32: self.divide,
+            33: self.multiply,
+            40: self.branch,
+            41: self.branch_neg,
+            42: self.branch_zero,
+            43: self.halt,
+        }
+        self.reset([[] for _ in range(lanes)])
+
+    def load_program(self, words):
+        '''Sets the program every lane starts with, the words may be strings or integers.'''
+        if len(words) > len(self.program):
+            raise ValueError(f"The program has {len(words)} words but there are only {len(self.program)} registers.")
+        self.program[:] = 0
+        self.program[:len(words)] = [int(word) for word in words]
+
+    def load_source(self, source):
+        '''Reads a program with read_program and loads it, returns (True, []) or (False, errors).'''
+        words, errors = read_program(source, len(self.program))
+        if errors:
+            return (False, errors)
+        self.load_program(words)
+        return (True, [])
+
+    def reset(self, inputs):
+        '''Starts every lane at address 0 with the program and its list of input words.'''
+        if len(inputs) != self.lanes:
+            raise ValueError(f"Expected {self.lanes} input sets but got {len(inputs)}.")
+        self.registers = np.tile(self.program, (self.lanes, 1)) #One row of registers per lane
+        self.acc = np.zeros(self.lanes, dtype=np.int64)
+        self.cur_addr = np.zeros(self.lanes, dtype=np.int64)
+        self.steps = np.zeros(self.lanes, dtype=np.int64)
+        self.status = np.zeros(self.lanes, dtype=np.int8) #RUNNING or the STATUS_CODES of the halt reason
+        self.error_messages = [""] * self.lanes
+        self.output_chunks = [] #(lanes, words) of every WRITE, in execution order
+        #Input words as a matrix, invalid words are marked so READ stops the lane the same way store_input does.
+        self.inputs = [list(words) for words in inputs]
+        width = max((len(words) for words in self.inputs), default=0)
+        self.input_values = np.zeros((self.lanes, width), dtype=np.int64)
+        self.input_valid = np.zeros((self.lanes, width), dtype=bool)
+        self.input_count = np.array([len(words) for words in self.inputs], dtype=np.int64)
+        self.input_pos = np.zeros(self.lanes, dtype=np.int64)
+        for lane, words in enumerate(self.inputs):
+            for index, word in enumerate(words):
+                try:
+                    value = int(word)
+                except ValueError:
+                    continue
+                if -self.word_max <= value <= self.word_max:
+                    self.input_values[lane, index] = value
+                    self.input_valid[lane, index] = True
+
+    def stop(self, lanes, reason, message=""):
+        '''Stops the lanes with the halt reason and an error message (a string or one per lane).'''
+        self.status[lanes] = STATUS_CODES[reason]
+        for index, lane in enumerate(lanes.tolist()):
+            self.error_messages[lane] = message if isinstance(message, str) else message[index]
+
+    '''Instructions, each one receives the lanes executing it and the address, and returns the lanes that executed it.'''
+
+    def skip(self, lanes, addr):
+        return lanes
+
+    def halt(self, lanes, addr):
+        self.stop(lanes, HALTED)
+        return lanes
+
+    def read(self, lanes, addr):
+        position = self.input_pos[lanes]
+        available = position < self.input_count[lanes]
+        self.stop(lanes[~available], INPUT_NEEDED) #Lanes without input words stop at the READ
+        lanes = lanes[available]
+        position = position[available]
+        self.input_pos[lanes] += 1
+        valid = self.input_valid[lanes, position]
+        invalid = lanes[~valid]
+        self.stop(invalid, ERROR, [f"Invalid input: {self.inputs[lane][index]} is not a valid positive or negative {self.word_digits} digit number."
+                                   for lane, index in zip(invalid.tolist(), position[~valid].tolist())])
+        self.registers[lanes[valid], addr] = self.input_values[lanes[valid], position[valid]]
+        return lanes
+
+    def write(self, lanes, addr):
+        self.output_chunks.append((lanes, self.registers[lanes, addr]))
+        return lanes
+
+    def load(self, lanes, addr):
+        self.acc[lanes] = self.registers[lanes, addr]
+        return lanes
+
+    def store(self, lanes, addr):
+        self.registers[lanes, addr] = self.acc[lanes]
+        return lanes
+
+    def add(self, lanes, addr):
+        return self.set_result(lanes, self.acc[lanes] + self.registers[lanes, addr])
+
+    def subtract(self, lanes, addr):
+        return self.set_result(lanes, self.acc[lanes] - self.registers[lanes, addr])
+
+    def divide(self, lanes, addr):
+        divisor = self.registers[lanes, addr]
+        zero = divisor == 0
+        self.stop(lanes[zero], ERROR, f"Division by zero: register {addr} holds 0, the accumulator can't be divided by it.")
+        self.set_result(lanes[~zero], self.acc[lanes[~zero]] // divisor[~zero]) #NumPy floors like Python's //
+        return lanes
+
+    def multiply(self, lanes, addr):
+        return self.set_result(lanes, self.acc[lanes] * self.registers[lanes, addr])
+
+    def set_result(self, lanes, result):
+        '''Stores the results in the accumulators, lanes whose result overflows stop with an error.'''
+        overflow = (result > self.word_max) | (result < -self.word_max)
+        self.stop(lanes[overflow], ERROR, [f"Overflow error: The result ({value}) contain more digits than it can be stored in the registers."
+                                           for value in result[overflow].tolist()])
+        self.acc[lanes[~overflow]] = result[~overflow]
+        return lanes
+
+    def branch(self, lanes, addr):
+        self.cur_addr[lanes] = addr - 1 #The address is moved to the next one after every instruction
+        return lanes
+
+    def branch_neg(self, lanes, addr):
+        self.cur_addr[lanes[self.acc[lanes] < 0]] = addr - 1
+        return lanes
+
+    def branch_zero(self, lanes, addr):
+        self.cur_addr[lanes[self.acc[lanes] == 0]] = addr - 1
+        return lanes
+
+    '''Lockstep execution'''
+
+    def run(self, inputs=None):
+        '''Executes every lane until it stops, returns a RunResult per lane.
+        inputs is a list with the READ input words of each lane, as integers or strings.'''
+        if inputs is not None:
+            self.reset(inputs)
+        last_addr = self.register_size
+        while True:
+            lanes = np.flatnonzero(self.status == RUNNING)
+            if lanes.size == 0:
+                break
+            if self.max_instructions is not None:
+                limited = self.steps[lanes] >= self.max_instructions
+                if limited.any():
+                    self.stop(lanes[limited], INSTRUCTION_LIMIT,
+                              f"Error: The program reached the limit of {self.max_instructions} instructions without halting.")
+                    lanes = lanes[~limited]
+            addrs = self.cur_addr[lanes]
+            past_end = addrs > last_addr
+            words = self.registers[lanes, np.minimum(addrs, last_addr)]
+            end_of_memory = past_end | ((addrs == last_addr) & (words == 0))
+            if end_of_memory.any():
+                self.stop(lanes[end_of_memory], END_OF_MEMORY, "Error: Entire register was executed and program was not halted.")
+                lanes, addrs, words = lanes[~end_of_memory], addrs[~end_of_memory], words[~end_of_memory]
+            if lanes.size == 0:
+                continue
+            for group_lanes, addr, word in self.groups(lanes, addrs, words):
+                instruction, operand = abs(word) // self.address_base, abs(word) % self.address_base
+                handler = self.dispatch.get(instruction)
+                if handler is None:
+                    self.stop(group_lanes, ERROR, f"Instruction '{format_word(word, self.word_digits)}' on address {addr} is invalid. Program was halted.")
+                    continue
+                if instruction not in (0, 43) and operand > self.register_size: #Checks if the address is valid.
+                    self.stop(group_lanes, ERROR, f"Invalid address: {operand}, the register address must be between 0 and {self.register_size}.")
+                else:
+                    group_lanes = handler(group_lanes, operand)
+                self.cur_addr[group_lanes] += 1 #Moves to next address
+                self.steps[group_lanes] += 1
+        return self.results()
+
+    def groups(self, lanes, addrs, words):
+        '''Splits the lanes into groups at the same address holding the same word, returns (lanes, address, word) tuples.'''
+        if (addrs == addrs[0]).all(): #Lanes only diverge after a branch, so usually there is a single group
+            addr_groups = [(lanes, int(addrs[0]), words)]
+        else:
+            addr_groups = []
+            for addr in np.unique(addrs).tolist():
+                in_group = addrs == addr
+                addr_groups.append((lanes[in_group], addr, words[in_group]))
+        groups = []
+        for group_lanes, addr, group_words in addr_groups:
+            if (group_words == group_words[0]).all():
+                groups.append((group_lanes, addr, int(group_words[0])))
+            else: #The word only differs if some lanes wrote over the program
+                for word in np.unique(group_words).tolist():
+                    groups.append((group_lanes[group_words == word], addr, word))
+        return groups
+
+    def results(self):
+        '''Returns a RunResult for every lane.'''
+        outputs = [[] for _ in range(self.lanes)]
+        for lanes, words in self.output_chunks:
+            for lane, word in zip(lanes.tolist(), words.tolist()):
+                outputs[lane].append(word)
+        return [RunResult(STATUS_REASONS[status], steps, acc, registers, cur_addr, message, lane_outputs)
+                for status, steps, acc, registers, cur_addr, message, lane_outputs
+                in zip(self.status.tolist(), self.steps.tolist(), self.acc.tolist(), self.registers.tolist(),
+                       self.cur_addr.tolist(), self.error_messages, outputs)]